@@ -12,6 +12,8 @@ import time
 from detection import *
 import serial.tools.list_ports
 import logging
+import copy
+from streaming import *
 
 from gpiozero import LED   # activacion camara canon cada 28 minutos 
 import threading
@@ -51,9 +53,6 @@ LightPointArray = [LightPoint(name="ABCD", isVisible=False, x=0, y=0, age = 0) f
 all_light_points = []
 
 startTime = time.time()
-firstTimeNoted = False
-timeOffset = 0
-timeOffsetAverage = 0
 trackingEnabled = False
 
 app = Flask(__name__)
@@ -175,185 +174,160 @@ def udp_listener():
 
     while True:
         data, addr = sock.recvfrom(1024) 
-        # Decode the data with capsule
-        for byte in data:
-            capsule_instance.decode(byte)
+        # Decode the whole datagram with capsule
+        capsule_instance.decode(data)
 
 def sendSettingToTracker():
     global input_values, sock
-    # Send the target point to the teensy, the structure should be copied in a byte array then encoded then sent
-    packet_id = 0x10
-    # Pack the struct in a byte array
-
-    payload_data = struct.pack('iiiiiii', np.int32(input_values["idRadius"]), np.int32(input_values["lockRadius"]), np.int32(input_values["lightLifetime"]), np.int32(input_values["lightThreshold"]), np.int32(input_values["switchFrame"]), np.int32(input_values["exposureTime"]), np.int32(input_values["trackingEnabled"]))
-    packet_length = len(payload_data)
-    encoded_packet = capsule_instance.encode(packet_id, payload_data, packet_length)
-    encoded_packet = bytearray(encoded_packet)
-    sock.sendto(encoded_packet, (UDP_IP_TRACKER, UDP_PORT)) 
+    # Send the settings to the tracker (packet 0x10, see packets.SETTINGS)
+    SETTINGS.sendto(sock, (UDP_IP_TRACKER, UDP_PORT), int(input_values["idRadius"]), int(input_values["lockRadius"]), int(input_values["lightLifetime"]), int(input_values["lightThreshold"]), int(input_values["switchFrame"]), int(input_values["exposureTime"]), int(input_values["trackingEnabled"])) 
     print("Sent settings to tracker")
 
-def generate_frames():
-    global LightPointArray, input_values, camRes
-
-    while True:
-        # print("Generating frames")
-        # Get a frame with metadata
-        frame,sensorTimestamp = serverPlayerOne.wait_for_frame()
-           
-        top_left = (0, 0)   #375 ,150 
-        bottom_right = (frame.shape[1], frame.shape[0]) # 1550,925 
-        
-        # all_light_points = detect(frame, sensorTimestamp)
-        # # print(all_light_points)
-        
-        LightPointArray = [LightPoint(name="ABCD", isVisible=False, x=0, y=0, age=0) for _ in range(30)]
-
-        # Print only the first 3 light points with their name, position x and y only.
-        for i, (name, _, x, y, age, _, speed_x, speed_y, acceleration_x, acceleration_y) in enumerate(all_light_points[:30]):
-            # print("Point %d: (%s, %d, %d, %d, %d, %d, %d)" % (i + 1, name, x, y, speed_x, speed_y, acceleration_x, acceleration_y))
-            LightPointArray[i] = LightPoint(name, 1, x, y, age)
-
+# Last result drawn by the preview, only touched by the broadcaster thread
+previewResult = None
+
+def render_preview():
+    global LightPointArray, input_values, camRes, previewResult
+
+    # Detection already ran in tracking_loop, only draw here
+    result = serverPlayerOne.wait_for_result(previewResult, timeout=0.5)
+    if (result is None or result is previewResult):
+        return None
+    previewResult = result
+    frame = result.frame.copy()
+       
+    top_left = (0, 0)   #375 ,150 
+    bottom_right = (frame.shape[1], frame.shape[0]) # 1550,925 
+    
+    LightPointArray = [LightPoint(name="ABCD", isVisible=False, x=0, y=0, age=0) for _ in range(30)]
+
+    # Print only the first 3 light points with their name, position x and y only.
+    for i, (name, _, x, y, age, _, speed_x, speed_y, acceleration_x, acceleration_y) in enumerate(result.lightPoints[:30]):
+        # print("Point %d: (%s, %d, %d, %d, %d, %d, %d)" % (i + 1, name, x, y, speed_x, speed_y, acceleration_x, acceleration_y))
+        LightPointArray[i] = LightPoint(name, 1, x, y, age)
+
+    if (input_values["switchFrame"] == 0):
+        # Binary frame of the detection
+        b_frame = result.full_binary_frame()
+        cv2.circle(b_frame, (np.int16(camRes[0]/2),np.int16(camRes[1]/2)), input_values["lockRadius"], 255, 2)
+        for point in LightPointArray:
+            center = (round(point.x), round(point.y))
+            cv2.circle(b_frame, center, 5, 255, -1)
+            cv2.rectangle(b_frame, top_left, bottom_right, 255, 2)
+            cv2.putText(b_frame, point.name, center, cv2.FONT_HERSHEY_SIMPLEX, 1, 255, 2, cv2.LINE_AA)
+        return b_frame
+    else:
+        cv2.circle(frame, (np.int16(camRes[0]/2),np.int16(camRes[1]/2)), input_values["lockRadius"], (0, 0, 255), 2)
+        for point in LightPointArray:
+            center = (round(point.x), round(point.y))
+            cv2.circle(frame, center, 5, (0, 0, 255), -1)
+            cv2.rectangle(frame, top_left, bottom_right, (0, 0, 255), 2)
+            cv2.putText(frame, point.name, center, cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2, cv2.LINE_AA)
+        return frame
 
-        gray_frame = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
-        _dummy, b_frame = cv2.threshold(gray_frame,np.int32(input_values["lightThreshold"]), 255, cv2.THRESH_BINARY)
+def stop_preview():
+    global previewResult
+    previewResult = None
 
-        
-        # Encode the frame
-        if (input_values["switchFrame"] == 0):
-            cv2.circle(b_frame, (np.int16(camRes[0]/2),np.int16(camRes[1]/2)), input_values["lockRadius"], 255, 2)
-            for point in LightPointArray:
-                cv2.circle(b_frame, (point.x, point.y), 5, 255, -1)
-                cv2.rectangle(b_frame, top_left, bottom_right, 255, 2)
-                cv2.putText(b_frame, point.name, (point.x, point.y), cv2.FONT_HERSHEY_SIMPLEX, 1, 255, 2, cv2.LINE_AA)
-            _, buffer = cv2.imencode('.jpg', b_frame)
-            b_frame = buffer.tobytes()
-            yield (b'--frame\r\n'
-               b'Content-Type: image/jpeg\r\n\r\n' + b_frame + b'\r\n')
-        else:
-            cv2.circle(frame, (np.int16(camRes[0]/2),np.int16(camRes[1]/2)), input_values["lockRadius"], (0, 0, 255), 2)
-            for point in LightPointArray:
-                cv2.circle(frame, (point.x, point.y), 5, (0, 0, 255), -1)
-                cv2.rectangle(frame, top_left, bottom_right, (0, 0, 255), 2)
-                cv2.putText(frame, point.name, (point.x, point.y), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2, cv2.LINE_AA)
-            _, buffer = cv2.imencode('.jpg', frame)
-            b_frame = buffer.tobytes() 
-            yield (b'--frame\r\n'
-               b'Content-Type: image/jpeg\r\n\r\n' + b_frame + b'\r\n')
+# Preview is encoded once for all /video_feed clients (95 is OpenCV's default quality)
+broadcaster = JpegBroadcaster(render_preview, maxFps=15, quality=95, onIdle=stop_preview)
 
 
 def tracking_loop():
-    global LightPointArray, all_light_points, input_value, xPos, yPos, img_width, img_height, startTime, firstTimeNoted, timeOffset, timeOffsetAverage, trackingEnabled, joystickX, joystickY, joystickBtn, swUp, swDown, swLeft, swRight, offsetS1, offsetS2, calibrationMode
+    global LightPointArray, all_light_points, input_value, xPos, yPos, img_width, img_height, startTime, trackingEnabled, joystickX, joystickY, joystickBtn, swUp, swDown, swLeft, swRight, offsetS1, offsetS2, calibrationMode
 
     frame = None
     
     while True:
 
-        if (not firstTimeNoted):
-            frame,sensorTimeStamp = serverPlayerOne.wait_for_frame(frame)
-            firstTimeNoted = True
-            print("First frame received")
-
-            numberOfFrames = 0
-
-            while (numberOfFrames < 100):
-                frame, sensorTimeStamp = serverPlayerOne.wait_for_frame(frame)
-                print(np.int64((time.time()-startTime)*1e9), sensorTimeStamp)
-                timeOffset += (np.int64((time.time()-startTime)*1e9) - sensorTimeStamp)
-                numberOfFrames += 1
-
-            timeOffset /= numberOfFrames
-            timeOffsetAverage = np.int64(timeOffset)
-            print("Time offset calculated")
-            print(timeOffsetAverage)
-
-        else:            
-            frame,sensorTimeStamp = serverPlayerOne.wait_for_frame(frame)
-                        
-            # Define the rectangle coordinates
-            top_left = (375, 150)
-            bottom_right = (1550, 925)
+        frame,sensorTimeStamp = serverPlayerOne.wait_for_frame(frame)
+                    
+        # Define the rectangle coordinates
+        top_left = (375, 150)
+        bottom_right = (1550, 925)
 
-            # Create a mask with the same dimensions as the frame, initially all black
-            mask = np.zeros_like(frame)
+        # Create a mask with the same dimensions as the frame, initially all black
+        mask = np.zeros_like(frame)
 
-            # Draw a filled white rectangle on the mask
-            cv2.rectangle(mask, top_left, bottom_right, (255, 255, 255), -1)
+        # Draw a filled white rectangle on the mask
+        cv2.rectangle(mask, top_left, bottom_right, (255, 255, 255), -1)
 
-            # Apply the mask to the original image using bitwise operations
-            result = cv2.bitwise_and(frame, mask)  
+        # Apply the mask to the original image using bitwise operations
+        result = cv2.bitwise_and(frame, mask)  
+        
+        frame = result   
+                                      
+        all_light_points = detect(frame, sensorTimeStamp)
+        # print(all_light_points)
+                    
+        # If all light points is not null, then continue
+        if (all_light_points is not None):
+            pointToSend = getLockedPoint(all_light_points, camRes, joystickBtn, swUp, swDown, swLeft, swRight)
+            serverPlayerOne.publish_result(make_detection_result(frame, all_light_points, copy.copy(pointToSend), sensorTimeStamp))
+            # print(pointToSend.name, pointToSend.x, pointToSend.y)
+
+            if (not getTrackingEnabled()):
+                # print("Tracking disabled")
+                pointToSend.isVisible = False
+            # else:
+                # print("Tracking enabled")
             
-            frame = result   
-                                          
-            all_light_points = detect(frame, sensorTimeStamp)
-            # print(all_light_points)
-                        
-            # If all light points is not null, then continue
-            if (all_light_points is not None):
-                pointToSend = getLockedPoint(all_light_points, camRes, joystickBtn, swUp, swDown, swLeft, swRight)
-                # print(pointToSend.name, pointToSend.x, pointToSend.y)
-
-                if (not getTrackingEnabled()):
-                    # print("Tracking disabled")
-                    pointToSend.isVisible = False
-                # else:
-                    # print("Tracking enabled")
+            if (calibrationMode) :
+                col1, col2, newPacket = getPositionFromColimator()
+                if (newPacket):
+                    print(col1,col2,pointToSend.x,pointToSend.y)
+            else:
+                # Parse text coming from the teensy via serial
+                pointToSend.age = np.int32((time.monotonic_ns() - sensorTimeStamp)/1e6)
                 
-                if (calibrationMode) :
-                    col1, col2, newPacket = getPositionFromColimator()
-                    if (newPacket):
-                        print(col1,col2,pointToSend.x,pointToSend.y)
-                else:
-                    # Parse text coming from the teensy via serial
-                    pointToSend.age = np.int32((((time.time()-startTime)*1e9)-(sensorTimeStamp+timeOffsetAverage))/1e6)
-                    
-                    # print(pointToSend.name, pointToSend.x, pointToSend.y, pointToSend.age, pointToSend.isVisible)
-                    
-                    pointToSendColimator = LightPoint(pointToSend.name, pointToSend.isVisible, pointToSend.x, pointToSend.y, pointToSend.age)
-                    
-                    pointToSendColimator.x = pointToSendColimator.x+offsetS1
-                    pointToSendColimator.y = pointToSendColimator.y+offsetS2
-                    
-                    # print(offsetS1,offsetS2)                
-                    sendTargetToColimator(pointToSendColimator) 
-                    # if (newPacket):
-                    #     print(col1, col2, pointToSend.x, pointToSend.y)
-                    
-                    offsetX = 0
-                    offsetY = 0
-                    
-                    # Draw a circle with offsetX and Y following a sin and cos of time with a frequency of 0.05Hz and amplitude of 200 pixels
-                    # offsetX = np.int32(250*np.cos(2*np.pi*0.03*(time.time()-startTime)))
-                    # offsetY = np.int32(250*np.sin(2*np.pi*0.03*(time.time()-startTime)))
-                    
-                    pointToSend.y = -pointToSend.y
-                    
-                    pointToSend.x = pointToSend.x+offsetX
-                    pointToSend.y = pointToSend.y+offsetY
-                                
-                    # sendTargetToTeensy(pointToSend, 33, 0.05, 2)
-
-                if (newPacketReceived()):
-                    packetType = newPacketReceivedType()
-                    if (packetType == "controller"):
-                        joystickX, joystickY, joystickBtn, swUp, swDown, swLeft, swRight = returnLastPacketData(packetType)
-                        # print(joystickX, joystickY, joystickBtn, swUp, swDown, swLeft, swRight)
-                        getLockedPoint(all_light_points, camRes, joystickBtn, swUp, swDown, swLeft, swRight)
-                    elif (packetType == "pointList"):
-                        LightPointArray = returnLastPacketData(packetType)
-                    elif (packetType == "cameraSettings"):
-                        cameraSetting = returnLastPacketData(packetType)
-                        # setCameraSettings(cameraSetting["gain"], cameraSetting["exposureTime"])
-                        print("Applied camera settings")
-                        # setDetectionSettings(cameraSetting["idRadius"], cameraSetting["lockRadius"], cameraSetting["lightLifetime"], cameraSetting["lightThreshold"])
-                        # print(cameraSetting["trackingEnabled"])
-                        # if (not cameraSetting["trackingEnabled"]):
-                        #     trackingEnabled = False
-                        # else:
-                        #     trackingEnabled = True
-                    # elif (packetType == "dataFromTracker"):
-                    #     # Print the position of tracker and pointToSendX, pointToSendY
-                    #     trackerAzm, trackerElv = returnLastPacketData(packetType)
-                    #     print(trackerAzm, trackerElv, pointToSend.x, pointToSend.y)
+                # print(pointToSend.name, pointToSend.x, pointToSend.y, pointToSend.age, pointToSend.isVisible)
+                
+                pointToSendColimator = LightPoint(pointToSend.name, pointToSend.isVisible, pointToSend.x, pointToSend.y, pointToSend.age)
+                
+                pointToSendColimator.x = pointToSendColimator.x+offsetS1
+                pointToSendColimator.y = pointToSendColimator.y+offsetS2
+                
+                # print(offsetS1,offsetS2)                
+                sendTargetToColimator(pointToSendColimator) 
+                # if (newPacket):
+                #     print(col1, col2, pointToSend.x, pointToSend.y)
+                
+                offsetX = 0
+                offsetY = 0
+                
+                # Draw a circle with offsetX and Y following a sin and cos of time with a frequency of 0.05Hz and amplitude of 200 pixels
+                # offsetX = np.int32(250*np.cos(2*np.pi*0.03*(time.time()-startTime)))
+                # offsetY = np.int32(250*np.sin(2*np.pi*0.03*(time.time()-startTime)))
+                
+                pointToSend.y = -pointToSend.y
+                
+                pointToSend.x = pointToSend.x+offsetX
+                pointToSend.y = pointToSend.y+offsetY
+                            
+                # sendTargetToTeensy(pointToSend, 33, 0.05, 2)
+
+            if (newPacketReceived()):
+                packetType = newPacketReceivedType()
+                if (packetType == "controller"):
+                    joystickX, joystickY, joystickBtn, swUp, swDown, swLeft, swRight = returnLastPacketData(packetType)
+                    # print(joystickX, joystickY, joystickBtn, swUp, swDown, swLeft, swRight)
+                    getLockedPoint(all_light_points, camRes, joystickBtn, swUp, swDown, swLeft, swRight)
+                elif (packetType == "pointList"):
+                    LightPointArray = returnLastPacketData(packetType)
+                elif (packetType == "cameraSettings"):
+                    cameraSetting = returnLastPacketData(packetType)
+                    # setCameraSettings(cameraSetting["gain"], cameraSetting["exposureTime"])
+                    print("Applied camera settings")
+                    # setDetectionSettings(cameraSetting["idRadius"], cameraSetting["lockRadius"], cameraSetting["lightLifetime"], cameraSetting["lightThreshold"])
+                    # print(cameraSetting["trackingEnabled"])
+                    # if (not cameraSetting["trackingEnabled"]):
+                    #     trackingEnabled = False
+                    # else:
+                    #     trackingEnabled = True
+                # elif (packetType == "dataFromTracker"):
+                #     # Print the position of tracker and pointToSendX, pointToSendY
+                #     trackerAzm, trackerElv = returnLastPacketData(packetType)
+                #     print(trackerAzm, trackerElv, pointToSend.x, pointToSend.y)
 
 @app.route('/send_udp', methods=['POST'])
 def send_udp():
@@ -396,8 +370,11 @@ def send_focus():
 @app.route('/video_feed')
 def video_feed():
     print("Video feed requested")
-    return Response(generate_frames(),
-                    mimetype='multipart/x-mixed-replace; boundary=frame')
+    return Response(broadcaster.stream(*preview_options(request.args)), mimetype=MJPEG_MIMETYPE)
+
+@app.route('/preview_stats')
+def preview_stats():
+    return jsonify(broadcaster.stats())
 
 @app.route('/')
 def index():
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Lectura incremental de aircraft.json (dump1090/readsb) para adsb_to_rot_webui.
+
+- HTTP: una conexión keep-alive reutilizada, con If-None-Match / If-Modified-Since;
+  un 304 no se descarga ni se parsea.
+- Fichero local: sólo se relee si cambia el mtime/tamaño.
+- orjson si está instalado (bastante más rápido que json con mucho tráfico).
+- update() devuelve sólo los aviones con una posición nueva (seen_pos cambió) y los que
+  desaparecieron, así el resto del pipeline trabaja sobre el delta y no sobre toda la lista.
+"""
+import http.client, json, os, time
+from urllib.parse import urlsplit
+from adsb_stream import AircraftStream
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def open_feed(src):
+    """AircraftStream para sbs:// y beast:// (streaming), AircraftFeed para aircraft.json."""
+    if src.startswith(("sbs://", "beast://")):
+        return AircraftStream(src)
+    return AircraftFeed(src)
+
+def parse_json(raw):
+    return orjson.loads(raw) if orjson is not None else json.loads(raw)
+
+class AircraftFeed:
+    def __init__(self, src, timeout=0.8):
+        self.src = src
+        self.timeout = timeout
+        self.url = urlsplit(src) if src.startswith(("http://", "https://")) else None
+        self.conn = None
+        self.etag = None
+        self.lastModified = None
+        self.fileStamp = None
+        # hex -> aircraft (dict de aircraft.json) y clave de su última posición
+        self.aircraft = {}
+        self.posKey = {}
+        # Métricas
+        self.fetches = 0
+        self.notModified = 0
+        self.parsed = 0
+        self.changed = 0
+        self.parseMs = 0.0
+
+    # --- Descarga condicional ---
+    def _connect(self):
+        cls = http.client.HTTPSConnection if self.url.scheme == "https" else http.client.HTTPConnection
+        self.conn = cls(self.url.hostname, self.url.port, timeout=self.timeout)
+
+    def _fetch_http(self):
+        path = self.url.path or "/"
+        if self.url.query:
+            path += "?" + self.url.query
+        headers = {"Accept-Encoding": "identity"}
+        if self.etag: headers["If-None-Match"] = self.etag
+        if self.lastModified: headers["If-Modified-Since"] = self.lastModified
+        for attempt in range(2):
+            if self.conn is None:
+                self._connect()
+            try:
+                self.conn.request("GET", path, headers=headers)
+                r = self.conn.getresponse()
+                body = r.read()   # leer siempre entero para poder reutilizar la conexión
+            except (OSError, http.client.HTTPException):
+                # El servidor cerró la conexión keep-alive: reabrir y reintentar una vez
+                self.conn.close()
+                self.conn = None
+                if attempt:
+                    raise
+                continue
+            if r.getheader("Connection", "").lower() == "close":
+                self.conn.close()
+                self.conn = None
+            if r.status == 304:
+                return None
+            if r.status != 200:
+                raise http.client.HTTPException(f"{self.src}: HTTP {r.status}")
+            self.etag = r.getheader("ETag")
+            self.lastModified = r.getheader("Last-Modified")
+            return body
+
+    def _fetch_file(self):
+        st = os.stat(self.src)
+        stamp = (st.st_mtime_ns, st.st_size)
+        if stamp == self.fileStamp:
+            return None
+        with open(self.src, "rb") as f:
+            body = f.read()
+        self.fileStamp = stamp
+        return body
+
+    def fetch(self):
+        """aircraft.json parseado, o None si no cambió desde la última vez."""
+        self.fetches += 1
+        body = self._fetch_http() if self.url is not None else self._fetch_file()
+        if body is None:
+            self.notModified += 1
+            return None
+        start = time.perf_counter()
+        data = parse_json(body)
+        self.parseMs = (time.perf_counter() - start)*1000
+        self.parsed += 1
+        return data
+
+    # --- Delta ---
+    def update(self):
+        """
+        (cambiados, desaparecidos): aviones con una posición nueva desde la
+        última llamada (con "_pos_ts", hora local de esa posición) y hex que
+        ya no están en el json. ([], []) si el json no cambió.
+        """
+        data = self.fetch()
+        if data is None:
+            return [], []
+        received = time.time()
+        feedNow = data.get("now") if isinstance(data, dict) else None
+        raw = data.get("aircraft", []) if isinstance(data, dict) else []
+        changed, present = [], set()
+        for ac in raw:
+            hexid = ac.get("hex", "")
+            present.add(hexid)
+            if "lat" not in ac or "lon" not in ac:
+                continue
+            seen = ac.get("seen_pos", ac.get("seen"))
+            # Hora de la posición en el reloj de dump1090 si la hay, si no la posición misma
+            key = round(feedNow - seen, 2) if (feedNow is not None and seen is not None) else (ac["lat"], ac["lon"])
+            if self.posKey.get(hexid) == key:
+                continue
+            self.posKey[hexid] = key
+            ac["_pos_ts"] = received - (seen or 0.0)
+            self.aircraft[hexid] = ac
+            changed.append(ac)
+        removed = [hexid for hexid in self.aircraft if hexid not in present]
+        for hexid in removed:
+            del self.aircraft[hexid]
+            self.posKey.pop(hexid, None)
+        self.changed += len(changed)
+        return changed, removed
+
+    def all_positions(self):
+        """Copias de todos los aviones con posición, para re-enriquecer la lista entera."""
+        return [dict(ac) for ac in self.aircraft.values() if "lat" in ac]
+
+    def stats(self):
+        return {"src": self.src, "parser": "orjson" if orjson is not None else "json",
+                "aircraft": len(self.aircraft), "fetches": self.fetches, "notModified": self.notModified,
+                "parsed": self.parsed, "changed": self.changed, "parseMs": round(self.parseMs, 3)}
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
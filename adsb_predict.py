@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Predicción de apuntado para adsb_to_rot_webui: cada avión se proyecta a la hora del
+comando + latencia de la montura con un modelo de giro constante (CTR), en lote NumPy.
+
+Por avión se guardan los últimos PREDICT_DEPTH fixes (t, ENU respecto al sitio, gs,
+track, velocidad vertical) en arrays (filas = aviones, columnas = fixes, el más nuevo
+al final). La tasa de giro sale de una regresión del track frente al tiempo en los
+últimos PREDICT_WINDOW s; sin gs/track ADS-B se usa la velocidad entre los dos
+últimos fixes. Cada fix nuevo se compara con lo que el modelo predecía para su hora
+(error en m y en grados vistos desde el sitio).
+"""
+import numpy as np
+from geodesy import enu_look
+
+PREDICT_DEPTH = 8
+PREDICT_WINDOW = 10.0     # s de historia para ajustar la tasa de giro
+MAX_TURN_RATE = 6.0       # deg/s, por encima es ruido del track
+RATE_STEP = 0.5           # s, diferencia finita para las velocidades az/el
+ERROR_SAMPLES = 500
+
+def _wrap180(d):
+    return (d + 180.0) % 360.0 - 180.0
+
+class TrackPredictor:
+    def __init__(self, depth=PREDICT_DEPTH, window=PREDICT_WINDOW):
+        self.depth = depth
+        self.window = window
+        self.rows = {}            # hex -> fila
+        self.free = []
+        self._alloc(64)
+        self.errorsRecent = []    # (err_m, err_deg) de los últimos fixes, todos los aviones
+
+    def _alloc(self, capacity):
+        old = getattr(self, "t", None)
+        shape = (capacity, self.depth)
+        arrays = {name: np.full(shape, np.nan) for name in ("t", "e", "n", "u", "gs", "track", "vz")}
+        rowArrays = {name: np.full(capacity, np.nan) for name in ("omega", "errM", "errDeg", "errHorizon")}
+        if old is not None:
+            count = old.shape[0]
+            for name in arrays: arrays[name][:count] = getattr(self, name)
+            for name in rowArrays: rowArrays[name][:count] = getattr(self, name)
+            self.free.extend(range(capacity - 1, count - 1, -1))
+        else:
+            self.free.extend(range(capacity - 1, -1, -1))
+        for name, value in {**arrays, **rowArrays}.items():
+            setattr(self, name, value)
+
+    def _row(self, hexid):
+        row = self.rows.get(hexid)
+        if row is None:
+            if not self.free:
+                self._alloc(2*self.t.shape[0])
+            row = self.rows[hexid] = self.free.pop()
+        return row
+
+    def _lookup(self, hexes):
+        """Filas de esos hex, -1 si no se conocen."""
+        return np.array([self.rows.get(h, -1) for h in hexes], dtype=np.intp)
+
+    # --- Fixes ---
+    def add(self, hexes, t, e, n, u, gs_mps, track_deg, vz_mps):
+        """Un fix nuevo por avión (arrays alineados con hexes)."""
+        if not len(hexes):
+            return
+        rows = np.array([self._row(h) for h in hexes], dtype=np.intp)
+        t = np.asarray(t, dtype=np.float64)
+        known = ~np.isnan(self.t[rows, -1])
+        if known.any():
+            # Error del modelo anterior frente a este fix
+            pe, pn, pu = self._project(rows[known], t[known])
+            actual = np.stack([e[known], n[known], u[known]], axis=-1)
+            pred = np.stack([pe, pn, pu], axis=-1)
+            errM = np.linalg.norm(pred - actual, axis=-1)
+            cos = np.sum(pred*actual, axis=-1)/np.maximum(np.linalg.norm(pred, axis=-1)*np.linalg.norm(actual, axis=-1), 1e-9)
+            errDeg = np.degrees(np.arccos(np.clip(cos, -1.0, 1.0)))
+            self.errM[rows[known]] = errM
+            self.errDeg[rows[known]] = errDeg
+            self.errHorizon[rows[known]] = t[known] - self.t[rows[known], -1]
+            valid = ~np.isnan(errM)
+            self.errorsRecent.extend(zip(errM[valid].tolist(), errDeg[valid].tolist()))
+            del self.errorsRecent[:-ERROR_SAMPLES]
+        # Sin track ADS-B: el rumbo de la cuerda desde el fix anterior, para poder ajustar el giro
+        track_deg = np.array(track_deg, dtype=np.float64)
+        chord = np.isnan(track_deg) & known
+        if chord.any():
+            track_deg[chord] = np.degrees(np.arctan2(e[chord] - self.e[rows[chord], -1], n[chord] - self.n[rows[chord], -1])) % 360.0
+        for name, value in (("t", t), ("e", e), ("n", n), ("u", u), ("gs", gs_mps), ("track", track_deg), ("vz", vz_mps)):
+            a = getattr(self, name)
+            a[rows, :-1] = a[rows, 1:]
+            a[rows, -1] = value
+        self._fit(rows)
+
+    def _fit(self, rows):
+        """Tasa de giro (deg/s) por mínimos cuadrados del track en la ventana."""
+        t, track = self.t[rows], self.track[rows]
+        x = t - t[:, -1:]
+        y = _wrap180(track - track[:, -1:])
+        w = ~(np.isnan(x) | np.isnan(y)) & (x >= -self.window)
+        x, y = np.where(w, x, 0.0), np.where(w, y, 0.0)
+        sw, sx, sy = w.sum(axis=1), x.sum(axis=1), y.sum(axis=1)
+        sxx, sxy = (x*x).sum(axis=1), (x*y).sum(axis=1)
+        den = sw*sxx - sx*sx
+        ok = (sw >= 3) & (den > 1e-6)
+        omega = np.divide(sw*sxy - sx*sy, den, out=np.zeros(len(rows)), where=ok)
+        self.omega[rows] = np.clip(omega, -MAX_TURN_RATE, MAX_TURN_RATE)
+
+    def _state(self, rows):
+        """Último fix y velocidad (v m/s, rumbo deg, vz m/s) de esas filas."""
+        t, e, n, u = (getattr(self, name)[rows, -1] for name in ("t", "e", "n", "u"))
+        v, track, vz = self.gs[rows, -1], self.track[rows, -1], self.vz[rows, -1]
+        # Sin velocidad ADS-B: la de los dos últimos fixes
+        dt = t - self.t[rows, -2]
+        de, dn = e - self.e[rows, -2], n - self.n[rows, -2]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            derived = (np.isnan(v) | np.isnan(track)) & (dt > 0.05)
+            v = np.where(derived, np.hypot(de, dn)/dt, v)
+            track = np.where(derived, np.degrees(np.arctan2(de, dn)), track)
+            vzDerived = np.isnan(vz) & (dt > 0.05)
+            vz = np.where(vzDerived, (u - self.u[rows, -2])/dt, vz)
+        return t, e, n, u, np.nan_to_num(v), np.nan_to_num(track), np.nan_to_num(vz)
+
+    def _project(self, rows, when, horizon=None):
+        t0, e, n, u, v, track, vz = self._state(rows)
+        dt = np.maximum(np.asarray(when, dtype=np.float64) - t0, 0.0)
+        if horizon is not None:
+            dt = np.minimum(dt, horizon)
+        theta = np.radians(track)
+        omega = np.radians(self.omega[rows])
+        turning = np.abs(omega) > 1e-4
+        safe = np.where(turning, omega, 1.0)
+        # Giro constante: rumbo theta + omega*t a velocidad v (rumbo desde el norte, E = sin, N = cos)
+        de = np.where(turning, v/safe*(np.cos(theta) - np.cos(theta + omega*dt)), v*dt*np.sin(theta))
+        dn = np.where(turning, v/safe*(np.sin(theta + omega*dt) - np.sin(theta)), v*dt*np.cos(theta))
+        return e + de, n + dn, u + vz*dt
+
+    # --- Consultas ---
+    def predict(self, hexes, when, horizon=None):
+        """ENU (m) de esos aviones a la hora when (NaN los desconocidos); horizon limita la proyección."""
+        rows = self._lookup(hexes)
+        out = [np.full(len(rows), np.nan) for _ in range(3)]
+        known = rows >= 0
+        if known.any():
+            projected = self._project(rows[known], np.broadcast_to(when, rows.shape)[known], horizon)
+            for o, p in zip(out, projected):
+                o[known] = p
+        return out
+
+    def look(self, hexes, when, horizon=None):
+        """az, el (deg) a la hora when y sus velocidades (deg/s), arrays alineados con hexes."""
+        az, el, _ = enu_look(*self.predict(hexes, when, horizon))
+        az2, el2, _ = enu_look(*self.predict(hexes, np.asarray(when) + RATE_STEP,
+                                             None if horizon is None else horizon + RATE_STEP))
+        return az, el, _wrap180(az2 - az)/RATE_STEP, (el2 - el)/RATE_STEP
+
+    def last_fix(self, hexes):
+        rows = self._lookup(hexes)
+        return np.where(rows >= 0, self.t[rows, -1], np.nan)
+
+    def turn_rate(self, hexes):
+        rows = self._lookup(hexes)
+        return np.where(rows >= 0, self.omega[rows], np.nan)
+
+    def errors(self, hexes):
+        """(error m, error deg, horizonte s) del último fix de cada avión frente a la predicción."""
+        rows = self._lookup(hexes)
+        known = rows >= 0
+        return tuple(np.where(known, a[rows], np.nan) for a in (self.errM, self.errDeg, self.errHorizon))
+
+    def error_stats(self):
+        if not self.errorsRecent:
+            return None
+        errs = np.array(self.errorsRecent)
+        p50, p90 = np.percentile(errs, [50, 90], axis=0)
+        return {"count": len(errs), "p50_m": float(p50[0]), "p90_m": float(p90[0]),
+                "p50_deg": float(p50[1]), "p90_deg": float(p90[1])}
+
+    def prune(self, now, max_age):
+        """Libera los aviones sin fix desde hace más de max_age s."""
+        for hexid, row in list(self.rows.items()):
+            if now - self.t[row, -1] > max_age:
+                del self.rows[hexid]
+                for name in ("t", "e", "n", "u", "gs", "track", "vz"):
+                    getattr(self, name)[row] = np.nan
+                for name in ("omega", "errM", "errDeg", "errHorizon"):
+                    getattr(self, name)[row] = np.nan
+                self.free.append(row)
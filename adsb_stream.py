@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Entrada ADS-B en streaming para adsb_to_rot_webui (alternativa a sondear aircraft.json).
+
+Fuentes (--adsb):
+  sbs://host:30003      BaseStation (SBS-1), texto CSV de dump1090/readsb
+  beast://host:30005    Beast binario, se decodifican los DF17/18 (posición CPR, velocidad, callsign)
+  sbs:///ruta/rec.txt   reproducción de una grabación (p.ej. nc host 30003 > rec.txt)
+  beast:///ruta/rec.bin (nc host 30005 > rec.bin), al ritmo de sus timestamps;
+                        ?speed=4 acelera, ?loop=1 repite
+
+Un lector asyncio en su propio hilo actualiza el estado de cada avión en cuanto llega el
+mensaje; update() entrega, como adsb_feed.AircraftFeed, los aviones con posición nueva
+(dicts con las claves de aircraft.json) y los que caducaron.
+"""
+import asyncio, math, threading, time
+from datetime import datetime
+from urllib.parse import urlsplit, parse_qs
+
+STREAM_EXPIRE = 60.0     # s sin mensajes -> el avión desaparece
+CPR_MAX_AGE = 10.0       # s, par par/impar o referencia válidos para decodificar CPR
+RECONNECT_DELAY = 1.0
+BEAST_CLOCK = 12e6       # Hz del timestamp Beast (dump1090 --net-beast por defecto)
+
+# ====== Mode S ======
+CRC_POLY = 0xFFF409
+_crc_table = []
+for _i in range(256):
+    _c = _i << 16
+    for _ in range(8):
+        _c = ((_c << 1) ^ CRC_POLY) if _c & 0x800000 else (_c << 1)
+    _crc_table.append(_c & 0xFFFFFF)
+
+def crc24(msg):
+    """Resto CRC-24 de Mode S, 0 para un DF17/18 sin errores."""
+    crc = 0
+    for b in msg[:-3]:
+        crc = ((crc << 8) & 0xFFFFFF) ^ _crc_table[((crc >> 16) ^ b) & 0xFF]
+    return crc ^ int.from_bytes(msg[-3:], "big")
+
+CALLSIGN_CHARS = "#ABCDEFGHIJKLMNOPQRSTUVWXYZ##### ###############0123456789######"
+NZ = 15
+
+def cpr_nl(lat):
+    """Número de zonas de longitud (NL) a esa latitud."""
+    if lat == 0: return 59
+    if abs(lat) == 87: return 2
+    if abs(lat) > 87: return 1
+    a = 1 - math.cos(math.pi/(2*NZ))
+    b = math.cos(math.radians(lat))**2
+    return int(math.floor(2*math.pi / math.acos(1 - a/b)))
+
+def cpr_global(even, odd, newest):
+    """Posición de un par par/impar (lat, lon normalizados a [0,1)), None si cruzan zona."""
+    latE, lonE = even
+    latO, lonO = odd
+    j = math.floor(59*latE - 60*latO + 0.5)
+    rlatE = (360.0/60)*(j % 60 + latE)
+    rlatO = (360.0/59)*(j % 59 + latO)
+    if rlatE >= 270: rlatE -= 360
+    if rlatO >= 270: rlatO -= 360
+    if cpr_nl(rlatE) != cpr_nl(rlatO):
+        return None
+    lat = rlatO if newest else rlatE
+    nl = cpr_nl(lat)
+    ni = max(nl - newest, 1)
+    m = math.floor(lonE*(nl - 1) - lonO*nl + 0.5)
+    lon = (360.0/ni)*(m % ni + (lonO if newest else lonE))
+    if lon >= 180: lon -= 360
+    return lat, lon
+
+def cpr_local(cpr, odd, ref):
+    """Posición de un solo mensaje cerca de ref (lat, lon), válida a < 180 NM de ella."""
+    latCpr, lonCpr = cpr
+    latRef, lonRef = ref
+    dlat = 360.0/(59 if odd else 60)
+    j = math.floor(latRef/dlat) + math.floor(0.5 + (latRef % dlat)/dlat - latCpr)
+    lat = dlat*(j + latCpr)
+    dlon = 360.0/max(cpr_nl(lat) - odd, 1)
+    m = math.floor(lonRef/dlon) + math.floor(0.5 + (lonRef % dlon)/dlon - lonCpr)
+    lon = dlon*(m + lonCpr)
+    if lon >= 180: lon -= 360
+    return lat, lon
+
+def decode_altitude(alt12):
+    if alt12 & 0x10:    # bit Q: pasos de 25 ft
+        n = ((alt12 & 0xFE0) >> 1) | (alt12 & 0x0F)
+        return n*25 - 1000
+    return None         # Gillham (100 ft), no lo usamos
+
+def decode_adsb(msg):
+    """
+    Campos de un DF17/18 (14 bytes) con las claves de aircraft.json, None si no es ADS-B
+    o el CRC no cuadra. Las posiciones vuelven como "cpr": (odd, lat, lon) sin resolver.
+    """
+    if len(msg) != 14:
+        return None
+    df = msg[0] >> 3
+    if df not in (17, 18) or (df == 18 and (msg[0] & 0x07) != 0) or crc24(msg) != 0:
+        return None
+    me = int.from_bytes(msg[4:11], "big")
+    tc = me >> 51
+    out = {"hex": msg[1:4].hex()}
+    if 1 <= tc <= 4:
+        chars = [CALLSIGN_CHARS[(me >> (42 - 6*k)) & 0x3F] for k in range(8)]
+        out["flight"] = "".join(chars).replace("#", "").strip()
+    elif 9 <= tc <= 18 or 20 <= tc <= 22:
+        alt = decode_altitude((me >> 36) & 0xFFF)
+        if alt is not None:
+            out["alt_geom" if tc >= 20 else "alt_baro"] = alt
+        out["cpr"] = ((me >> 34) & 1, ((me >> 17) & 0x1FFFF)/131072.0, (me & 0x1FFFF)/131072.0)
+    elif tc == 19:
+        st = (me >> 48) & 0x7
+        if st in (1, 2):
+            vew, vns = (me >> 32) & 0x3FF, (me >> 21) & 0x3FF
+            if vew and vns:
+                scale = 4 if st == 2 else 1
+                vx = (vew - 1)*scale*(-1 if (me >> 42) & 1 else 1)
+                vy = (vns - 1)*scale*(-1 if (me >> 31) & 1 else 1)
+                out["gs"] = math.hypot(vx, vy)
+                out["track"] = math.degrees(math.atan2(vx, vy)) % 360.0
+        vr = (me >> 10) & 0x1FF
+        if vr:
+            out["baro_rate" if (me >> 20) & 1 else "geom_rate"] = (vr - 1)*64*(-1 if (me >> 19) & 1 else 1)
+    return out
+
+# ====== Framing ======
+BEAST_LENGTH = {0x31: 2, 0x32: 7, 0x33: 14}   # Mode A/C, Mode S corto, Mode S largo
+
+class BeastReader:
+    """Separa tramas Beast (0x1a, tipo, timestamp 6 B, señal 1 B, mensaje; 0x1a escapado como 0x1a 0x1a)."""
+    def __init__(self):
+        self.buf = b""
+
+    def feed(self, data):
+        buf = self.buf + data
+        n = len(buf)
+        frames = []
+        i = 0
+        while True:
+            start = buf.find(b"\x1a", i)
+            if start < 0:
+                i = n
+                break
+            if start + 1 >= n:
+                i = start
+                break
+            length = BEAST_LENGTH.get(buf[start + 1])
+            if length is None:
+                # 0x1a escapado o basura: resincronizar
+                i = start + (2 if buf[start + 1] == 0x1a else 1)
+                continue
+            frame = bytearray()
+            j = start + 2
+            broken = False
+            while len(frame) < 7 + length and j < n:
+                b = buf[j]
+                if b == 0x1a:
+                    if j + 1 >= n:
+                        break
+                    if buf[j + 1] != 0x1a:
+                        broken = True    # empieza otra trama: ésta venía cortada
+                        break
+                    j += 1
+                frame.append(b)
+                j += 1
+            if broken:
+                i = j
+                continue
+            if len(frame) < 7 + length:
+                i = start                # incompleta, esperar más datos
+                break
+            frames.append((int.from_bytes(frame[:6], "big"), frame[6], bytes(frame[7:])))
+            i = j
+        self.buf = buf[i:]
+        return frames
+
+def parse_sbs(line):
+    """Línea BaseStation -> (campos aircraft.json, hora de generación epoch o None)."""
+    f = line.split(",")
+    if len(f) < 22 or f[0] != "MSG" or not f[4]:
+        return None, None
+    out = {"hex": f[4].strip().lower()}
+    def num(k):
+        try: return float(f[k])
+        except ValueError: return None
+    if f[10].strip(): out["flight"] = f[10].strip()
+    alt, gs, track, lat, lon, vrate = num(11), num(12), num(13), num(14), num(15), num(16)
+    if alt is not None: out["alt_baro"] = alt
+    if gs is not None: out["gs"] = gs
+    if track is not None: out["track"] = track
+    if lat is not None and lon is not None: out["lat"], out["lon"] = lat, lon
+    if vrate is not None: out["baro_rate"] = vrate
+    try:
+        generated = datetime.strptime(f"{f[6]} {f[7]}", "%Y/%m/%d %H:%M:%S.%f").timestamp()
+    except ValueError:
+        generated = None
+    return out, generated
+
+# ====== Estado por avión ======
+class AircraftStream:
+    def __init__(self, src):
+        self.src = src
+        u = urlsplit(src)
+        self.kind = u.scheme                      # "sbs" / "beast"
+        self.address = (u.hostname, u.port or (30005 if self.kind == "beast" else 30003)) if u.netloc else None
+        self.path = None if u.netloc else u.path
+        query = parse_qs(u.query)
+        self.speed = float(query.get("speed", ["1"])[0])
+        self.loop = query.get("loop", ["0"])[0] not in ("0", "")
+        self.aircraft = {}        # hex -> dict estilo aircraft.json
+        self.lastHeard = {}       # hex -> time.time() del último mensaje
+        self.cpr = {}             # hex -> {0|1: (lat, lon, t)} últimos CPR par/impar
+        self.changedHex = set()
+        self.lock = threading.Lock()
+        self.running = True
+        # Métricas
+        self.messages = 0
+        self.decoded = 0
+        self.positions = 0
+        self.ignored = 0        # tramas que no son DF17/18 válidos (Mode A/C, DF11, CRC)
+        self.connects = 0
+        self.lastError = None
+        self.thread = threading.Thread(target=lambda: asyncio.run(self._run()), daemon=True)
+        self.thread.start()
+
+    # --- Lectores ---
+    async def _run(self):
+        while self.running:
+            try:
+                if self.path:
+                    await self._replay()
+                    if not self.loop:
+                        return
+                else:
+                    reader, writer = await asyncio.open_connection(*self.address)
+                    self.connects += 1
+                    try:
+                        await self._consume(reader)
+                    finally:
+                        writer.close()
+            except (OSError, asyncio.IncompleteReadError) as e:
+                self.lastError = str(e)
+            await asyncio.sleep(RECONNECT_DELAY)
+
+    async def _consume(self, reader):
+        if self.kind == "beast":
+            beast = BeastReader()
+            while self.running:
+                data = await reader.read(4096)
+                if not data:
+                    raise ConnectionError("fin del stream")
+                for _, _, msg in beast.feed(data):
+                    self._on_modes(msg)
+        else:
+            while self.running:
+                line = await reader.readline()
+                if not line:
+                    raise ConnectionError("fin del stream")
+                self._on_sbs(line.decode("ascii", "ignore"))
+
+    async def _replay(self):
+        """Reproduce una grabación al ritmo de sus timestamps (dividido por speed)."""
+        start, origin = time.monotonic(), None
+        async def pace(t):
+            nonlocal origin
+            if t is None or self.speed <= 0:
+                return
+            if origin is None:
+                origin = t
+            delay = start + (t - origin)/self.speed - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        with open(self.path, "rb") as f:
+            if self.kind == "beast":
+                beast = BeastReader()
+                for data in iter(lambda: f.read(4096), b""):
+                    for ts, _, msg in beast.feed(data):
+                        await pace(ts/BEAST_CLOCK if ts else None)
+                        self._on_modes(msg)
+            else:
+                for line in f:
+                    line = line.decode("ascii", "ignore")
+                    await pace(parse_sbs(line)[1])
+                    self._on_sbs(line)
+
+    # --- Decodificación ---
+    def _on_modes(self, msg):
+        self.messages += 1
+        fields = decode_adsb(msg)
+        if fields is None:
+            self.ignored += 1
+            return
+        self._apply(fields, time.time())
+
+    def _on_sbs(self, line):
+        self.messages += 1
+        fields, _ = parse_sbs(line.strip())
+        if fields is None:
+            return
+        self._apply(fields, time.time())
+
+    def _apply(self, fields, now):
+        hexid = fields.pop("hex")
+        cpr = fields.pop("cpr", None)
+        with self.lock:
+            self.decoded += 1
+            ac = self.aircraft.setdefault(hexid, {"hex": hexid})
+            self.lastHeard[hexid] = now
+            if cpr is not None:
+                position = self._resolve_cpr(hexid, ac, cpr, now)
+                if position is not None:
+                    fields["lat"], fields["lon"] = position
+            ac.update(fields)
+            if "lat" in fields:
+                ac["_pos_ts"] = now
+                self.positions += 1
+                self.changedHex.add(hexid)
+
+    def _resolve_cpr(self, hexid, ac, cpr, now):
+        odd, lat, lon = cpr
+        frames = self.cpr.setdefault(hexid, {})
+        frames[odd] = (lat, lon, now)
+        # Con una posición reciente basta un solo mensaje (decodificación local)
+        if "lat" in ac and now - ac.get("_pos_ts", 0.0) <= CPR_MAX_AGE:
+            return cpr_local((lat, lon), odd, (ac["lat"], ac["lon"]))
+        other = frames.get(1 - odd)
+        if other is None or now - other[2] > CPR_MAX_AGE:
+            return None
+        even, oddFrame = (frames[0][:2], frames[1][:2])
+        return cpr_global(even, oddFrame, odd)
+
+    # --- Interfaz de adsb_feed.AircraftFeed ---
+    def update(self):
+        """(cambiados, desaparecidos) desde la última llamada, copias con seen_pos al día."""
+        now = time.time()
+        with self.lock:
+            changed = []
+            for hexid in self.changedHex:
+                ac = self.aircraft.get(hexid)
+                if ac is None or "lat" not in ac:
+                    continue
+                ac = dict(ac)
+                ac["seen_pos"] = now - ac["_pos_ts"]
+                changed.append(ac)
+            self.changedHex.clear()
+            removed = [h for h, t in self.lastHeard.items() if now - t > STREAM_EXPIRE]
+            for hexid in removed:
+                del self.lastHeard[hexid]
+                self.aircraft.pop(hexid, None)
+                self.cpr.pop(hexid, None)
+        return changed, removed
+
+    def all_positions(self):
+        """Copias de todos los aviones con posición, para re-enriquecer la lista entera."""
+        now = time.time()
+        with self.lock:
+            out = [dict(ac) for ac in self.aircraft.values() if "lat" in ac]
+        for ac in out:
+            ac["seen_pos"] = now - ac["_pos_ts"]
+        return out
+
+    def stats(self):
+        return {"src": self.src, "parser": self.kind, "aircraft": len(self.aircraft), "connects": self.connects,
+                "messages": self.messages, "decoded": self.decoded, "positions": self.positions,
+                "ignored": self.ignored, "lastError": self.lastError}
+
+    def close(self):
+        self.running = False
+
+
+if __name__ == "__main__":
+    # python3 adsb_stream.py beast://192.168.1.156:30005  -> lista de aviones cada segundo
+    import sys
+    stream = AircraftStream(sys.argv[1])
+    while True:
+        time.sleep(1.0)
+        changed, removed = stream.update()
+        for ac in changed:
+            print(f"{ac['hex']} {ac.get('flight',''):8s} {ac['lat']:9.5f} {ac['lon']:10.5f} "
+                  f"alt={ac.get('alt_baro', ac.get('alt_geom'))} gs={ac.get('gs')} trk={ac.get('track')}")
+        print("#", stream.stats(), flush=True)
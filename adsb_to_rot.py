@@ -2,6 +2,7 @@
 import argparse, json, math, time, socket
 from urllib.request import urlopen
 from urllib.error import URLError, HTTPError
+from rotctl import RotctlClient
 
 # --- Constantes WGS84 ---
 a = 6378137.0
@@ -75,11 +76,6 @@ def wrap_az_delta(new, old):
     # devuelve delta en [-180, +180]
     return ((new - old + 540) % 360) - 180
 
-def send_rotctld(host, port, az, el):
-    cmd = f"P {az:.2f} {el:.2f}\n"
-    with socket.create_connection((host, port), timeout=0.5) as s:
-        s.sendall(cmd.encode("ascii"))
-
 def main():
     ap = argparse.ArgumentParser(description="ADS-B (dump1090) -> rotctld bridge")
     ap.add_argument("--adsb", default="/run/dump1090-fa/aircraft.json",
@@ -100,6 +96,8 @@ def main():
     lat0, lon0, h0 = args.site_lat, args.site_lon, args.site_alt
     dt = 1.0 / max(args.hz, 0.1)
 
+    # Conexión persistente a rotctld (antes una conexión TCP por goto)
+    rot = RotctlClient(args.rot_host, args.rot_port, timeout=0.5)
     last_az, last_el = None, None
     print(f"[ADSBR] leyendo de {args.adsb} -> rotctld {args.rot_host}:{args.rot_port} @ {args.hz} Hz")
     while True:
@@ -119,7 +117,9 @@ def main():
                 if (last_az is None or
                     abs(wrap_az_delta(az, last_az)) > args.deadband or
                     abs(el - last_el) > args.deadband):
-                    send_rotctld(args.rot_host, args.rot_port, az, el)
+                    code = rot.set_position(az, el)
+                    if code != 0:
+                        print(f"[ADSBR] rotctld: RPRT {code}")
                     last_az, last_el = az, el
             time.sleep(dt)
         except (URLError, HTTPError) as e:
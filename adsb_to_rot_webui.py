@@ -1,59 +1,16 @@
 #!/usr/bin/env python3
-import math, time, json, socket, threading, argparse, re
-from urllib.request import urlopen
-from urllib.error import URLError, HTTPError
+import time, threading, argparse
 from flask import Flask, request, jsonify, Response
+import numpy as np
+from geodesy import Site, haversine_km, bearing_deg
+from rotctl import RotctlClient
+from adsb_feed import open_feed
+from adsb_predict import TrackPredictor, PREDICT_WINDOW
 
 # ====== Geodesia / conversiones ======
-a = 6378137.0
-f = 1/298.257223563
-b = a*(1-f)
-e2 = 1 - (b*b)/(a*a)
-R_EARTH = 6371000.0
+# Vectorizada en geodesy.py, el sitio se calcula una vez (site_geometry)
 KT_TO_MPS = 0.514444
-
-def geodetic_to_ecef(lat, lon, h):
-    lat, lon = math.radians(lat), math.radians(lon)
-    N = a / math.sqrt(1 - e2*math.sin(lat)**2)
-    x = (N + h) * math.cos(lat) * math.cos(lon)
-    y = (N + h) * math.cos(lat) * math.sin(lon)
-    z = (N*(1 - e2) + h) * math.sin(lat)
-    return x, y, z
-
-def ecef_to_enu(x, y, z, lat0, lon0, h0):
-    x0, y0, z0 = geodetic_to_ecef(lat0, lon0, h0)
-    dx, dy, dz = x - x0, y - y0, z - z0
-    lat0, lon0 = math.radians(lat0), math.radians(lon0)
-    slat, clat = math.sin(lat0), math.cos(lat0)
-    slon, clon = math.sin(lon0), math.cos(lon0)
-    e = -slon*dx + clon*dy
-    n = -clon*slat*dx - slon*slat*dy + clat*dz
-    u =  clon*clat*dx + slon*clat*dy + slat*dz
-    return e, n, u
-
-def az_el_from_latlon(lat, lon, h, lat0, lon0, h0):
-    x, y, z = geodetic_to_ecef(lat, lon, h)
-    e, n, u = ecef_to_enu(x, y, z, lat0, lon0, h0)
-    az = (math.degrees(math.atan2(e, n)) + 360.0) % 360.0
-    slant = math.sqrt(e*e + n*n + u*u)
-    el = math.degrees(math.asin(u / slant))
-    rng_km = slant / 1000.0
-    return az, el, rng_km
-
-def haversine_km(lat1, lon1, lat2, lon2):
-    dlat = math.radians(lat2-lat1)
-    dlon = math.radians(lon2-lon1)
-    a_ = math.sin(dlat/2)**2 + math.cos(math.radians(lat1))*math.cos(math.radians(lat2))*math.sin(dlon/2)**2
-    c = 2*math.atan2(math.sqrt(a_), math.sqrt(1-a_))
-    return (R_EARTH * c) / 1000.0
-
-def bearing_deg(lat1, lon1, lat2, lon2):
-    φ1, φ2 = math.radians(lat1), math.radians(lat2)
-    dλ = math.radians(lon2-lon1)
-    y = math.sin(dλ) * math.cos(φ2)
-    x = math.cos(φ1)*math.sin(φ2) - math.sin(φ1)*math.cos(φ2)*math.cos(dλ)
-    brng = (math.degrees(math.atan2(y, x)) + 360) % 360
-    return brng
+FPM_TO_MPS = 0.00508
 
 def feet_to_m(ft): return 0.3048 * ft
 def wrap180(d): return ((d + 180.0) % 360.0) - 180.0
@@ -63,6 +20,8 @@ def wrap_az_delta(new, old): return ((new - old + 540) % 360) - 180
 state = {
     "site": {"lat": 0.0, "lon": 0.0, "alt": 0.0},
     "adsb_src": "",
+    "feed": None,              # fuente del tracker_loop (adsb_feed.open_feed)
+    "predict_stats": None,     # error de predicción frente al fix siguiente (adsb_predict)
     "rot_host": "127.0.0.1",
     "rot_port": 4533,
     "settings": {
@@ -73,7 +32,8 @@ state = {
         "alpha": 0.6,          # 1.0 = sin suavizado
         "min_dwell_s": 8.0,    # permanencia mínima del objetivo
         "switch_margin_km": 3.0, # margen de mejora en gnd_km para permitir cambio
-        "predict_hold_s": 8.0  # cuánto tiempo mantenemos con predicción si se corta el feed
+        "predict_hold_s": 8.0, # cuánto tiempo mantenemos con predicción si se corta el feed
+        "mount_latency_s": 0.5 # s, se apunta a donde estará el avión al comando + esto (rotctld + montura)
     },
     "offset": {"az": 0.0, "el": 0.0},
     "lock_hex": None,
@@ -83,104 +43,130 @@ state = {
 }
 lock = threading.Lock()
 
-# Historial simple por HEX (para radial y predicción)
+# Historial simple por HEX (para radial y derivar gs/track); la predicción va en adsb_predict
 # {hex: {lat, lon, alt_m, gs_mps, track_deg, ts}}
 history = {}
 
 # ====== I/O rotctld ======
+# Un cliente persistente por (host, port), ver rotctl.py
+rot_clients = {}
+rot_clients_lock = threading.Lock()
+
+def rot_client(host, port):
+    with rot_clients_lock:
+        client = rot_clients.get((host, port))
+        if client is None:
+            client = rot_clients[(host, port)] = RotctlClient(host, port, timeout=0.6)
+        return client
+
 def send_rotctld(host, port, az, el):
-    cmd = f"P {az:.2f} {el:.2f}\n"
-    with socket.create_connection((host, port), timeout=0.6) as s:
-        s.sendall(cmd.encode("ascii"))
+    """Goto sin bloquear, si el anterior aún no salió se reemplaza (latest wins)."""
+    rot_client(host, port).submit(az, el)
 
-FLOAT_RE = re.compile(r"[-+]?\d+(?:\.\d+)?")
 def read_rot_pos(host, port):
-    with socket.create_connection((host, port), timeout=0.6) as s:
-        s.sendall(b"p\n")
-        s.settimeout(0.6)
-        data = s.recv(256).decode("ascii", "ignore")
-    nums = [float(x) for x in FLOAT_RE.findall(data)]
-    if len(nums) >= 2:
-        return float(nums[0]) % 360.0, float(nums[1])
-    raise RuntimeError(f"rotctld response not parsed: {data!r}")
-
-def read_aircrafts(src, timeout=0.8):
-    if src.startswith("http://") or src.startswith("https://"):
-        with urlopen(src, timeout=timeout) as r:
-            return json.load(r)
-    else:
-        with open(src, "r") as f:
-            return json.load(f)
+    return rot_client(host, port).get_position()
 
 # ====== Selección / enriquecimiento ======
-def enrich_aircraft(ac, site, stg):
-    """Devuelve dict con az/el, distancias, radial y tendencia."""
-    lat0, lon0, h0 = site["lat"], site["lon"], site["alt"]
-    lat, lon = ac["lat"], ac["lon"]
-    alt_ft = ac.get("alt_geom") or ac.get("alt_baro")
-    if not alt_ft:
-        # usa última alt conocida si existe en history
-        h = history.get(ac.get("hex",""), {}).get("alt_m", None)
-        if h is None:
-            return None
-    else:
-        h = feet_to_m(alt_ft)
-
-    az, el, slant_km = az_el_from_latlon(lat, lon, h, lat0, lon0, h0)
-    gnd_km = haversine_km(lat0, lon0, lat, lon)
-    if el < stg["min_el"] or gnd_km > stg["max_ground"]:
-        return None
-
-    # velocidad y rumbo
-    gs_mps = None
-    if ac.get("gs") is not None:
-        gs_mps = float(ac["gs"]) * KT_TO_MPS  # dump1090 da knots
-    track = ac.get("track")
+_site_cache = None
+
+def site_geometry(site):
+    """Site (ECEF + rotación ENU) del sitio actual, recalculado sólo si cambia."""
+    global _site_cache
+    key = (float(site["lat"]), float(site["lon"]), float(site["alt"]))
+    if _site_cache is None or _site_cache.key() != key:
+        _site_cache = Site(*key)
+    return _site_cache
+
+def enrich_records(ac_raw, site):
+    """
+    Enriquecimiento en una pasada NumPy (geodesy.Site.observe), sin filtrar, para
+    guardarlo en caché por hex: sólo hay que recalcular los aviones con posición nueva.
+    """
+    acs, alt_m, gs_mps, track, vz_mps, pos_ts = [], [], [], [], [], []
+    prev_lat, prev_lon, prev_dt = [], [], []
+    now = time.time()
+    for ac in ac_raw:
+        if "lat" not in ac or "lon" not in ac:
+            continue
+        hexid = ac.get("hex","")
+        prev = history.get(hexid)
+        ts = ac.get("_pos_ts", now - (ac.get("seen_pos", ac.get("seen")) or 0.0))
+        alt_ft = ac.get("alt_geom") or ac.get("alt_baro")
+        if not alt_ft:
+            # usa última alt conocida si existe en history
+            h = prev.get("alt_m", None) if prev else None
+            if h is None:
+                continue
+        else:
+            h = feet_to_m(alt_ft)
+        acs.append(ac)
+        alt_m.append(h)
+        pos_ts.append(ts)
+        gs_mps.append(float(ac["gs"]) * KT_TO_MPS if ac.get("gs") is not None else np.nan)  # dump1090 da knots
+        track.append(ac["track"] if ac.get("track") is not None else np.nan)
+        vrate = ac.get("geom_rate", ac.get("baro_rate"))
+        vz_mps.append(float(vrate)*FPM_TO_MPS if vrate is not None else None)
+        # Sólo un fix anterior sirve: al re-enriquecer (cambio de sitio) history ya tiene este mismo
+        fresh = prev is not None and 0 < (ts - prev["ts"]) <= 10
+        prev_lat.append(prev["lat"] if fresh else np.nan)
+        prev_lon.append(prev["lon"] if fresh else np.nan)
+        prev_dt.append(max(0.1, ts - prev["ts"]) if fresh else np.nan)
+    if not acs:
+        return []
+
+    lat = np.array([ac["lat"] for ac in acs], dtype=np.float64)
+    lon = np.array([ac["lon"] for ac in acs], dtype=np.float64)
+    gs_mps = np.array(gs_mps)
+    track = np.array(track)
 
     # si falta gs/track, calcula con historial
-    hexid = ac.get("hex","")
-    prev = history.get(hexid)
-    now = time.time()
-    if (gs_mps is None or track is None) and prev and (now - prev["ts"]) <= 10:
-        dt = max(0.1, now - prev["ts"])
-        brg_prev = bearing_deg(prev["lat"], prev["lon"], lat, lon)
-        dist_km = haversine_km(prev["lat"], prev["lon"], lat, lon)
-        gs_mps = (dist_km*1000.0)/dt
-        track = brg_prev
+    prev_lat, prev_lon, prev_dt = np.array(prev_lat), np.array(prev_lon), np.array(prev_dt)
+    derive = (np.isnan(gs_mps) | np.isnan(track)) & ~np.isnan(prev_lat)
+    if derive.any():
+        gs_mps[derive] = haversine_km(prev_lat[derive], prev_lon[derive], lat[derive], lon[derive])*1000.0/prev_dt[derive]
+        track[derive] = bearing_deg(prev_lat[derive], prev_lon[derive], lat[derive], lon[derive])
+
+    geo = site_geometry(site).observe(lat, lon, np.array(alt_m), gs_mps, track)
 
     # radial respecto al sitio (positivo si se ACERCA)
-    trend = "cross"; radial_mps = 0.0
-    try:
-        if gs_mps is not None and track is not None:
-            brg_site_to_ac = bearing_deg(lat0, lon0, lat, lon)
-            # radial = -gs * cos(track - bearing_site_to_ac)
-            radial_mps = - gs_mps * math.cos(math.radians((track - brg_site_to_ac + 540) % 360 - 180))
-            if radial_mps > 10: trend = "approach"
-            elif radial_mps < -10: trend = "recede"
-            else: trend = "cross"
-    except Exception:
-        pass
-
-    return {
-        "hex": hexid,
-        "flight": (ac.get("flight") or "").strip(),
-        "lat": lat, "lon": lon,
-        "alt_ft": alt_ft,
-        "az": az, "el": el,
-        "slant_km": slant_km, "gnd_km": gnd_km,
-        "seen": ac.get("seen_pos", ac.get("seen", 9e9)) or 9e9,
-        "gs": ac.get("gs"), "track": ac.get("track"),
-        "radial_mps": radial_mps, "trend": trend
-    }
-
-def compute_list(ac_raw, site, stg):
+    radial = np.nan_to_num(geo["radial_mps"], nan=0.0)
     out = []
-    for ac in ac_raw:
-        if "lat" not in ac or "lon" not in ac: 
-            continue
-        e = enrich_aircraft(ac, site, stg)
-        if e: out.append(e)
-    out.sort(key=lambda x: (x["gnd_km"], -x["el"], x["seen"]))
+    for i, ac in enumerate(acs):
+        radial_mps = float(radial[i])
+        if radial_mps > 10: trend = "approach"
+        elif radial_mps < -10: trend = "recede"
+        else: trend = "cross"
+        out.append({
+            "hex": ac.get("hex",""),
+            "flight": (ac.get("flight") or "").strip(),
+            "lat": ac["lat"], "lon": ac["lon"],
+            "alt_ft": ac.get("alt_geom") or ac.get("alt_baro"),
+            "az": float(geo["az"][i]), "el": float(geo["el"][i]),
+            "slant_km": float(geo["slant_km"][i]), "gnd_km": float(geo["gnd_km"][i]),
+            "seen": max(0.0, now - pos_ts[i]),
+            "gs": ac.get("gs"), "track": ac.get("track"),
+            "radial_mps": radial_mps, "trend": trend,
+            "alt_m": float(alt_m[i]),
+            "gs_mps": None if np.isnan(gs_mps[i]) else float(gs_mps[i]),
+            "track_deg": None if np.isnan(track[i]) else float(track[i]),
+            "vz_mps": vz_mps[i],
+            "_pos_ts": pos_ts[i]
+        })
+    return out
+
+def select_list(records, stg, now=None):
+    """
+    Filtra (min_el, max_ground) y ordena registros de enrich_records(). Devuelve
+    copias, con "seen" al día si se pasa now, así la caché no se toca.
+    """
+    out = []
+    for rec in records:
+        if rec["el"] >= stg["min_el"] and rec["gnd_km"] <= stg["max_ground"]:
+            rec = dict(rec)
+            if now is not None:
+                rec["seen"] = max(0.0, now - rec["_pos_ts"])
+            out.append(rec)
+    out.sort(key=lambda r: (r["gnd_km"], -r["el"], r["seen"]))
     return out
 
 def choose_target(ac_list, lock_hex, current, stg):
@@ -225,19 +211,12 @@ def choose_target(ac_list, lock_hex, current, stg):
         return ac_list[0]
     return None
 
-def predict_forward(lat, lon, alt_m, gs_mps, track_deg, dt_s):
-    # Aproximación pequeña distancia
-    d_km = (gs_mps * dt_s) / 1000.0
-    brng = math.radians(track_deg)
-    d_r = d_km * 1000.0 / R_EARTH
-    φ1 = math.radians(lat)
-    λ1 = math.radians(lon)
-    φ2 = math.asin(math.sin(φ1)*math.cos(d_r) + math.cos(φ1)*math.sin(d_r)*math.cos(brng))
-    λ2 = λ1 + math.atan2(math.sin(brng)*math.sin(d_r)*math.cos(φ1), math.cos(d_r)-math.sin(φ1)*math.sin(φ2))
-    return math.degrees(φ2), (math.degrees(λ2)+540)%360-180, alt_m
-
 # ====== Bucle de seguimiento ======
 def tracker_loop():
+    feed = None
+    enriched = {}          # hex -> registro de enrich_records(), sin filtrar
+    enriched_site = None
+    predictor = TrackPredictor()
     last_az, last_el = None, None
     last_hex = None
     last_sample_ts = None
@@ -251,57 +230,106 @@ def tracker_loop():
                 off = dict(state["offset"])
                 current = state["current_target"]
 
-            data = read_aircrafts(src)
-            raw_list = data.get("aircraft", []) if isinstance(data, dict) else []
-
-            # Actualiza historial base
+            # Sólo los aviones con posición nueva (adsb_feed.AircraftFeed o adsb_stream.AircraftStream)
+            if feed is None or feed.src != src:
+                if feed is not None: feed.close()
+                feed = state["feed"] = open_feed(src)
+                enriched.clear()
+                predictor = TrackPredictor()
+            changed, removed = feed.update()
+            for hexid in removed:
+                enriched.pop(hexid, None)
+            if site_geometry(site).key() != enriched_site:
+                # Sitio nuevo: recalcular toda la caché
+                enriched_site = site_geometry(site).key()
+                changed = feed.all_positions()
+                predictor = TrackPredictor()     # ENU relativo al sitio anterior
+            recs = enrich_records(changed, site)
+            for rec in recs:
+                enriched[rec["hex"]] = rec
+            if recs:
+                e, n, u = site_geometry(site).enu([r["lat"] for r in recs], [r["lon"] for r in recs], [r["alt_m"] for r in recs])
+                nan = lambda k: np.array([np.nan if r[k] is None else r[k] for r in recs], dtype=np.float64)
+                predictor.add([r["hex"] for r in recs], [r["_pos_ts"] for r in recs], e, n, u,
+                              nan("gs_mps"), nan("track_deg"), nan("vz_mps"))
+
+            # Actualiza historial base (después de enriquecer, que usa la posición anterior)
             now = time.time()
-            for ac in raw_list:
-                if "lat" in ac and "lon" in ac:
-                    hexid = ac.get("hex","")
-                    alt_ft = ac.get("alt_geom") or ac.get("alt_baro")
-                    alt_m = feet_to_m(alt_ft) if alt_ft else history.get(hexid,{}).get("alt_m", None)
-                    gs_mps = float(ac["gs"])*KT_TO_MPS if ac.get("gs") is not None else history.get(hexid,{}).get("gs_mps", None)
-                    track_deg = ac.get("track") if ac.get("track") is not None else history.get(hexid,{}).get("track_deg", None)
-                    history[hexid] = {"lat": ac["lat"], "lon": ac["lon"], "alt_m": alt_m,
-                                      "gs_mps": gs_mps, "track_deg": track_deg, "ts": now}
-
-            ac_list = compute_list(raw_list, site, stg)
+            for ac in changed:
+                hexid = ac.get("hex","")
+                alt_ft = ac.get("alt_geom") or ac.get("alt_baro")
+                alt_m = feet_to_m(alt_ft) if alt_ft else history.get(hexid,{}).get("alt_m", None)
+                gs_mps = float(ac["gs"])*KT_TO_MPS if ac.get("gs") is not None else history.get(hexid,{}).get("gs_mps", None)
+                track_deg = ac.get("track") if ac.get("track") is not None else history.get(hexid,{}).get("track_deg", None)
+                history[hexid] = {"lat": ac["lat"], "lon": ac["lon"], "alt_m": alt_m,
+                                  "gs_mps": gs_mps, "track_deg": track_deg, "ts": ac["_pos_ts"]}
+
+            predictor.prune(now, max(60.0, stg["predict_hold_s"], PREDICT_WINDOW))
+            ac_list = select_list(enriched.values(), stg, now)
+
+            # Todos los candidatos proyectados a la hora del comando + latencia de montura
+            t_cmd = now + stg["mount_latency_s"]
+            horizon = stg["predict_hold_s"] + stg["mount_latency_s"]
+            if ac_list:
+                hexes = [a["hex"] for a in ac_list]
+                p_az, p_el, p_azr, p_elr = predictor.look(hexes, t_cmd, horizon)
+                err_m, err_deg, err_h = predictor.errors(hexes)
+                omega = predictor.turn_rate(hexes)
+                for i, a in enumerate(ac_list):
+                    if np.isnan(p_az[i]):
+                        continue
+                    a["az_fix"], a["el_fix"] = a["az"], a["el"]
+                    a["az"], a["el"] = float(p_az[i]), float(p_el[i])
+                    a["az_rate"], a["el_rate"] = float(p_azr[i]), float(p_elr[i])
+                    a["_rate_ts"] = now
+                    a["turn_rate"] = float(omega[i])
+                    a["lead_s"] = t_cmd - a["_pos_ts"]
+                    if not np.isnan(err_m[i]):
+                        a["pred_err_m"], a["pred_err_deg"], a["pred_err_horizon_s"] = float(err_m[i]), float(err_deg[i]), float(err_h[i])
 
             # Elegir/retener objetivo
             tgt = choose_target(ac_list, lock_hex, current, stg)
 
-            # Si perdimos posición fresca de tgt, intentar predecir
+            # Target fuera de la lista (sostenido por choose_target o perdido): seguir con el modelo
+            # mientras el último fix tenga menos de predict_hold_s, después se suelta
             predicted = False
-            if tgt is None and current:
-                hx = current.get("hex")
-                h = history.get(hx)
-                if h and h.get("gs_mps") and h.get("track_deg"):
-                    dt = now - h["ts"]
-                    if dt <= stg["predict_hold_s"]:
-                        plat, plon, palt = predict_forward(h["lat"], h["lon"], h["alt_m"] or 10000, h["gs_mps"], h["track_deg"], dt)
-                        az, el, _ = az_el_from_latlon(plat, plon, palt, site["lat"], site["lon"], site["alt"])
-                        tgt = dict(current)
-                        tgt["az"], tgt["el"] = az, el
-                        predicted = True
+            held = tgt or current
+            if held and not any(a["hex"] == held.get("hex") for a in ac_list):
+                hx = held.get("hex")
+                t_fix = predictor.last_fix([hx])[0]
+                tgt = None
+                if not np.isnan(t_fix) and now - t_fix <= stg["predict_hold_s"]:
+                    p_az, p_el, p_azr, p_elr = predictor.look([hx], t_cmd, horizon)
+                    tgt = dict(held)
+                    tgt["az"], tgt["el"] = float(p_az[0]), float(p_el[0])
+                    tgt["az_rate"], tgt["el_rate"] = float(p_azr[0]), float(p_elr[0])
+                    tgt["_rate_ts"] = now
+                    predicted = True
 
             # Publicar lista y target
             with lock:
                 state["aircrafts"] = ac_list
+                state["predict_stats"] = predictor.error_stats()
                 if tgt:
                     # sellar tiempos para dwell/predict
                     if (not current) or (current and current.get("hex") != tgt.get("hex")):
                         tgt["_since"] = now
-                    tgt["_last_seen_ts"] = now
+                    if not predicted:
+                        tgt["_last_seen_ts"] = now
                 state["current_target"] = tgt
 
             # Enviar al rotador
             if tgt:
                 az, el = tgt["az"], tgt["el"]
-                # Suavizado
+                # Suavizado, con feed-forward de velocidad: se parte de donde estaría el último
+                # comando si hubiera seguido al avión, así el filtro no se queda atrás en los pasos.
+                # Sólo con una velocidad predicha en este ciclo, nunca la de un dict anterior
                 if last_az is not None and stg["alpha"] < 1.0:
-                    az = (last_az + stg["alpha"] * wrap_az_delta(az, last_az)) % 360.0
-                    el = last_el + stg["alpha"] * (el - last_el)
+                    ff = now - last_sample_ts if tgt.get("_rate_ts") == now else 0.0
+                    base_az = last_az + tgt.get("az_rate", 0.0) * ff
+                    base_el = last_el + tgt.get("el_rate", 0.0) * ff
+                    az = (base_az + stg["alpha"] * wrap_az_delta(az, base_az)) % 360.0
+                    el = base_el + stg["alpha"] * (el - base_el)
                 # Offset de calibración
                 az_cmd = (az + off["az"]) % 360.0
                 el_cmd = el + off["el"]
@@ -369,6 +397,7 @@ input,select{padding:6px 8px;border:1px solid #ccc;border-radius:8px}
     <div class="row">min_dwell_s <input id="min_dwell_s" class="num" type="number" step="0.5"></div>
     <div class="row">switch_margin_km <input id="switch_margin_km" class="num" type="number" step="0.1"></div>
     <div class="row">predict_hold_s <input id="predict_hold_s" class="num" type="number" step="0.5"></div>
+    <div class="row">mount_latency_s <input id="mount_latency_s" class="num" type="number" step="0.05"></div>
     <div style="margin-top:6px"><button onclick="save()">Guardar</button></div>
   </div>
   <div class="card">
@@ -440,7 +469,7 @@ async function load(){
   document.getElementById('offel').textContent = (st.offset.el).toFixed(2);
 
   const s = st.settings;
-  ['min_el','max_ground','deadband','alpha','hz','min_dwell_s','switch_margin_km','predict_hold_s'].forEach(k=>{
+  ['min_el','max_ground','deadband','alpha','hz','min_dwell_s','switch_margin_km','predict_hold_s','mount_latency_s'].forEach(k=>{
     document.getElementById(k).value = s[k];
   });
 
@@ -480,7 +509,8 @@ async function unlock(){ await fetch('/api/unlock',{method:'POST'}); }
 async function save(){
   const s = {
     min_el:+min_el.value, max_ground:+max_ground.value, deadband:+deadband.value, alpha:+alpha.value, hz:+hz.value,
-    min_dwell_s:+min_dwell_s.value, switch_margin_km:+switch_margin_km.value, predict_hold_s:+predict_hold_s.value
+    min_dwell_s:+min_dwell_s.value, switch_margin_km:+switch_margin_km.value, predict_hold_s:+predict_hold_s.value,
+    mount_latency_s:+mount_latency_s.value
   };
   await fetch('/api/settings',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify(s)});
 }
@@ -512,6 +542,9 @@ def api_status():
             "site": state["site"],
             "rot_host": state["rot_host"],
             "rot_port": state["rot_port"],
+            "rotctl": rot_client(state["rot_host"], state["rot_port"]).stats(),
+            "feed": state["feed"].stats() if state["feed"] else None,
+            "predict": state["predict_stats"],
             "settings": state["settings"],
             "offset": state["offset"],
             "lock_hex": state["lock_hex"],
@@ -562,7 +595,7 @@ def api_settings():
     data = request.get_json(force=True)
     with lock:
         s = state["settings"]
-        for k in ("min_el","max_ground","deadband","alpha","hz","min_dwell_s","switch_margin_km","predict_hold_s"):
+        for k in ("min_el","max_ground","deadband","alpha","hz","min_dwell_s","switch_margin_km","predict_hold_s","mount_latency_s"):
             if k in data and data[k] is not None:
                 s[k] = float(data[k])
     return jsonify({"ok": True, "settings": state["settings"]})
@@ -610,8 +643,8 @@ def api_goto():
     with lock:
         rot_host, rot_port = state["rot_host"], state["rot_port"]
     try:
-        send_rotctld(rot_host, rot_port, az, el)
-        return jsonify({"ok": True})
+        code = rot_client(rot_host, rot_port).set_position(az, el)
+        return jsonify({"ok": code == 0, "rprt": code})
     except Exception as e:
         return jsonify({"ok": False, "error": str(e)})
 
@@ -621,6 +654,8 @@ def metrics():
     with lock:
         t = state["current_target"]
         s = state["settings"]
+        acs = state["aircrafts"]
+        pst = state["predict_stats"]
     lines = []
     lines.append("# HELP tracker_target_present 1 si hay target actual")
     lines.append("# TYPE tracker_target_present gauge")
@@ -634,13 +669,46 @@ def metrics():
         lines.append(f"tracker_target_gnd_km {t['gnd_km']:.3f}")
         lines.append("# TYPE tracker_target_radial_mps gauge")
         lines.append(f"tracker_target_radial_mps {t.get('radial_mps',0.0):.3f}")
+        if "az_rate" in t:
+            lines.append("# TYPE tracker_target_az_rate gauge")
+            lines.append(f"tracker_target_az_rate {t['az_rate']:.4f}")
+            lines.append("# TYPE tracker_target_el_rate gauge")
+            lines.append(f"tracker_target_el_rate {t['el_rate']:.4f}")
+    # Error de predicción frente al fix siguiente, por avión candidato
+    for name, key in (("m", "pred_err_m"), ("deg", "pred_err_deg"), ("horizon_s", "pred_err_horizon_s")):
+        lines.append(f"# TYPE tracker_predict_error_{name} gauge")
+        for a in acs:
+            if key in a:
+                target = 1 if t and t.get("hex") == a["hex"] else 0
+                lines.append(f'tracker_predict_error_{name}{{hex="{a["hex"]}",target="{target}"}} {a[key]:.4f}')
+    if pst:
+        for q in ("p50", "p90"):
+            lines.append(f"# TYPE tracker_predict_error_{q}_m gauge")
+            lines.append(f"tracker_predict_error_{q}_m {pst[q + '_m']:.3f}")
+            lines.append(f"# TYPE tracker_predict_error_{q}_deg gauge")
+            lines.append(f"tracker_predict_error_{q}_deg {pst[q + '_deg']:.4f}")
     lines.append("# TYPE tracker_settings_hz gauge")
     lines.append(f"tracker_settings_hz {s['hz']}")
+    with rot_clients_lock:
+        clients = list(rot_clients.values())
+    for client in clients:
+        st = client.stats()
+        label = f'rotctld="{st["host"]}"'
+        lines.append("# TYPE tracker_rotctl_rtt_ms gauge")
+        for q in ("p50", "p90", "max"):
+            if st["rttMs"][q] is not None:
+                lines.append(f'tracker_rotctl_rtt_ms{{{label},quantile="{q}"}} {st["rttMs"][q]}')
+        lines.append("# TYPE tracker_rotctl_connected gauge")
+        lines.append(f"tracker_rotctl_connected{{{label}}} {1 if st['connected'] else 0}")
+        for name in ("requests", "connects", "errors", "coalesced"):
+            lines.append(f"# TYPE tracker_rotctl_{name}_total counter")
+            lines.append(f"tracker_rotctl_{name}_total{{{label}}} {st[name]}")
     return Response("\n".join(lines)+"\n", mimetype="text/plain; version=0.0.4")
 
 def main():
     ap = argparse.ArgumentParser()
-    ap.add_argument("--adsb", required=True, help="URL o ruta de aircraft.json (p.ej. http://192.168.1.156:8080/data/aircraft.json)")
+    ap.add_argument("--adsb", required=True, help="URL o ruta de aircraft.json (p.ej. http://192.168.1.156:8080/data/aircraft.json), "
+                         "o streaming sbs://host:30003 / beast://host:30005 (sbs:///rec.txt, beast:///rec.bin reproducen una grabación)")
     ap.add_argument("--rot-host", default="127.0.0.1")
     ap.add_argument("--rot-port", type=int, default=4533)
     ap.add_argument("--site-lat", type=float, required=True)
@@ -656,6 +724,7 @@ def main():
     ap.add_argument("--min-dwell-s", type=float, default=8.0)
     ap.add_argument("--switch-margin-km", type=float, default=3.0)
     ap.add_argument("--predict-hold-s", type=float, default=8.0)
+    ap.add_argument("--mount-latency-s", type=float, default=0.5, help="latencia rotctld + montura a compensar (s)")
     args = ap.parse_args()
 
     with lock:
@@ -667,7 +736,7 @@ def main():
             "hz": args.hz, "min_el": args.min_el, "max_ground": args.max_ground,
             "deadband": args.deadband, "alpha": args.alpha,
             "min_dwell_s": args.min_dwell_s, "switch_margin_km": args.switch_margin_km,
-            "predict_hold_s": args.predict_hold_s
+            "predict_hold_s": args.predict_hold_s, "mount_latency_s": args.mount_latency_s
         }
 
     t = threading.Thread(target=tracker_loop, daemon=True)
@@ -3,8 +3,8 @@ import cv2
 import time
 from threading import Thread
 import socket
-import struct
 import serial
+from packets import ANGLES
 
 
 class FrameServer:
@@ -78,7 +78,7 @@ def udp_receiver(server):
             if len(data) >= 12:
                 packet_id = data[2]
                 if packet_id == 33:
-                    azimut, elevacion = struct.unpack_from('<ff', data, offset=4)
+                    azimut, elevacion = ANGLES.decode(data, 4)
                     server.update_values(azimut, elevacion)
         except Exception as e:
             print(f"Error en UDP receiver: {e}")
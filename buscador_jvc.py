@@ -3,9 +3,13 @@ import cv2
 import time
 from threading import Thread
 import socket
-import struct
 import serial
 from flask_socketio import SocketIO, emit
+from streaming import JpegBroadcaster, MJPEG_MIMETYPE, preview_options
+from packets import ANGLES, OMEGAS, encode_joystick
+from telemetry_bus import open_telemetry_reader, SAMPLE_ANGLES, SAMPLE_OMEGAS
+from telemetry_history import PoseHistory
+from clock_sync import monotonic_to_wall
 # --- Sitio / metadatos ---
 SITE_LAT = 46.532308
 SITE_LON = 6.590961   # Este positivo
@@ -62,7 +66,7 @@ def _gmst_rad_from_jd(jd):
     gmst = gmst % 360.0
     return _deg2rad(gmst)
 
-def altaz_to_radec_pi(az_deg, el_deg, lat_deg=SITE_LAT, lon_deg=SITE_LON):
+def altaz_to_radec_pi(az_deg, el_deg, lat_deg=SITE_LAT, lon_deg=SITE_LON, now_ms=None):
     az  = _deg2rad(az_deg)
     alt = _deg2rad(el_deg)
     lat = _deg2rad(lat_deg)
@@ -81,8 +85,9 @@ def altaz_to_radec_pi(az_deg, el_deg, lat_deg=SITE_LAT, lon_deg=SITE_LON):
     sinH = -math.sin(az)*math.cos(alt) / (math.cos(dec) + 1e-12)
     H = math.atan2(sinH, cosH)
 
-    # UTC real de la Pi
-    now_ms = int(time.time() * 1000)
+    # UTC real de la Pi (o el instante dado, p.ej. la exposición de un frame)
+    if now_ms is None:
+        now_ms = int(time.time() * 1000)
     jd  = _jd_from_unix_ms(now_ms)
     gmst = _gmst_rad_from_jd(jd)
     lst  = gmst + lon
@@ -115,14 +120,8 @@ def send_udp_packet(packet: bytes):
             raise
 
 def create_packet(x, y, throttle, trigger):
-    # MISMO layout que joysti_virtual.py (nativo). Si tu receptor espera little-endian, cambia por '<iiiiiiff'
-    joystick_data = struct.pack(
-        'iiiiiiff', 1, int(trigger), int(x * 100), int(y * 100), 0, 99, float(throttle), 30.0
-    )
-    encoded_packet = bytes([PRA, PRB, 1, len(joystick_data)]) + joystick_data
-    checksum = sum(joystick_data) & 0xFF
-    encoded_packet += bytes([checksum])
-    return encoded_packet
+    # MISMO layout que joysti_virtual.py (ver packets.encode_joystick, little-endian)
+    return encode_joystick(x, y, throttle, trigger)
 
 # ======= Video =======
 # ======= Video =======
@@ -142,6 +141,9 @@ class FrameServer:
         # Telemetría de montura
         self.azimut = None
         self.elevacion = None
+        # Historia de pose y hora de captura del último frame, en CLOCK_MONOTONIC
+        self.history = PoseHistory()
+        self.frame_time = None
 
         # Último tracklet recibido
         self.ra_deg = None
@@ -207,13 +209,15 @@ class FrameServer:
             self.dec_deg = None
         self.ts_iso = ts_iso or ""
 
-    # Generación de frame con overlay
-    def get_frame(self):
+    # Generación de frame con overlay (imagen sin comprimir)
+    def render_frame(self):
         if not self.running:
             return None
         ret, frame = self.cap.read()
         if not ret:
             return None
+        # La JVC por V4L2/OpenCV no da timestamp de sensor, se usa el fin de la lectura
+        self.frame_time = time.monotonic()
 
         frame_height, _ = frame.shape[:2]
 
@@ -262,16 +266,33 @@ class FrameServer:
         )
         cv2.putText(frame, txt_w, (10, y),
                     cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
-
-        _, buffer = cv2.imencode('.jpg', frame)
-        return buffer.tobytes()
+        return frame
 
     def stop(self) -> None:
         self.running = False
         self.cap.release()
 
 # ======= UDP RX (telemetría para azimut/elevación) =======
-def udp_receiver(server: FrameServer):
+def telemetry_packets(server: FrameServer):
+    """
+    (packet id, t, valores) de la telemetría de la Teensy, 33 -> (az, el) y
+    34 -> (wcmd_az, wcmd_el, wmeas_az, wmeas_el), t en CLOCK_MONOTONIC (s) de
+    la recepción. Lee el bus en memoria compartida del hub si está corriendo,
+    si no escucha el puerto UDP del fan-out.
+    """
+    bus = open_telemetry_reader()
+    if bus is not None:
+        print("[BUS RX] Telemetría desde el bus del hub")
+        for sample in bus.follow():
+            if not server.running:
+                break
+            if sample["flags"] & SAMPLE_ANGLES:
+                yield PACKET_ID_ANGLE, float(sample["t_mono"]), (float(sample["az"]), float(sample["el"]))
+            if sample["flags"] & SAMPLE_OMEGAS:
+                yield PACKET_ID_OMEGAS, float(sample["t_mono"]), (float(sample["wcmd_az"]), float(sample["wcmd_el"]), float(sample["wmeas_az"]), float(sample["wmeas_el"]))
+        bus.close()
+        return
+
     #udp_ip = '0.0.0.0'
     #udp_port = 8888
     udp_ip = '127.0.0.1'    # recpcion teensy
@@ -284,9 +305,36 @@ def udp_receiver(server: FrameServer):
         pass
     sock.bind((udp_ip, udp_port))
     print(f"[UDP RX] Escuchando en {udp_ip}:{udp_port} ...")
-    ...
 
+    while server.running:
+        try:
+            data, _ = sock.recvfrom(4096)
+            if not data:
+                continue
+
+            # --- Paquete 33: <ff> az, el ---
+            if len(data) >= 12 and data[2] == PACKET_ID_ANGLE:
+                yield PACKET_ID_ANGLE, time.monotonic(), tuple(ANGLES.decode(data, 4))
+
+            # --- Paquete 34: <ffff> wcmd_az, wcmd_el, wmeas_az, wmeas_el ---
+            elif len(data) >= 4 + 16 and data[2] == PACKET_ID_OMEGAS:
+                plen = data[3]
+                if plen >= 16 and len(data) >= 4 + plen:
+                    payload  = data[4:4+plen]
+                    recv_chk = data[4+plen] if len(data) >= 5 + plen else None
+                    if recv_chk is None or ((sum(payload) & 0xFF) != recv_chk):
+                        print("[UDP RX][ω] checksum inválido")
+                    else:
+                        yield PACKET_ID_OMEGAS, time.monotonic(), tuple(OMEGAS.decode(payload))
 
+            # (Ignoramos cualquier otra cosa)
+        except Exception as e:
+            print(f"[UDP RX] Error: {e}")
+
+    sock.close()
+
+
+def udp_receiver(server: FrameServer):
     # Estado para gating (RA/Dec -> JSONL/UI)
     last_send_ms = 0
     last_hb_ms   = 0
@@ -299,19 +347,18 @@ def udp_receiver(server: FrameServer):
     last_t_ms = None
     EMA_ALPHA = 0.2  # suavizado de ωmeas
 
-    while server.running:
-        try:
-            data, _ = sock.recvfrom(4096)
-            if not data:
-                continue
+    last_frame_time = None
 
-            # --- Paquete 33: <ff> az, el ---
-            if len(data) >= 12 and data[2] == PACKET_ID_ANGLE:
-                azimut, elevacion = struct.unpack_from('<ff', data, offset=4)
+    for pkt_id, t, values in telemetry_packets(server):
+        try:
+            # --- Paquete 33: az, el ---
+            if pkt_id == PACKET_ID_ANGLE:
+                azimut, elevacion = values
                 server.update_values(azimut, elevacion)
+                server.history.add(t, azimut, elevacion)
 
                 # ωmeas (deg/s) con wrap en Az (359->0)
-                now_ms = int(time.time() * 1000)
+                now_ms = int(t * 1000)
                 if last_az is not None and last_el is not None and last_t_ms is not None:
                     dt = max(1e-3, (now_ms - last_t_ms) / 1000.0)
                     delta_az = (azimut - last_az) % 360.0
@@ -325,7 +372,16 @@ def udp_receiver(server: FrameServer):
                 last_az, last_el, last_t_ms = azimut, elevacion, now_ms
 
                 # RA/Dec con UTC de la Pi -> SIEMPRE refresca overlay
-                ra_deg, dec_deg, now_ms = altaz_to_radec_pi(azimut, elevacion)
+                # Con un frame nuevo, pose de la montura en su captura (no la última recibida)
+                tr_az, tr_el, tr_t = azimut, elevacion, t
+                frame_time = server.frame_time
+                if frame_time is not None and frame_time != last_frame_time:
+                    frame_pose = server.history.pose_at(frame_time)
+                    if frame_pose is not None:
+                        tr_az, tr_el = frame_pose
+                        tr_t = frame_time
+                        last_frame_time = frame_time
+                ra_deg, dec_deg, now_ms = altaz_to_radec_pi(tr_az, tr_el, now_ms=int(monotonic_to_wall(tr_t) * 1000))
                 ts_iso = iso8601_from_ms(now_ms)
                 server.update_tracklet(ra_deg, dec_deg, ts_iso)
 
@@ -356,8 +412,8 @@ def udp_receiver(server: FrameServer):
                         "instrument_id": INSTRUMENT_ID,
                         "exp_ms": EXP_MS,
                         "seeing_arcsec": SEEING_ARCSEC,
-                        "az_deg": float(f"{((azimut % 360) + 360) % 360:.2f}"),
-                        "el_deg": float(f"{elevacion:.2f}"),
+                        "az_deg": float(f"{((tr_az % 360) + 360) % 360:.2f}"),
+                        "el_deg": float(f"{tr_el:.2f}"),
                         "source": "pi",
                         # ωcmd: fallback desde joystick o sobrescrito por paquete 34
                         "wcmd_az_deg_s":  float(f"{server.v_cmd_az:.3f}"),
@@ -372,26 +428,15 @@ def udp_receiver(server: FrameServer):
                         f.write(json.dumps(obj) + "\n")
                     socketio.emit('tracklet', obj)
 
-            # --- Paquete 34: <ffff> wcmd_az, wcmd_el, wmeas_az, wmeas_el ---
-            elif len(data) >= 4 + 16 and data[2] == PACKET_ID_OMEGAS:
-                plen = data[3]
-                if plen >= 16 and len(data) >= 4 + plen:
-                    payload  = data[4:4+plen]
-                    recv_chk = data[4+plen] if len(data) >= 5 + plen else None
-                    if recv_chk is None or ((sum(payload) & 0xFF) != recv_chk):
-                        print("[UDP RX][ω] checksum inválido")
-                    else:
-                        v_cmd_az, v_cmd_el, v_meas_az, v_meas_el = struct.unpack_from('<ffff', payload, offset=0)
-                        server.update_command_speed(v_cmd_az, v_cmd_el)
-                        server.update_measured_speed(v_meas_az, v_meas_el)
-                        # print(f"[ω] cmd=({v_cmd_az:+.2f},{v_cmd_el:+.2f}) meas=({v_meas_az:+.2f},{v_meas_el:+.2f})")
-
-            # (Ignoramos cualquier otra cosa)
+            # --- Paquete 34: wcmd_az, wcmd_el, wmeas_az, wmeas_el ---
+            elif pkt_id == PACKET_ID_OMEGAS:
+                v_cmd_az, v_cmd_el, v_meas_az, v_meas_el = values
+                server.update_command_speed(v_cmd_az, v_cmd_el)
+                server.update_measured_speed(v_meas_az, v_meas_el)
+                # print(f"[ω] cmd=({v_cmd_az:+.2f},{v_cmd_el:+.2f}) meas=({v_meas_az:+.2f},{v_meas_el:+.2f})")
         except Exception as e:
             print(f"[UDP RX] Error: {e}")
 
-    sock.close()
-
 
 
 # ======= Flask / Socket.IO =======
@@ -400,6 +445,8 @@ socketio = SocketIO(app, cors_allowed_origins="*", async_mode="threading")
 
 video_device = '/dev/video0'
 server = FrameServer(video_device)
+# Un solo hilo lee la cámara y codifica el JPEG para todos los clientes
+broadcaster = JpegBroadcaster(server.render_frame, maxFps=server.frame_rate, quality=95)
 
 # ======= Arduino (zoom analógico) =======
 arduino_port = '/dev/ttyACM0'
@@ -442,14 +489,7 @@ def set_zoom():
 
 @app.route('/video_feed')
 def video_feed():
-    def generate():
-        while server.running:
-            frame = server.get_frame()
-            if frame is None:
-                break
-            yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
-    return Response(generate(), mimetype='multipart/x-mixed-replace; boundary=frame')
+    return Response(broadcaster.stream(*preview_options(request.args)), mimetype=MJPEG_MIMETYPE)
 
 # ======= Socket.IO (Joystick) =======
 @socketio.on('joystick_update')
@@ -1,7 +1,10 @@
-import cv2, numpy as np, time, threading, socket, struct, json, traceback, serial, os
+import cv2, numpy as np, time, threading, socket, json, traceback, serial, os
 from pathlib import Path
 from flask import Flask, Response, request, jsonify, render_template
 from flask_socketio import SocketIO
+from streaming import JpegBroadcaster, MJPEG_MIMETYPE, preview_options
+from packets import ANGLES, OMEGAS, encode_joystick
+from telemetry_bus import open_telemetry_reader, SAMPLE_ANGLES, SAMPLE_OMEGAS
 
 # ================== Config ==================
 PRA, PRB = 0xFF, 0xFA
@@ -163,12 +166,31 @@ def send_udp_packet(pkt, tag=""):
         print("[UDP-TX][ERR]", e, flush=True)
 
 def pkt_joy_units(x_units, y_units, throttle, trigger):
-    payload = struct.pack("iiiiiiff", 1, int(trigger), int(x_units*100), int(y_units*100), 0, 99, float(throttle), 30.0)
-    pkt = bytes([PRA, PRB, 1, len(payload)]) + payload
-    pkt += bytes([sum(payload) & 0xFF])
-    return pkt
+    return encode_joystick(x_units, y_units, throttle, trigger)
+
+def bus_rx_loop(bus):
+    # Misma telemetría que udp_rx_loop, leída del bus en memoria compartida del hub
+    print("[BUS-RX] telemetría desde el bus del hub", flush=True)
+    last = time.time(); cnt = 0
+    for sample in bus.follow():
+        cnt += 1
+        with telemetry_lock:
+            if sample["flags"] & SAMPLE_ANGLES:
+                telemetry["az"], telemetry["el"] = float(sample["az"]), float(sample["el"])
+            if sample["flags"] & SAMPLE_OMEGAS:
+                telemetry["wcmd_az"], telemetry["wcmd_el"] = float(sample["wcmd_az"]), float(sample["wcmd_el"])
+                telemetry["wmeas_az"], telemetry["wmeas_el"] = float(sample["wmeas_az"]), float(sample["wmeas_el"])
+        if time.time() - last > 2.0:
+            with telemetry_lock:
+                print(time.strftime("[%H:%M:%S]"),
+                      f"[BUS-RX] Az/El={telemetry['az']}/{telemetry['el']} wmeas={telemetry['wmeas_az']}/{telemetry['wmeas_el']} pkts/2s={cnt}",
+                      flush=True)
+            last = time.time(); cnt = 0
 
 def udp_rx_loop():
+    bus = open_telemetry_reader() if USE_HUB else None
+    if bus is not None:
+        return bus_rx_loop(bus)
     print(f"[UDP-RX] bind {UDP_RX_BIND_IP}:{UDP_RX_PORT}", flush=True)
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
@@ -185,7 +207,7 @@ def udp_rx_loop():
             if not data or len(data) < 4: continue
             pkt_id = data[2]
             if pkt_id == PACKET_ID_ANGLE and len(data) >= 12:
-                az, el = struct.unpack_from("<ff", data, offset=4)
+                az, el = ANGLES.decode(data, 4)
                 with telemetry_lock:
                     telemetry["az"], telemetry["el"] = float(az), float(el)
             elif pkt_id == PACKET_ID_OMEGAS and len(data) >= 4 + 16:
@@ -193,7 +215,7 @@ def udp_rx_loop():
                 if plen >= 16 and len(data) >= 4 + plen + 1:
                     payload = data[4:4+plen]; chk = data[4+plen]
                     if (sum(payload) & 0xFF) == chk:
-                        wcmd_az, wcmd_el, wmeas_az, wmeas_el = struct.unpack_from("<ffff", payload, 0)
+                        wcmd_az, wcmd_el, wmeas_az, wmeas_el = OMEGAS.decode(payload)
                         with telemetry_lock:
                             telemetry["wcmd_az"], telemetry["wcmd_el"] = float(wcmd_az), float(wcmd_el)
                             telemetry["wmeas_az"], telemetry["wmeas_el"] = float(wmeas_az), float(wmeas_el)
@@ -407,30 +429,20 @@ def index():
 def legacy_index():
     return render_template("Ojvc_index.html")
 
+def render_preview():
+    frm = cam.read()
+    if frm is None:
+        time.sleep(0.01)
+        return None
+    return draw_overlay(frm)
+
+# Un solo hilo dibuja y codifica el JPEG para todos los clientes de /video_feed
+PREVIEW_MAX_FPS = 25
+broadcaster = JpegBroadcaster(render_preview, maxFps=PREVIEW_MAX_FPS, quality=85)
+
 @app.route("/video_feed")
 def video_feed():
-    def generate():
-        last = time.time()
-        while True:
-            try:
-                frm = cam.read()
-                if frm is None:
-                    time.sleep(0.01)
-                    continue
-                frm = draw_overlay(frm)
-                ok, jpg = cv2.imencode(".jpg", frm, [int(cv2.IMWRITE_JPEG_QUALITY), 85])
-                if not ok:
-                    continue
-                yield (b"--frame\r\n"
-                       b"Content-Type: image/jpeg\r\n\r\n" + jpg.tobytes() + b"\r\n")
-                if time.time() - last > 2.0:
-                    print(time.strftime("[%H:%M:%S]"), "[HTTP] mjpeg OK", flush=True)
-                    last = time.time()
-            except GeneratorExit:
-                print("[HTTP] video client gone", flush=True); break
-            except Exception as e:
-                print("[HTTP][ERR] video loop:", e, flush=True); time.sleep(0.05)
-    return Response(generate(), mimetype="multipart/x-mixed-replace; boundary=frame")
+    return Response(broadcaster.stream(*preview_options(request.args)), mimetype=MJPEG_MIMETYPE)
 
 def _snapshot_bytes():
     frm = cam.read()
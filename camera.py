@@ -1,46 +1,94 @@
+import io
 import time
 from threading import Condition, Thread
 from picamera2 import Picamera2
 from libcamera import Transform
+from clock_sync import ClockSync
+from detection import ResultPublisher
 
 # === Instancia global única ===
 picam2 = Picamera2()
+# SensorTimestamp -> CLOCK_MONOTONIC, every frame timestamp of this module goes through it
+sensorClock = ClockSync()
 
 
 # === Clase para servir frames de forma asíncrona ===
-class FrameServer:
-    def __init__(self, picam2, stream='main'):
+class FrameServer(ResultPublisher):
+    """
+    Serves the latest frame of a stream, with its SensorTimestamp converted to
+    CLOCK_MONOTONIC ns (sensorClock). With grayStream set (a YUV420 stream,
+    normally 'lores'), the Y plane of that stream is also served as grayscale
+    for detection, and the colour stream is only copied out of the request
+    while at least one colour client (video preview) is registered. The Y
+    plane is not zero-copy: make_array copies the YUV420 buffer (1.5 bytes
+    per pixel) so the request can be released straight away, it only saves
+    the BGR copy and the colour conversion.
+    """
+    def __init__(self, picam2, stream='main', grayStream=None):
         self._picam2 = picam2
         self._stream = stream
+        self._grayStream = grayStream
         self._array = None
+        self._gray = None
         self._timestamp = None
+        self._arrival = None
         self._condition = Condition()
         self._running = True
         self._count = 0
+        self._colourClients = 0
+        self._init_results()
+        self._graySize = None
         self._thread = Thread(target=self._thread_func, daemon=True)
 
     @property
     def count(self):
         return self._count
 
+    @property
+    def arrival(self):
+        """CLOCK_MONOTONIC ns at which the latest frame came out of capture_request()."""
+        return self._arrival
+
     def start(self):
+        if self._grayStream is not None:
+            self._graySize = self._picam2.camera_configuration()[self._grayStream]["size"]
         self._thread.start()
 
     def stop(self):
         self._running = False
         self._thread.join()
 
+    def add_colour_client(self):
+        with self._condition:
+            self._colourClients += 1
+
+    def remove_colour_client(self):
+        with self._condition:
+            self._colourClients = max(0, self._colourClients - 1)
+
     def _thread_func(self):
         while self._running:
             request = self._picam2.capture_request()
-            array = request.make_array(self._stream)
+            arrival = time.monotonic_ns()
+            gray = None
+            if self._grayStream is not None:
+                # YUV420 comes as a (h*3/2, w) array (a copy of the buffer), the first h rows are the Y plane
+                width, height = self._graySize
+                gray = request.make_array(self._grayStream)[:height, :width]
+            array = None
+            if self._grayStream is None or self._colourClients > 0:
+                array = request.make_array(self._stream)
             metadata = request.get_metadata()
             request.release()
 
             self._count += 1
             with self._condition:
-                self._array = array
-                self._timestamp = metadata['SensorTimestamp']
+                if array is not None:
+                    self._array = array
+                if gray is not None:
+                    self._gray = gray
+                self._timestamp = sensorClock.stamp(metadata['SensorTimestamp'], arrival)
+                self._arrival = arrival
                 self._condition.notify_all()
 
     def wait_for_frame(self, previous=None):
@@ -52,6 +100,67 @@ class FrameServer:
                 if self._array is not previous:
                     return self._array, self._timestamp
 
+    def wait_for_gray(self, previous=None):
+        with self._condition:
+            if previous is not None and self._gray is not previous:
+                return self._gray, self._timestamp
+            while True:
+                self._condition.wait()
+                if self._gray is not previous:
+                    return self._gray, self._timestamp
+
+
+# === JPEG por hardware sobre un stream de la cámara ===
+class HardwareMjpegStream(io.BufferedIOBase):
+    """
+    Runs the picamera2 MJPEG encoder on a stream (normally the YUV420 'lores'),
+    so the preview JPEG costs no CPU encode and no BGR copy. The encoder sees
+    the raw stream, so these frames carry no overlay. Needs the V4L2 hardware
+    encoder (Pi 4 and older), start() raises where it is not available.
+    """
+    def __init__(self, picam2, stream='lores', quality=90):
+        self._picam2 = picam2
+        self._stream = stream
+        self._quality = quality
+        self._encoder = None
+        self._jpeg = None
+        self._condition = Condition()
+
+    @property
+    def running(self):
+        return self._encoder is not None
+
+    def start(self):
+        from picamera2.encoders import MJPEGEncoder, Quality
+        from picamera2.outputs import FileOutput
+
+        if self._quality >= 90:
+            quality = Quality.VERY_HIGH
+        elif self._quality >= 75:
+            quality = Quality.HIGH
+        else:
+            quality = Quality.MEDIUM
+        encoder = MJPEGEncoder()
+        self._picam2.start_encoder(encoder, FileOutput(self), quality=quality, name=self._stream)
+        self._encoder = encoder
+
+    def stop(self):
+        if self._encoder is not None:
+            self._picam2.stop_encoder(self._encoder)
+            self._encoder = None
+
+    def write(self, buf):
+        with self._condition:
+            self._jpeg = bytes(buf)
+            self._condition.notify_all()
+
+    def wait_for_jpeg(self, previous=None, timeout=None):
+        with self._condition:
+            if self._jpeg is not previous:
+                return self._jpeg
+            self._condition.wait(timeout)
+            return self._jpeg if self._jpeg is not previous else None
+
 
 # === Calculadora de promedio móvil para FPS ===
 class MovingAverageCalculator:
@@ -81,11 +190,14 @@ prev_time_sec = 0
 
 
 # === Inicialización principal de cámara ===
-def camInit(framerate, vFlipSet, hFlipSet):
+def camInit(framerate, vFlipSet, hFlipSet, grayStream=False):
     global picam2
 
+    # grayStream adds a YUV420 'lores' stream whose Y plane is used for detection
+    lores = {"format": "YUV420", "size": (800, 606)} if grayStream else None
     camera_config = picam2.create_video_configuration(
         main={"format": "BGR888", "size": (800, 606)},
+        lores=lores,
         raw={"format": "SRGGB10", "size": (800, 606)},
         transform=Transform(hflip=hFlipSet, vflip=vFlipSet)
     )
@@ -122,19 +234,21 @@ def camInit180(framerate):
 # === Obtener frame principal ===
 def getFrame():
     request = picam2.capture_request()
+    arrival = time.monotonic_ns()
     frame = request.make_array("main")
     metadata = request.get_metadata()
     request.release()
-    return frame, metadata['SensorTimestamp']
+    return frame, sensorClock.stamp(metadata['SensorTimestamp'], arrival)
 
 
 # === Obtener frame de baja resolución ===
 def getFrameLores():
     request = picam2.capture_request()
+    arrival = time.monotonic_ns()
     frame = request.make_array("lores")
     metadata = request.get_metadata()
     request.release()
-    return frame, metadata['SensorTimestamp']
+    return frame, sensorClock.stamp(metadata['SensorTimestamp'], arrival)
 
 
 # === Mostrar FPS calculado ===
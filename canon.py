@@ -60,7 +60,7 @@ class FrameServerCanon:
                 self._count += 1
                 with self._condition:
                     self._array = array
-                    # timestamp is time since start of code in nanoseconds
+                    # Stamped on arrival in CLOCK_MONOTONIC ns (the Canon has no sensor clock)
                     self._timestamp = time.monotonic_ns()
                     self._condition.notify_all()
             except:
@@ -6,6 +6,7 @@ import numpy as np
 import os
 import subprocess
 import re
+from detection import ResultPublisher
 
 # Función para detectar automáticamente el dispositivo Cam Link 4K
 def get_camlink_device():
@@ -34,7 +35,7 @@ def get_camlink_device():
 
 
 # Clase FrameServerCanon
-class FrameServerCanon:
+class FrameServerCanon(ResultPublisher):
     def __init__(self, video_device='/dev/video0'):
         """
         Inicializa el servidor de frames con el dispositivo de video especificado.
@@ -48,6 +49,7 @@ class FrameServerCanon:
         self._condition = Condition()
         self._running = True
         self._count = 0
+        self._init_results()
         self._thread = Thread(target=self._thread_func, daemon=True)
 
     @property
@@ -72,6 +74,7 @@ class FrameServerCanon:
                 self._count += 1
                 with self._condition:
                     self._array = array
+                    # Stamped on arrival in CLOCK_MONOTONIC ns (no sensor clock)
                     self._timestamp = time.monotonic_ns()
                     self._condition.notify_all()
             except Exception as e:
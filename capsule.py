@@ -84,3 +84,121 @@ class Capsule:
 
         packetOut[lenIn + 4] = check_sum
         return packetOut
+
+class CapsuleCodec:
+    """
+    Same protocol and callback API as Capsule, but decodes whole buffers
+    (a UDP datagram, a serial read) at once instead of one byte per call.
+    Preambles are found with bytes.find and checksums are summed on slices.
+    decode() returns the list of (packetId, payload) frames where the payload
+    is a memoryview into the received buffer, so nothing is copied unless a
+    packet is split across two buffers, then its beginning is kept until the
+    rest arrives.
+    """
+    def __init__(self, function=None, PRAIn=PRA_DEFAULT, PRBIn=PRB_DEFAULT):
+        self.PRA = PRAIn
+        self.PRB = PRBIn
+        self.preamble = bytes((PRAIn, PRBIn))
+        self.functionCallBack = function
+        self.classPtr = None
+        self.pending = b''
+        self.badChecksums = 0
+
+    def set_callback_class(self, function, tptrIn):
+        self.functionCallBackClass = function
+        self.classPtr = tptrIn
+
+    def get_coded_len(self, lenIn):
+        return lenIn + ADDITIONAL_BYTES
+
+    def reset(self):
+        self.pending = b''
+
+    def decode(self, dataIn):
+        # A single int is still accepted, like Capsule.decode
+        if isinstance(dataIn, int):
+            dataIn = bytes((dataIn,))
+        elif isinstance(dataIn, memoryview):
+            dataIn = dataIn.tobytes()
+        if self.pending:
+            # Never extend a buffer that earlier payload views may still point to
+            dataIn = self.pending + dataIn
+            self.pending = b''
+
+        frames = []
+        view = memoryview(dataIn)
+        size = len(dataIn)
+        pos = 0
+        while True:
+            start = dataIn.find(self.preamble, pos)
+            if start < 0:
+                # The preamble itself may be cut between two buffers
+                if size > pos and dataIn[-1] == self.PRA:
+                    self.pending = bytes(dataIn[-1:])
+                break
+            if start + 4 > size:
+                self.pending = bytes(dataIn[start:])
+                break
+            packetId = dataIn[start + 2]
+            length = dataIn[start + 3]
+            end = start + 4 + length
+            if end >= size:
+                self.pending = bytes(dataIn[start:])
+                break
+            payload = view[start + 4:end]
+            if sum(payload) % 256 == dataIn[end]:
+                frames.append((packetId, payload))
+                pos = end + 1
+            else:
+                # Not a packet (or a corrupted one), look for the next preamble
+                self.badChecksums += 1
+                pos = start + 1
+
+        for packetId, payload in frames:
+            if self.classPtr:
+                self.classPtr.functionCallBackClass(packetId, payload, len(payload))
+            elif self.functionCallBack is not None:
+                self.functionCallBack(packetId, payload, len(payload))
+        return frames
+
+    def encode(self, packetId, packetIn, lenIn=None):
+        if lenIn is None:
+            lenIn = len(packetIn)
+        packetOut = bytearray(self.get_coded_len(lenIn))
+        packetOut[0] = self.PRA
+        packetOut[1] = self.PRB
+        packetOut[2] = packetId
+        packetOut[3] = lenIn
+        packetOut[4:lenIn + 4] = packetIn[:lenIn]
+        packetOut[lenIn + 4] = sum(packetOut[4:lenIn + 4]) % 256
+        return packetOut
+
+
+if __name__ == '__main__':
+    # Micro-benchmark: Capsule (one byte per call) against CapsuleCodec (whole datagram)
+    import struct
+    import timeit
+
+    received = []
+    callback = lambda packetId, dataIn, lenIn: received.append(packetId)
+    codec = CapsuleCodec(callback)
+    telemetry = codec.encode(33, struct.pack('ff', 123.4, 45.6))
+    pointList = codec.encode(0x02, bytes(range(160)))
+    datagram = bytes(telemetry + pointList) * 4
+    # Same bytes cut in two datagrams in the middle of a packet
+    split = len(datagram)//2 + 3
+
+    for name, decoder in (("Capsule", Capsule(callback)), ("CapsuleCodec", codec)):
+        received.clear()
+        if isinstance(decoder, CapsuleCodec):
+            run = lambda: (decoder.decode(datagram[:split]), decoder.decode(datagram[split:]))
+        else:
+            run = lambda: [decoder.decode(byte) for byte in datagram]
+        run()
+        assert received == [33, 0x02]*4, received
+        packets = len(received)
+        repeats = 2000
+        seconds = timeit.timeit(run, number=repeats)
+        print(f"{name:12s} {len(datagram)} bytes, {packets} packets: {seconds/repeats*1e6:8.1f} us per datagram")
+
+    assert bytes(codec.encode(0x02, bytes(range(160)))) == bytes(Capsule(None).encode(0x02, bytes(range(160)), 160))
@@ -0,0 +1,112 @@
+import threading
+import time
+from collections import deque
+import numpy as np
+
+# One lower envelope point per bucket, fit over the last CLOCK_WINDOW seconds
+CLOCK_BUCKET = 1.0
+CLOCK_WINDOW = 600.0
+# Offset jump that means the sensor clock was restarted (camera reopened)
+CLOCK_RESET = 1.0
+# Drift clamp, a real oscillator is well within this
+CLOCK_MAX_DRIFT = 500e-6
+
+class ClockSync:
+    """
+    Maps a sensor clock (e.g. SensorTimestamp, ns) to CLOCK_MONOTONIC (ns,
+    time.monotonic_ns()), continuously, so frame times do not drift away
+    from telemetry and command times over long sessions.
+
+    Every frame gives one observation, arrival (monotonic) - sensor time,
+    which is the clock offset plus a delivery delay that is never negative.
+    The smallest value of each CLOCK_BUCKET is kept (the frames that were
+    delivered the fastest) and a line (offset + drift) is fit to those minima,
+    rejecting buckets more than 3 MAD above the fit (e.g. a stalled second).
+    The minimum delivery delay cannot be told apart from the offset, pass it
+    as latency when it is known.
+    """
+    def __init__(self, latency=0.0, bucket=CLOCK_BUCKET, window=CLOCK_WINDOW):
+        self.latency = int(latency*1e9)
+        self.bucket = int(bucket*1e9)
+        self.minima = deque(maxlen=max(2, int(window/bucket)))
+        self.bucketStart = None
+        self.bucketMin = None
+        self.ref = None       # sensor ns the fit is relative to
+        self.offset = None    # ns, monotonic - sensor at ref
+        self.drift = 0.0      # ns per ns
+        self.residual = 0.0   # ns, MAD of the minima around the fit
+        self.observations = 0
+        self.resets = 0
+        self.lock = threading.Lock()
+
+    def observe(self, sensor_ns, host_ns=None):
+        """Add one frame, host_ns is the monotonic time it arrived (now by default)."""
+        if host_ns is None:
+            host_ns = time.monotonic_ns()
+        sensor_ns = int(sensor_ns)
+        delta = int(host_ns) - sensor_ns
+        with self.lock:
+            self.observations += 1
+            if self.offset is not None and abs(delta - self._offset_at(sensor_ns)) > CLOCK_RESET*1e9:
+                self.minima.clear()
+                self.bucketStart = None
+                self.offset = None
+                self.resets += 1
+            if self.bucketStart is None or sensor_ns - self.bucketStart >= self.bucket or sensor_ns < self.bucketStart:
+                if self.bucketStart is not None:
+                    self.minima.append(self.bucketMin)
+                    self._fit()
+                self.bucketStart = sensor_ns
+                self.bucketMin = (sensor_ns, delta)
+            elif delta < self.bucketMin[1]:
+                self.bucketMin = (sensor_ns, delta)
+            if self.offset is None or (len(self.minima) == 0 and delta < self.offset):
+                # Nothing fitted yet, the lowest offset so far
+                self.ref, self.offset, self.drift = sensor_ns, delta, 0.0
+
+    def _offset_at(self, sensor_ns):
+        return self.offset + self.drift*(sensor_ns - self.ref)
+
+    def _fit(self):
+        points = np.array(self.minima, dtype=np.float64)
+        ref = points[-1, 0]
+        x = (points[:, 0] - ref)/1e9
+        y = points[:, 1] - points[-1, 1]
+        keep = np.ones(len(x), dtype=bool)
+        for _ in range(2):
+            if keep.sum() >= 3 and np.ptp(x[keep]) > 0:
+                drift, offset = np.polyfit(x[keep], y[keep], 1)
+                drift = min(CLOCK_MAX_DRIFT*1e9, max(-CLOCK_MAX_DRIFT*1e9, drift))
+                offset = np.median(y[keep] - drift*x[keep])
+            else:
+                drift, offset = 0.0, np.min(y[keep])
+            residuals = y - (offset + drift*x)
+            mad = 1.4826*np.median(np.abs(residuals[keep] - np.median(residuals[keep])))
+            keep = residuals <= np.median(residuals[keep]) + 3*max(mad, 1e3)
+        self.ref = int(ref)
+        self.offset = int(points[-1, 1] + offset)
+        self.drift = float(drift)/1e9
+        self.residual = float(mad)
+
+    def to_monotonic(self, sensor_ns):
+        """Sensor time (ns) -> CLOCK_MONOTONIC ns, None before the first observation."""
+        with self.lock:
+            if self.offset is None:
+                return None
+            return int(sensor_ns) + int(round(self._offset_at(int(sensor_ns)))) - self.latency
+
+    def stamp(self, sensor_ns, host_ns=None):
+        """observe() then to_monotonic(), what capture threads call for every frame."""
+        self.observe(sensor_ns, host_ns)
+        return self.to_monotonic(sensor_ns)
+
+    def stats(self):
+        with self.lock:
+            return {"offsetMs": None if self.offset is None else round(self.offset/1e6, 3),
+                    "driftPpm": round(float(self.drift)*1e6, 3), "residualUs": round(self.residual/1e3, 1),
+                    "buckets": len(self.minima), "observations": self.observations, "resets": self.resets}
+
+
+def monotonic_to_wall(t):
+    """CLOCK_MONOTONIC seconds -> time.time() seconds, for timestamps written to logs/tracklets."""
+    return t + (time.time() - time.monotonic())
@@ -1,5 +1,6 @@
 import numpy as np
 from capsule import *
+from packets import *
 from display import *
 import socket
 import struct
@@ -75,8 +76,8 @@ class LightPoint:
     def __init__(self, name, isVisible, x, y, age):
         self.name = str(name)
         self.isVisible = bool(isVisible)  # Ensure boolean type
-        self.x = int(x)  # Ensure integer type
-        self.y = int(y)  # Ensure integer type
+        self.x = float(x)  # Sub-pixel position, rounded when packed
+        self.y = float(y)
         self.age = int(age)
 
 # Create an array of structures without specifying values        
@@ -125,15 +126,12 @@ def handle_packet(packetId, dataIn, lenIn):
     if (packetId == 99):
         newControllerPacketReceived = True
          # Assuming the first 4 bytes are preamble data, and the rest is 2 floats and 5 bools
-        joystickX, joystickY, joystickBtn, swUp, swDown, swLeft, swRight = struct.unpack('ffbbbbb', bytearray(dataIn)) 
+        joystickX, joystickY, joystickBtn, swUp, swDown, swLeft, swRight = CONTROLLER.decode(dataIn)
     # List of tracked points packet
     elif (packetId == 0x02):
         newPointListPacketReceived = True
-        cutSize = struct.calcsize('4siiii')
-        # We need to cut the received data in chunks of 16 bytes and then apply the struct.unpack on this
-        for i in range(0, len(dataIn), cutSize):
-            point = struct.unpack('4siiii', bytearray(dataIn[i:i+cutSize]))
-            LightPointArray[i//cutSize] = LightPoint(point[0].decode('utf-8'), point[1], point[2], point[3], point[4])
+        points = decode_point_list(dataIn)
+        LightPointArray = [LightPoint(name.decode('utf-8'), isVisible, x/SUBPIXEL_SCALE, y/SUBPIXEL_SCALE, age) for name, isVisible, x, y, age in points.tolist()]
 
         # print("Received list of ")
         # print(len(LightPointArray))
@@ -141,16 +139,16 @@ def handle_packet(packetId, dataIn, lenIn):
         #     print("Point %d: (%s, %d, %d)" % (i + 1, point.name, point.x, point.y))
     elif (packetId == 0x10):
         newCameraSettingsPacketReceived = True
-        cameraSetting["idRadius"], cameraSetting["lockRadius"], cameraSetting["lightLifetime"], cameraSetting["lightThreshold"], cameraSetting["gain"], cameraSetting["exposureTime"], cameraSetting["trackingEnabled"] = struct.unpack('iiiiiii', bytearray(dataIn))
+        cameraSetting.update(SETTINGS.decode(dataIn)._asdict())
 
     elif (packetId == 33):
         newDataFromTrackerReceived = True
-        trackerAzm, trackerElv = struct.unpack('ff', bytearray(dataIn))
+        trackerAzm, trackerElv = ANGLES.decode(dataIn)
         # print("Received data from tracker: ")
         # print(trackerAzm)
         # print(trackerElv)
 
-capsule_instance = Capsule(lambda packetId, dataIn, len: handle_packet(packetId, dataIn[:len], len))
+capsule_instance = CapsuleCodec(lambda packetId, dataIn, len: handle_packet(packetId, dataIn[:len], len))
 
 def UDPInit(name):
     global sock
@@ -171,39 +169,16 @@ def sendFrameToSelf(frame):
 
 def sendAbsPosToTeensy(azm, elv):
     global sock
-    # Send the target point to the teensy, the structure should be copied in a byte array then encoded then sent
-    packet_id = 0x03
-    # Pack the struct in a byte array
+    # Send the absolute position to the teensy (packet 0x03, see packets.ABS_POSITION)
     print(f"Sending azm: {azm}, elv: {elv}")
 
-    payload_data = struct.pack('ff', float(azm), float(elv))
-    packet_length = len(payload_data)
-    encoded_packet = capsule_instance.encode(packet_id, payload_data, packet_length)
-    # Print the encoded packet
-    #print(f"Encoded Packet: {encoded_packet}")
-    # Convert encoded_packet to a bytearray
-    encoded_packet = bytearray(encoded_packet)
-    # Send the encoded packet
-    sock.sendto(encoded_packet, (TEENSY_IP, TEENSY_PORT))
+    ABS_POSITION.sendto(sock, (TEENSY_IP, TEENSY_PORT), float(azm), float(elv))
     
 def sendTargetToTeensy(pointToSendIn, cameraID, Kp, maxSpeed):
     global sock
-    # Send the target point to the teensy, the structure should be copied in a byte array then encoded then sent
-    packet_id = 0x01
-    # Pack the struct in a byte array
-
-    pointToSend = LightPoint(pointToSendIn.name, pointToSendIn.isVisible, pointToSendIn.x, pointToSendIn.y, pointToSendIn.age)
-
-    pointToSendName = str(pointToSend.name)
-    payload_data = struct.pack('4siiiiiff', pointToSendName.encode('utf-8'), pointToSend.isVisible, pointToSend.x, pointToSend.y, pointToSend.age, cameraID, Kp, maxSpeed)
-    packet_length = len(payload_data)
-    encoded_packet = capsule_instance.encode(packet_id, payload_data, packet_length)
-    # Print the encoded packet
-    #print(f"Encoded Packet: {encoded_packet}")
-    # Convert encoded_packet to a bytearray
-    encoded_packet = bytearray(encoded_packet)
-    # Send the encoded packet
-    sock.sendto(encoded_packet, (TEENSY_IP, TEENSY_PORT))
+    # Send the target point to the teensy (packet 0x01, see packets.TARGET)
+    pointToSendName = str(pointToSendIn.name)
+    TARGET.sendto(sock, (TEENSY_IP, TEENSY_PORT), pointToSendName.encode('utf-8'), bool(pointToSendIn.isVisible), round(pointToSendIn.x), round(pointToSendIn.y), int(pointToSendIn.age), cameraID, Kp, maxSpeed)
 
 def getPositionFromColimator():
     global ser, colimator1, colimator2
@@ -225,9 +200,7 @@ def getPositionFromColimator():
 # Send target to arduino via USB serial
 def sendTargetToColimator(pointToSendIn):
     global ser
-    # Send the target point to the arduino, the structure should be copied in a byte array then encoded then sent
-    packet_id = 0x01
-    # Pack the struct in a byte array
+    # Send the target point to the arduino (packet 0x01, see packets.TARGET)
     
     
     # s1 = 1403 + (-0.01779 * pointToSendIn.x) + (0.6801 * pointToSendIn.y)
@@ -251,19 +224,11 @@ def sendTargetToColimator(pointToSendIn):
     pointToSend = LightPoint(pointToSendIn.name, pointToSendIn.isVisible, s1, s2, pointToSendIn.age)
 
     pointToSendName = str(pointToSend.name)
-    # payload_data = struct.pack('4siiiiiff', pointToSendName.encode('utf-8'), pointToSend.isVisible, pointToSend.x, pointToSend.y, pointToSend.age, 0,0,0)
-    payload_data = struct.pack('4siiiiiff', pointToSendName.encode('utf-8'), pointToSend.isVisible, pointToSend.x, pointToSend.y, pointToSend.age, 0,0,0)
-    packet_length = len(payload_data)
-    encoded_packet = capsule_instance.encode(packet_id, payload_data, packet_length)
-    # Print the encoded packet
-    #print(f"Encoded Packet: {encoded_packet}")
-    # Convert encoded_packet to a bytearray
-    encoded_packet = bytearray(encoded_packet)
         
     if (ser != None):
         try:
             # Send the encoded packet
-            ser.write(encoded_packet)
+            TARGET.write(ser, pointToSendName.encode('utf-8'), pointToSend.isVisible, round(pointToSend.x), round(pointToSend.y), pointToSend.age, 0, 0, 0)
         except Exception as e:
             print(f"Error occurred while sending data: {e}")
     else:
@@ -310,17 +275,10 @@ def sendAngleToMirror(angle):
 def sendAbsFocToArduino(focus):
     global ser
     
-    packet_id = 0x15
     print(f"Focus: {focus}")
 
     try:
-        payload_data = struct.pack('L', int(focus))
-        packet_length = len(payload_data)
-        encoded_packet = capsule_instance.encode(packet_id, payload_data, packet_length)
-        
-        encoded_packet = bytearray(encoded_packet)
-        
-        ser.write(encoded_packet)
+        FOCUS.write(ser, int(focus))
         print("Write success")
     except struct.error as e:
         print(f"Struct error: {e}")
@@ -332,51 +290,14 @@ def sendAbsFocToArduino(focus):
         print(f"General error: {e}")
         raise
 
-def sendLightPointListToRaspi(all_light_points, n):
-    global sock
-
-    # Light point structure
-    # Create an array of structures without specifying values
-    LightPointArray = [LightPoint(name="ABCD", isVisible=False, x=0, y=0, age=0) for _ in range(n)]
-
-    # Print only the first 3 light points with their name, position x and y only.
-    for i, (name, _, x, y, age, _, speed_x, speed_y, acceleration_x, acceleration_y) in enumerate(all_light_points[:n]):
-        # print("Point %d: (%s, %d, %d, %d, %d, %d, %d)" % (i + 1, name, x, y, speed_x, speed_y, acceleration_x, acceleration_y))
-        LightPointArray[i] = LightPoint(name, 1, x, y, age)
-
-    arrayToSend = bytearray()
-    byteToSend = bytearray()
-    packet_id = 0x02
-    
-    # Fill light point array
-    for i, point in enumerate(LightPointArray):
-        pointToSend = LightPoint(point.name, point.isVisible, point.x, point.y, point.age)
-        pointToSendName = str(point.name)
-        byteToSend = struct.pack('4siiii', pointToSendName.encode('utf-8'), pointToSend.isVisible, pointToSend.x, pointToSend.y, pointToSend.age)
-        # Concatenate the byte to the array
-        sizeToSend = struct.calcsize('4siiii')
-        arrayToSend[i*sizeToSend:(i+1)+sizeToSend] = byteToSend
-
-    payload_data = arrayToSend
-    packet_length = len(arrayToSend)
-    encoded_packet = capsule_instance.encode(0x02, payload_data, packet_length)
-    # Convert encoded_packet to a bytearray
-    encoded_packet = bytearray(encoded_packet)
-    #encoded_packet = bytes([0xFF,0xFA,0x00])
-    #print(encoded_packet)
-    #print(OTHER_RASPI_IP)
-    #print(OTHER_RASPI_PORT)
-    sock.sendto(encoded_packet, ('192.168.1.178', 8888))
-
 def parseIncomingDataFromUDP():
     global sock
     try:
         data, addr = sock.recvfrom(1024)  # Adjust the buffer size as needed
         print(f"Received {len(data)} bytes from {addr}")
 
-        # Decode the data with capsule
-        for byte in data:
-            capsule_instance.decode(byte)
+        # Decode the whole datagram with capsule
+        capsule_instance.decode(data)
 
     except socket.error as e:
         pass
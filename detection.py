@@ -2,6 +2,7 @@ import cv2
 import numpy as np
 import random
 import string
+from threading import Condition
 
 all_light_points = []
 # resolution = (1304, 976)
@@ -16,14 +17,62 @@ lightLifetime = 200
 lightThreshold = 200
 trackingEnabled = False
 
+# Blob extraction backend used by detect(): "contours" (findContours + moments)
+# or "components" (connectedComponentsWithStats, vectorized)
+detectionBackend = "contours"
+
+# Region of interest tracking: once a point is locked, only a window around its
+# predicted position is processed, with a full frame scan every roiReacquireInterval
+# frames or as soon as the locked point is not seen in the window
+roiTrackingEnabled = False
+roiReacquireInterval = 30
+# How far ahead (s) the locked point speed is allowed to carry it outside the window
+roiSpeedHorizon = 0.05
+roiFramesSinceFullScan = 0
+lastRoi = None
+# Binary frame of the last detect() call (only the window when lastRoi is set)
+lastBinaryFrame = None
+
+# Threshold strategy used by detect(), see THRESHOLD_METHODS
+thresholdMethod = "fixed"
+# Background subtracted strategies: detection level in noise sigmas, and minimum
+# contrast (gray levels) above the background
+thresholdSigma = 5.0
+thresholdMinContrast = 10
+# Background model: "ema" or "median" (approximate running median), update rate
+backgroundMode = "ema"
+backgroundAlpha = 0.02
+# Tile grid strategy: tile size in full resolution px, computed on a frame downsampled by tileDownsample
+tileSize = 64
+tileDownsample = 4
+
+# Intensity weighted sub-pixel centroids computed on the gray frame around each blob
+subpixelCentroids = True
+# Half size (px) of the biggest window refined, bigger blobs keep their mask centroid
+centroidMaxHalfSize = 8
+
+# Data association between new points and existing tracks: "hungarian" (optimal,
+# solved per cluster of conflicting candidates), "greedy" (cheapest pair first)
+# or "first" (first track in range, historical behaviour)
+associationMethod = "hungarian"
+# Clusters with more detections or tracks than this are solved greedily, a 4x4
+# Hungarian solve is about 0.15 ms on x86 (python detection.py for the benchmark)
+hungarianMaxSize = 4
+
 
 class LightPoint:
-    def __init__(self, name, isVisible, x, y, age):
+    def __init__(self, name, isVisible, x, y, age, speed_x=0.0, speed_y=0.0, timestamp=0, covariance=None):
         self.name = str(name)
         self.isVisible = bool(isVisible)  # Ensure boolean type
-        self.x = int(x)  # Ensure integer type
-        self.y = int(y)  # Ensure integer type
+        self.x = float(x)  # Sub-pixel position
+        self.y = float(y)
         self.age = int(age)
+        # Filtered speed (px/s, same axes as x and y), time of the last update (ns)
+        # and Kalman covariance of the track, when it comes from the track table
+        self.speed_x = float(speed_x)
+        self.speed_y = float(speed_y)
+        self.timestamp = int(timestamp)
+        self.covariance = covariance
 
 # Create an array of structures without specifying values
 LightPointArray = [LightPoint(name="ABCD", isVisible=False, x=0, y=0, age=0) for _ in range(10)]
@@ -60,6 +109,147 @@ def obtain_top_contours(b_frame, n=10):
     return top_contours
 
 
+class BlobList:
+    """
+    Blobs found in a binary frame, stored as parallel NumPy arrays.
+    centroids is (n, 2) float, areas (n,) int, boxes (n, 4) int as x, y, w, h
+    and peaks (n,) holds the brightest gray value of each blob (0 if unknown).
+    """
+    def __init__(self, centroids, areas, boxes, peaks):
+        self.centroids = centroids
+        self.areas = areas
+        self.boxes = boxes
+        self.peaks = peaks
+
+    def __len__(self):
+        return len(self.areas)
+
+    def points(self):
+        """
+        Integer (x, y) list, same format as obtain_top_contours.
+        """
+        return [(int(x), int(y)) for x, y in self.centroids]
+
+
+def obtain_top_blobs(b_frame, gray_frame=None, n=10):
+    """
+    Obtain the n biggest blobs of a binary frame using connectedComponentsWithStats.
+    Same selection as obtain_top_contours (blobs wider than 2 px, sorted by area)
+    but without any Python loop over the blobs. Returns a BlobList.
+    """
+    num, labels, stats, centroids = cv2.connectedComponentsWithStats(b_frame, connectivity=8, ltype=cv2.CV_32S)
+
+    # Label 0 is the background
+    stats = stats[1:]
+    centroids = centroids[1:]
+
+    # Equivalent of minEnclosingCircle radius > 1
+    keep = np.flatnonzero(np.maximum(stats[:, cv2.CC_STAT_WIDTH], stats[:, cv2.CC_STAT_HEIGHT]) > 2)
+    areas = stats[keep, cv2.CC_STAT_AREA]
+
+    if len(keep) > n:
+        top = np.argpartition(-areas, n - 1)[:n]
+    else:
+        top = np.arange(len(keep))
+    top = top[np.argsort(-areas[top], kind="stable")]
+    keep = keep[top]
+
+    peaks = np.zeros(len(keep), dtype=np.uint8)
+    if gray_frame is not None and len(keep) > 0:
+        # Peak intensity of every labelled pixel, then pick the selected blobs
+        mask = labels > 0
+        allPeaks = np.zeros(num, dtype=np.uint8)
+        np.maximum.at(allPeaks, labels[mask], gray_frame[mask])
+        peaks = allPeaks[keep + 1]
+
+    return BlobList(centroids[keep].astype(np.float32),
+                    stats[keep, cv2.CC_STAT_AREA],
+                    stats[keep, :4],
+                    peaks)
+
+
+def refine_centroids(gray_frame, points, boxes=None, maxHalfSize=8):
+    """
+    Intensity weighted sub-pixel centroids of the light points.
+    Every point gets a square window (sized from its bounding box when boxes
+    are given, 7x7 otherwise); the median of the window border is the local
+    background and its spread the noise. All the windows are gathered in one
+    (n, size, size) array so there is no loop over the points.
+    Returns the refined (n, 2) centroids and an (n, 3) array of peak, flux and SNR.
+    Points whose box does not fit in maxHalfSize keep their original centroid.
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    n = len(points)
+    if n == 0:
+        return points, np.zeros((0, 3))
+
+    height, width = gray_frame.shape[:2]
+    if boxes is not None:
+        half = np.ceil(np.maximum(boxes[:, 2], boxes[:, 3]) / 2).astype(np.intp) + 1
+    else:
+        half = np.full(n, 3, dtype=np.intp)
+    refinable = half <= maxHalfSize
+    half = np.minimum(half, maxHalfSize)
+
+    size = int(half.max())
+    offsets = np.arange(-size, size + 1)
+    center_x = np.rint(points[:, 0]).astype(np.intp)
+    center_y = np.rint(points[:, 1]).astype(np.intp)
+    xs = center_x[:, None] + offsets
+    ys = center_y[:, None] + offsets
+
+    # Pixels of each point's own window that are inside the frame
+    in_x = (np.abs(offsets) <= half[:, None]) & (xs >= 0) & (xs < width)
+    in_y = (np.abs(offsets) <= half[:, None]) & (ys >= 0) & (ys < height)
+    window = in_y[:, :, None] & in_x[:, None, :]
+    ring_x = np.abs(offsets) == half[:, None]
+    ring_y = np.abs(offsets) == half[:, None]
+    border = window & (ring_y[:, :, None] | ring_x[:, None, :])
+    core = window & ~border
+
+    pixels = gray_frame[np.clip(ys, 0, height - 1)[:, :, None], np.clip(xs, 0, width - 1)[:, None, :]].astype(np.float32)
+
+    border_pixels = np.where(border, pixels, np.nan).reshape(n, -1)
+    background = np.nanmedian(border_pixels, axis=1)
+    noise = np.maximum(np.nanstd(border_pixels, axis=1), 1.0)
+
+    signal = np.where(core, np.maximum(pixels - background[:, None, None], 0), 0)
+    flux = signal.sum(axis=(1, 2))
+    peak = np.where(window, pixels, 0).max(axis=(1, 2))
+    snr = (peak - background) / noise
+
+    refined = points.copy()
+    valid = refinable & (flux > 0)
+    safe_flux = np.where(valid, flux, 1.0)
+    refined_x = (signal.sum(axis=1) * xs).sum(axis=1) / safe_flux
+    refined_y = (signal.sum(axis=2) * ys).sum(axis=1) / safe_flux
+    refined[valid, 0] = refined_x[valid]
+    refined[valid, 1] = refined_y[valid]
+
+    return refined, np.stack([peak, flux, snr], axis=1)
+
+
+def obtain_top_light_points(b_frame, gray_frame=None, n=10):
+    """
+    Run the blob extraction backend selected by detectionBackend.
+    Returns an (n, 2) float array of points and, when sub-pixel centroiding
+    is enabled and gray_frame given, an (n, 3) array of peak, flux and SNR (else None).
+    """
+    boxes = None
+    if detectionBackend == "components":
+        blobs = obtain_top_blobs(b_frame, gray_frame, n)
+        points = blobs.centroids.astype(np.float64)
+        boxes = blobs.boxes
+    else:
+        points = np.asarray(obtain_top_contours(b_frame, n), dtype=np.float64).reshape(-1, 2)
+        # obtain_top_contours pads with (-1, -1) when nothing is found
+        points = points[(points[:, 0] >= 0) | (points[:, 1] >= 0)]
+
+    if subpixelCentroids and gray_frame is not None:
+        return refine_centroids(gray_frame, points, boxes, centroidMaxHalfSize)
+    return points, None
+
+
 def is_point_close_with_motion_estimation(x1, y1, x2, y2, speed_x1, speed_y1, acceleration_x1, acceleration_y1, timestamp1, timestamp2, threshold):
     """
     Check if two points are close to each other based on the estimated position.
@@ -68,8 +258,8 @@ def is_point_close_with_motion_estimation(x1, y1, x2, y2, speed_x1, speed_y1, ac
     delta_t = delta_t_nanosecond / 1e9
 
     # Estimate the next position based on the last known position, speed, and acceleration for both x and y
-    estimated_x = x1 + speed_x1 * delta_t + 0.5 * acceleration_x1 * delta_t/1e9**2
-    estimated_y = y1 + speed_y1 * delta_t + 0.5 * acceleration_y1 * delta_t/1e9**2
+    estimated_x = x1 + speed_x1 * delta_t + 0.5 * acceleration_x1 * delta_t**2
+    estimated_y = y1 + speed_y1 * delta_t + 0.5 * acceleration_y1 * delta_t**2
 
     # Check if the new position is close to the estimated position
     position_close = abs(x2 - estimated_x) <= threshold and abs(y2 - estimated_y) <= threshold
@@ -118,77 +308,719 @@ def calculate_speed_and_acceleration(last_position, current_position, last_times
 
     return speed_x, speed_y, acceleration_x, acceleration_y
 
-def process_and_store_light_points(new_points, sensorTimeStamp):
+ASSIGNMENT_UNREACHABLE = 1e9
+
+def assign_hungarian(cost):
+    """
+    Minimum cost assignment of a small (rows x cols) cost matrix (Hungarian /
+    Kuhn-Munkres, O(n^2 m) with the inner loop vectorized over columns).
+    Returns the matched (rows, cols) index arrays.
+    """
+    transposed = cost.shape[0] > cost.shape[1]
+    if transposed:
+        cost = cost.T
+    n, m = cost.shape
+
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    p = np.zeros(m + 1, dtype=np.intp)
+    way = np.zeros(m + 1, dtype=np.intp)
+
+    for i in range(1, n + 1):
+        p[0] = i
+        j0 = 0
+        minv = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = p[j0]
+            free = ~used
+            free[0] = False
+            current = cost[i0 - 1] - u[i0] - v[1:]
+            improve = free[1:] & (current < minv[1:])
+            minv[1:][improve] = current[improve]
+            way[1:][improve] = j0
+            j1 = int(np.argmin(np.where(free, minv, np.inf)))
+            delta = minv[j1]
+            u[p[used]] += delta
+            v[used] -= delta
+            minv[free] -= delta
+            j0 = j1
+            if p[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+
+    cols = np.flatnonzero(p[1:])
+    rows = p[1:][cols] - 1
+    if transposed:
+        rows, cols = cols, rows
+    return rows, cols
+
+def assign_greedy(cost, gated):
+    """
+    Take the gated (row, col) pairs by increasing cost, skipping rows or cols already used.
+    Returns the matched (rows, cols) index arrays.
+    """
+    pair_rows, pair_cols = np.nonzero(gated)
+    order = np.argsort(cost[pair_rows, pair_cols], kind="stable")
+    used_rows = set()
+    used_cols = set()
+    rows = []
+    cols = []
+    for r, c in zip(pair_rows[order].tolist(), pair_cols[order].tolist()):
+        if r in used_rows or c in used_cols:
+            continue
+        used_rows.add(r)
+        used_cols.add(c)
+        rows.append(r)
+        cols.append(c)
+    return np.array(rows, dtype=np.intp), np.array(cols, dtype=np.intp)
+
+def associate(cost, gated, method="hungarian", maxSize=4):
+    """
+    Assign detections (rows) to tracks (cols) using only the gated pairs.
+    Returns, for every row, the matched column or -1.
+    """
+    match = np.full(cost.shape[0], -1, dtype=np.intp)
+    if not gated.any():
+        return match
+
+    if method == "first":
+        match = np.argmax(gated, axis=1)
+        match[~gated.any(axis=1)] = -1
+        return match
+
+    if method == "greedy":
+        rows, cols = assign_greedy(cost, gated)
+        match[rows] = cols
+        return match
+
+    # Rows and cols with a single candidate that nobody else wants need no solver,
+    # the rest is split in clusters of conflicting candidates solved one by one
+    row_degree = gated.sum(axis=1)
+    col_degree = gated.sum(axis=0)
+    pair_rows, pair_cols = np.nonzero(gated)
+    simple = (row_degree[pair_rows] == 1) & (col_degree[pair_cols] == 1)
+    match[pair_rows[simple]] = pair_cols[simple]
+
+    pair_rows = pair_rows[~simple]
+    pair_cols = pair_cols[~simple]
+    if len(pair_rows) == 0:
+        return match
+
+    # Connected components of the remaining pairs: every row and col takes the
+    # smallest row index it is connected to, propagated until nothing changes
+    linked = np.zeros_like(gated)
+    linked[pair_rows, pair_cols] = True
+    none = cost.shape[0]
+    row_label = np.where(linked.any(axis=1), np.arange(cost.shape[0]), none)
+    while True:
+        col_label = np.where(linked, row_label[:, None], none).min(axis=0)
+        new_label = np.minimum(row_label, np.where(linked, col_label[None, :], none).min(axis=1))
+        if np.array_equal(new_label, row_label):
+            break
+        row_label = new_label
+
+    for label in np.unique(row_label[row_label < none]):
+        rows = np.flatnonzero(row_label == label)
+        cols = np.flatnonzero(col_label == label)
+        sub_gated = gated[np.ix_(rows, cols)]
+        sub_cost = np.where(sub_gated, cost[np.ix_(rows, cols)], ASSIGNMENT_UNREACHABLE)
+        if max(len(rows), len(cols)) > maxSize:
+            sub_rows, sub_cols = assign_greedy(sub_cost, sub_gated)
+        else:
+            sub_rows, sub_cols = assign_hungarian(sub_cost)
+            valid = sub_gated[sub_rows, sub_cols]
+            sub_rows = sub_rows[valid]
+            sub_cols = sub_cols[valid]
+        match[rows[sub_rows]] = cols[sub_cols]
+
+    return match
+
+
+# Field layout of a track, same order as the historical 10-field tuples
+TRACK_DTYPE = np.dtype([
+    ("name", "U4"),
+    ("firstSeen", np.int64),
+    ("x", np.float64),
+    ("y", np.float64),
+    ("age", np.int32),
+    ("timestamp", np.int64),
+    ("speed_x", np.float64),
+    ("speed_y", np.float64),
+    ("acceleration_x", np.float64),
+    ("acceleration_y", np.float64),
+])
+
+
+class TrackView:
+    """
+    Read-only snapshot of the tracks at one frame.
+    Iterating, indexing or slicing it gives the usual 10-field tuples
+    (name, firstSeen, x, y, age, timestamp, speed_x, speed_y, acceleration_x, acceleration_y)
+    so older code keeps working, while new code can use the columns directly
+    (view.x, view.y, view.name, ...), the Kalman covariance of each track
+    (view.covariance, shape (n, 2 axes, order, order)) and the last measured
+    peak, flux and SNR (view.photometry, shape (n, 3)).
+    """
+    def __init__(self, records, covariance=None, photometry=None):
+        self.records = records
+        self.covariance = covariance
+        self.photometry = photometry
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        return iter(self.records.tolist())
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            covariance = self.covariance[index] if self.covariance is not None else None
+            photometry = self.photometry[index] if self.photometry is not None else None
+            return TrackView(self.records[index], covariance, photometry)
+        return self.records[index].tolist()
+
+    def __getattr__(self, field):
+        if field in TRACK_DTYPE.names:
+            return self.records[field]
+        raise AttributeError(field)
+
+
+def kalman_transition(delta_t, order):
+    """
+    Batched state transition F and process noise shape Q (to be scaled by the
+    noise density) for one axis of a constant velocity (order 2: position, speed)
+    or constant acceleration (order 3: position, speed, acceleration) model.
+    delta_t is an array of durations in seconds, F and Q are (len(delta_t), order, order).
+    """
+    dt = np.asarray(delta_t, dtype=np.float64)
+    F = np.zeros((len(dt), order, order))
+    F[:, np.arange(order), np.arange(order)] = 1.0
+    F[:, 0, 1] = dt
+    if order == 2:
+        Q = np.stack([np.stack([dt**4/4, dt**3/2], -1),
+                      np.stack([dt**3/2, dt**2], -1)], -2)
+    else:
+        F[:, 0, 2] = 0.5 * dt**2
+        F[:, 1, 2] = dt
+        Q = np.stack([np.stack([dt**5/20, dt**4/8, dt**3/6], -1),
+                      np.stack([dt**4/8, dt**3/3, dt**2/2], -1),
+                      np.stack([dt**3/6, dt**2/2, dt], -1)], -2)
+    return F, Q
+
+
+class TrackTable:
+    """
+    Light point tracks stored in a preallocated structured NumPy array.
+    Active tracks always live in rows [0, count) in the order they were created,
+    expiry compacts the array in place.
+    Every track carries a Kalman filter per axis (constant velocity "cv" or
+    constant acceleration "ca"), states and covariances are stacked so all the
+    tracks are filtered with a single batched matrix operation per frame.
+    """
+    def __init__(self, capacity=256, model="cv", processNoise=5000.0, measurementNoise=1.0, initialSpeedNoise=200.0):
+        self._records = np.zeros(capacity, dtype=TRACK_DTYPE)
+        self.count = 0
+        self.model = model
+        self.order = 3 if model == "ca" else 2
+        self.processNoise = processNoise
+        self.measurementNoise = measurementNoise
+        self.initialSpeedNoise = initialSpeedNoise
+        # Filter state and covariance, (track, axis, order) and (track, axis, order, order)
+        self._state = np.zeros((capacity, 2, self.order))
+        self._covariance = np.zeros((capacity, 2, self.order, self.order))
+        # Last measured peak, flux and SNR of each track
+        self._photometry = np.zeros((capacity, 3))
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def active(self):
+        return self._records[:self.count]
+
+    @property
+    def covariance(self):
+        return self._covariance[:self.count]
+
+    @property
+    def photometry(self):
+        return self._photometry[:self.count]
+
+    def view(self):
+        return TrackView(self.active.copy(), self.covariance.copy(), self.photometry.copy())
+
+    def names(self):
+        return set(self.active["name"].tolist())
+
+    def index(self, name):
+        """
+        Row of the track called name, or -1.
+        """
+        rows = np.flatnonzero(self.active["name"] == name)
+        return int(rows[0]) if len(rows) else -1
+
+    def clear(self):
+        self.count = 0
+
+    def predict(self, timestamp):
+        """
+        Estimated x, y of every active track at timestamp (ns).
+        """
+        tracks = self.active
+        delta_t = (timestamp - tracks["timestamp"]) / 1e9
+        estimated_x = tracks["x"] + tracks["speed_x"] * delta_t + 0.5 * tracks["acceleration_x"] * delta_t**2
+        estimated_y = tracks["y"] + tracks["speed_y"] * delta_t + 0.5 * tracks["acceleration_y"] * delta_t**2
+        return estimated_x, estimated_y
+
+    def gate(self, points, timestamp, threshold, method="first", maxSize=4):
+        """
+        For every (x, y) in points, index of the track it is associated to, or -1.
+        Only tracks whose estimated position is within threshold on both axes
+        are candidates, the squared distance is the association cost.
+        """
+        if self.count == 0 or len(points) == 0:
+            return np.full(len(points), -1, dtype=np.intp)
+        estimated_x, estimated_y = self.predict(timestamp)
+        delta_x = points[:, 0, None] - estimated_x
+        delta_y = points[:, 1, None] - estimated_y
+        close = (np.abs(delta_x) <= threshold) & (np.abs(delta_y) <= threshold)
+        return associate(delta_x**2 + delta_y**2, close, method, maxSize)
+
+    def update(self, indices, points, timestamp, photometry=None):
+        """
+        Kalman predict + correct the tracks at indices with the measured points.
+        """
+        tracks = self.active
+        delta_t = (timestamp - tracks["timestamp"][indices]) / 1e9
+        F, Q = kalman_transition(delta_t, self.order)
+
+        # Predict, the same F applies to both axes of a track
+        state = np.einsum('tij,taj->tai', F, self._state[indices])
+        covariance = np.einsum('tij,tajk,tlk->tail', F, self._covariance[indices], F) + self.processNoise * Q[:, None]
+
+        # Correct, only the position is measured (H = [1, 0, ...])
+        innovation = points - state[:, :, 0]
+        S = covariance[:, :, 0, 0] + self.measurementNoise**2
+        K = covariance[:, :, :, 0] / S[:, :, None]
+        state += K * innovation[:, :, None]
+        covariance -= K[:, :, :, None] * covariance[:, :, None, 0, :]
+
+        self._state[indices] = state
+        self._covariance[indices] = covariance
+        if photometry is not None:
+            self._photometry[indices] = photometry
+        tracks["timestamp"][indices] = timestamp
+        self._store(indices)
+
+    def _store(self, indices):
+        # Mirror the filtered state in the record fields
+        tracks = self.active
+        state = self._state[indices]
+        tracks["x"][indices] = state[:, 0, 0]
+        tracks["y"][indices] = state[:, 1, 0]
+        tracks["speed_x"][indices] = state[:, 0, 1]
+        tracks["speed_y"][indices] = state[:, 1, 1]
+        if self.order == 3:
+            tracks["acceleration_x"][indices] = state[:, 0, 2]
+            tracks["acceleration_y"][indices] = state[:, 1, 2]
+
+    def _grow(self):
+        capacity = 2 * len(self._records)
+        records = np.zeros(capacity, dtype=TRACK_DTYPE)
+        records[:self.count] = self.active
+        state = np.zeros((capacity,) + self._state.shape[1:])
+        state[:self.count] = self._state[:self.count]
+        covariance = np.zeros((capacity,) + self._covariance.shape[1:])
+        covariance[:self.count] = self.covariance
+        photometry = np.zeros((capacity, 3))
+        photometry[:self.count] = self.photometry
+        self._records = records
+        self._state = state
+        self._covariance = covariance
+        self._photometry = photometry
+
+    def add(self, x, y, timestamp, photometry=None):
+        """
+        Start a new track with a random 4 character name not used by any other track.
+        """
+        if self.count == len(self._records):
+            self._grow()
+
+        existing = self.names()
+        name = ''.join(random.choice(string.ascii_uppercase + string.digits) for _ in range(4))
+        while name in existing:
+            name = ''.join(random.choice(string.ascii_uppercase + string.digits) for _ in range(4))
+
+        i = self.count
+        self._records[i] = (name, timestamp, x, y, 0, timestamp, 0, 0, 0, 0)
+        self._state[i] = 0
+        self._state[i, :, 0] = (x, y)
+        self._covariance[i] = 0
+        self._covariance[i, :, 0, 0] = self.measurementNoise**2
+        self._covariance[i, :, 1, 1] = self.initialSpeedNoise**2
+        if self.order == 3:
+            self._covariance[i, :, 2, 2] = (self.initialSpeedNoise * 10)**2
+        self._photometry[i] = photometry if photometry is not None else 0
+        self.count += 1
+
+    def expire(self, timestamp, lifetime_ns, region=None):
+        """
+        Drop the tracks not updated for more than lifetime_ns, keeping the order of the others.
+        When region (x0, y0, x1, y1) is given, only tracks last seen inside it can expire,
+        the others were not looked for on this frame.
+        """
+        tracks = self.active
+        fresh = timestamp - tracks["timestamp"] <= lifetime_ns
+        if region is not None:
+            x0, y0, x1, y1 = region
+            outside = (tracks["x"] < x0) | (tracks["x"] >= x1) | (tracks["y"] < y0) | (tracks["y"] >= y1)
+            fresh |= outside
+        keep = np.flatnonzero(fresh)
+        if len(keep) != self.count:
+            self._records[:len(keep)] = tracks[keep]
+            self._state[:len(keep)] = self._state[keep]
+            self._covariance[:len(keep)] = self._covariance[keep]
+            self._photometry[:len(keep)] = self._photometry[keep]
+            self.count = len(keep)
+
+
+# Kalman model of the tracks: "cv" constant velocity or "ca" constant acceleration
+kalmanModel = "cv"
+# Process noise density (px^2/s^3 for cv, px^2/s^5 for ca) and measurement noise (px)
+kalmanProcessNoise = 5000.0
+kalmanMeasurementNoise = 1.0
+
+lightPointTable = TrackTable(model=kalmanModel, processNoise=kalmanProcessNoise, measurementNoise=kalmanMeasurementNoise)
+
+def process_and_store_light_points(new_points, sensorTimeStamp, region=None, photometry=None):
     global all_light_points
 
     # Get the current timestamp
     current_time = sensorTimeStamp
-    age = 0
-
-    # Process new points
-    for new_x, new_y in new_points:
-        point_found = False
-
-        for i, (existing_name, existing_firstSeen, existing_x, existing_y, age, existing_timestamp, existing_speed_x, existing_speed_y, existing_acceleration_x, existing_acceleration_Y)in enumerate(all_light_points):
-            if is_point_close_with_motion_estimation(existing_x, existing_y, new_x, new_y, existing_speed_x, existing_speed_y, existing_acceleration_x, existing_acceleration_Y, existing_timestamp, current_time, idRadius):
-                # Replace old point values with the most recent and compute new acceleration and speed
-                speed_x, speed_y, acceleration_x, acceleration_y = calculate_speed_and_acceleration((existing_x, existing_y), (new_x, new_y), existing_timestamp, current_time)
-                #  print("Point %d updated: (%d, %d, %f, %f, %f, %f)" % (i + 1, new_x, new_y, speed_x, speed_y, acceleration_x, acceleration_y))
-                all_light_points[i] = (existing_name, existing_firstSeen, new_x, new_y, age, current_time, speed_x, speed_y, acceleration_x, acceleration_y)
-                point_found = True
-                break
 
-        if not point_found:
-            # Add new point to the list with acceleration and speed = 0 for both x and y
-            name = ''.join(random.choice(string.ascii_uppercase + string.digits) for _ in range(4))
-            # Make sure the name doesn't already exist in the current list:
-            while name in [existing_name for existing_name, _, _, _, _, _, _, _, _, _ in all_light_points]:
-                name = ''.join(random.choice(string.ascii_uppercase + string.digits) for _ in range(4))
+    points = np.asarray(new_points, dtype=np.float64).reshape(-1, 2)
+    # obtain_top_contours pads with (-1, -1) when nothing is found
+    found = (points[:, 0] >= 0) | (points[:, 1] >= 0)
+    points = points[found]
+    if photometry is not None:
+        photometry = photometry[found]
+
+    match = lightPointTable.gate(points, current_time, idRadius, associationMethod, hungarianMaxSize)
 
-            all_light_points.append((name, current_time, new_x, new_y, age, current_time, 0, 0, 0, 0))
+    matched = match >= 0
+    if matched.any():
+        lightPointTable.update(match[matched], points[matched], current_time,
+                               photometry[matched] if photometry is not None else None)
 
-    all_light_points = [(name, firstSeen, x, y, age, timestamp, speed_x, speed_y, acceleration_x, acceleration_y) for name, firstSeen, x, y, age, timestamp, speed_x, speed_y, acceleration_x, acceleration_y in all_light_points if current_time - timestamp <= lightLifetime*1e6]
+    # New points start with acceleration and speed = 0 for both x and y
+    for i in np.flatnonzero(~matched):
+        lightPointTable.add(points[i, 0], points[i, 1], current_time,
+                            photometry[i] if photometry is not None else None)
+
+    lightPointTable.expire(current_time, lightLifetime*1e6, region)
+
+    all_light_points = lightPointTable.view()
     return all_light_points
 
-def detect(frame, sensorTimeStamp):
-    # Convert to grayscale and then to binary
-    try: 
-        gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        # Method 1: Apply a simple threshold
-        _dummy, b_frame = cv2.threshold(gray_frame,lightThreshold, 255, cv2.THRESH_BINARY)
+class BackgroundModel:
+    """
+    Running background of the full frame, kept as a float32 array updated in
+    place every frame, either as an exponential moving average or as an
+    approximate running median (moves by a fixed step towards each new frame).
+    Pixels flagged as foreground are not learnt, so a target held still in
+    the frame by the tracker does not fade into the background.
+    """
+    def __init__(self, mode="ema", alpha=0.02, medianStep=0.5):
+        self.mode = mode
+        self.alpha = alpha
+        self.medianStep = medianStep
+        self.background = None
+        self.sigma = None
 
-        # Method 2: Apply adaptive threshold
-        # # Apply morphological dilation
-        # kernel = np.ones((3, 3), np.uint8)
-        # dilated = cv2.dilate(gray_frame, kernel)
+    def reset(self):
+        self.background = None
+        self.sigma = None
 
-        # # Compute the difference between the original and dilated image
-        # diff = cv2.absdiff(dilated, gray_frame)
+    def ready(self, gray_frame, roi=None):
+        if self.background is None:
+            return False
+        if roi is None:
+            return self.background.shape == gray_frame.shape[:2]
+        return roi[3] <= self.background.shape[0] and roi[2] <= self.background.shape[1]
 
-        # # Optionally, you can further threshold the difference image
-        # _, b_frame = cv2.threshold(diff, lightThreshold, 255, cv2.THRESH_BINARY)
+    def region(self, roi=None):
+        if roi is None:
+            return self.background
+        return self.background[roi[1]:roi[3], roi[0]:roi[2]]
 
-        # Method 3: Apply adaptive threshold
-        # Compute the gradient magnitude using Sobel operators
-        # gradient_x = cv2.Sobel(gray_frame, cv2.CV_64F, 1, 0, ksize=3)
-        # gradient_y = cv2.Sobel(gray_frame, cv2.CV_64F, 0, 1, ksize=3)
-        # gradient_magnitude = np.sqrt(gradient_x**2 + gradient_y**2)
+    def difference(self, gray_frame, roi=None):
+        """
+        Frame minus background (float32).
+        """
+        return cv2.subtract(gray_frame, self.region(roi), dtype=cv2.CV_32F)
 
-        # # Normalize gradient magnitude to [0, 255]
-        # gradient_magnitude_normalized = cv2.normalize(gradient_magnitude, None, 0, 255, cv2.NORM_MINMAX, cv2.CV_8U)
+    def update(self, gray_frame, roi=None, foreground=None):
+        if roi is None and not self.ready(gray_frame):
+            self.background = gray_frame.astype(np.float32)
+            return
+        if not self.ready(gray_frame, roi):
+            return
 
-        # # Threshold the gradient magnitude image
-        # _, thresh = cv2.threshold(gradient_magnitude_normalized, lightThreshold, 255, cv2.THRESH_BINARY)
+        background = self.region(roi)
+        if self.mode == "ema" and roi is None:
+            mask = cv2.bitwise_not(foreground) if foreground is not None else None
+            cv2.accumulateWeighted(gray_frame, background, self.alpha, mask)
+            return
+
+        if self.mode == "ema":
+            delta = self.alpha * (gray_frame - background)
+        else:
+            delta = self.medianStep * np.sign(gray_frame - background)
+        if foreground is not None:
+            delta[foreground > 0] = 0
+        background += delta
 
-        # # Perform non-maximum suppression
-        # b_frame = cv2.dilate(thresh, None)
 
-        result = obtain_top_contours(b_frame, 30)
-        all_light_points = process_and_store_light_points(result, sensorTimeStamp)
+backgroundModel = BackgroundModel(backgroundMode, backgroundAlpha)
+
+def threshold_fixed(gray_frame, roi=None, update=True):
+    """
+    Method 1: simple global threshold at lightThreshold.
+    """
+    _dummy, b_frame = cv2.threshold(gray_frame, lightThreshold, 255, cv2.THRESH_BINARY)
+    return b_frame
+
+def threshold_dilation(gray_frame, roi=None, update=True):
+    """
+    Method 2: difference between the frame and its 3x3 dilation, thresholded at lightThreshold.
+    """
+    kernel = np.ones((3, 3), np.uint8)
+    dilated = cv2.dilate(gray_frame, kernel)
+    diff = cv2.absdiff(dilated, gray_frame)
+    _dummy, b_frame = cv2.threshold(diff, lightThreshold, 255, cv2.THRESH_BINARY)
+    return b_frame
+
+def threshold_sobel(gray_frame, roi=None, update=True):
+    """
+    Method 3: Sobel gradient magnitude normalized to [0, 255], thresholded at
+    lightThreshold, then dilated (non-maximum suppression).
+    """
+    gradient_x = cv2.Sobel(gray_frame, cv2.CV_32F, 1, 0, ksize=3)
+    gradient_y = cv2.Sobel(gray_frame, cv2.CV_32F, 0, 1, ksize=3)
+    gradient_magnitude = cv2.magnitude(gradient_x, gradient_y)
+    gradient_magnitude_normalized = cv2.normalize(gradient_magnitude, None, 0, 255, cv2.NORM_MINMAX, cv2.CV_8U)
+    _dummy, thresh = cv2.threshold(gradient_magnitude_normalized, lightThreshold, 255, cv2.THRESH_BINARY)
+    return cv2.dilate(thresh, None)
+
+def threshold_background(gray_frame, roi=None, update=True):
+    """
+    Background subtracted threshold: a pixel is lit when it is more than
+    thresholdSigma noise sigmas (and thresholdMinContrast gray levels) above
+    the running background. The noise is the MAD of the difference image.
+    """
+    if not backgroundModel.ready(gray_frame, roi):
+        # Nothing can be told from the background yet, learn this frame
+        if update:
+            backgroundModel.update(gray_frame, roi)
+        return np.zeros(gray_frame.shape[:2], dtype=np.uint8)
+
+    diff = backgroundModel.difference(gray_frame, roi)
+    if update or backgroundModel.sigma is None:
+        backgroundModel.sigma = max(1.4826 * float(np.median(np.abs(diff[::4, ::4]))), 0.5)
+    level = max(thresholdSigma * backgroundModel.sigma, thresholdMinContrast)
+    b_frame = (diff > level).astype(np.uint8) * 255
+
+    if update:
+        backgroundModel.update(gray_frame, roi, b_frame)
+    return b_frame
+
+def threshold_tiles(gray_frame, roi=None, update=True):
+    """
+    Local threshold from sigma-clipped statistics on a tile grid: the frame
+    is downsampled by tileDownsample, every tile gets a clipped mean and sigma,
+    and the resulting level map is interpolated back to full resolution.
+    """
+    height, width = gray_frame.shape[:2]
+    small = cv2.resize(gray_frame, (max(width // tileDownsample, 1), max(height // tileDownsample, 1)), interpolation=cv2.INTER_AREA)
+    tile = max(min(tileSize // tileDownsample, small.shape[0], small.shape[1]), 1)
+    tiles_x = small.shape[1] // tile
+    tiles_y = small.shape[0] // tile
+    # The last partial row and column of tiles are covered by the interpolated level map
+    small = small[:tiles_y * tile, :tiles_x * tile]
+    blocks = small.reshape(tiles_y, tile, tiles_x, tile).swapaxes(1, 2).reshape(tiles_y, tiles_x, -1).astype(np.float32)
+
+    keep = np.ones(blocks.shape, dtype=bool)
+    for _ in range(3):
+        count = np.maximum(keep.sum(axis=2), 1)
+        mean = (blocks * keep).sum(axis=2) / count
+        sigma = np.sqrt((((blocks - mean[:, :, None]) * keep)**2).sum(axis=2) / count)
+        sigma = np.maximum(sigma, 0.5)
+        keep = np.abs(blocks - mean[:, :, None]) <= 3 * sigma[:, :, None]
+
+    # Averaging tileDownsample^2 pixels divides the pixel noise by tileDownsample
+    sigma = sigma * tileDownsample
+    level = mean + np.maximum(thresholdSigma * sigma, thresholdMinContrast)
+    level = np.clip(level, 0, 255).astype(np.uint8)
+    level = cv2.resize(level, (width, height), interpolation=cv2.INTER_LINEAR)
+    return cv2.compare(gray_frame, level, cv2.CMP_GT)
+
+THRESHOLD_STRATEGIES = {
+    "fixed": threshold_fixed,
+    "dilation": threshold_dilation,
+    "sobel": threshold_sobel,
+    "background": threshold_background,
+    "tiles": threshold_tiles,
+}
+# Index order used by the web UI selectors
+THRESHOLD_METHODS = ["fixed", "dilation", "sobel", "background", "tiles"]
+
+def threshold_frame(gray_frame, roi=None, update=True):
+    """
+    Binary frame from the current threshold strategy. roi is the window the
+    gray frame was cropped to (None for the full frame); update=False leaves
+    the background model untouched (e.g. for the video preview).
+    """
+    return THRESHOLD_STRATEGIES[thresholdMethod](gray_frame, roi, update)
+
+
+class DetectionResult:
+    """
+    Everything the tracking loop found on one frame: the frame that was
+    processed, its binary frame, the light points and the locked point.
+    Published through the frame server so video previews draw from it
+    instead of running the detection again. Treat it as read-only.
+    """
+    def __init__(self, frame, binaryFrame, lightPoints, lockedPoint, timestamp, roi=None):
+        self.frame = frame
+        self.binaryFrame = binaryFrame
+        self.lightPoints = lightPoints
+        self.lockedPoint = lockedPoint
+        self.timestamp = timestamp
+        self.roi = roi
+
+    def full_binary_frame(self):
+        """
+        Copy of the binary frame at the size of the frame, black outside the window if any.
+        """
+        if self.binaryFrame is None:
+            return np.zeros(self.frame.shape[:2], dtype=np.uint8)
+        if self.roi is None:
+            return self.binaryFrame.copy()
+        b_frame = np.zeros(self.frame.shape[:2], dtype=np.uint8)
+        x0, y0, x1, y1 = self.roi
+        b_frame[y0:y1, x0:x1] = self.binaryFrame
+        return b_frame
+
+class ResultPublisher:
+    """
+    Mixin for the frame servers: the tracking loop publish_result()s the
+    DetectionResult of each frame and the preview clients wait_for_result()
+    it, so they do not run the detection again. Call _init_results() from
+    the frame server's __init__.
+    """
+    def _init_results(self):
+        self._result = None
+        self._resultCondition = Condition()
+
+    def publish_result(self, result):
+        with self._resultCondition:
+            self._result = result
+            self._resultCondition.notify_all()
+
+    def wait_for_result(self, previous=None, timeout=None):
+        """
+        Like wait_for_frame, for the published results. With a timeout,
+        previous is returned when nothing new was published in time (e.g.
+        while the tracking loop is busy scanning).
+        """
+        with self._resultCondition:
+            if previous is not None and self._result is not previous:
+                return self._result
+            while True:
+                if not self._resultCondition.wait(timeout):
+                    return previous
+                if self._result is not previous:
+                    return self._result
+
+def make_detection_result(frame, lightPoints, lockedPoint, sensorTimeStamp):
+    """
+    DetectionResult of the last detect() call on frame.
+    """
+    return DetectionResult(frame, lastBinaryFrame, lightPoints, lockedPoint, sensorTimeStamp, lastRoi)
+
+def get_roi(frameShape, sensorTimeStamp):
+    """
+    Window (x0, y0, x1, y1) to process around the locked point on this frame,
+    or None when the full frame has to be scanned. Only while tracking, a
+    lock near the centre alone does not narrow the preview or the scan.
+    """
+    global roiFramesSinceFullScan
+
+    if (not roiTrackingEnabled or not trackingEnabled or not currentlyLocked or roiFramesSinceFullScan >= roiReacquireInterval):
+        roiFramesSinceFullScan = 0
+        return None
+
+    i = lightPointTable.index(lockedName)
+    if (i < 0):
+        roiFramesSinceFullScan = 0
+        return None
+
+    estimated_x, estimated_y = lightPointTable.predict(sensorTimeStamp)
+    track = lightPointTable.active[i]
+    half_x = lockRadius + idRadius + abs(track["speed_x"]) * roiSpeedHorizon
+    half_y = lockRadius + idRadius + abs(track["speed_y"]) * roiSpeedHorizon
+
+    height, width = frameShape[:2]
+    x0 = int(constrain(estimated_x[i] - half_x, 0, width))
+    x1 = int(constrain(estimated_x[i] + half_x + 1, 0, width))
+    y0 = int(constrain(estimated_y[i] - half_y, 0, height))
+    y1 = int(constrain(estimated_y[i] + half_y + 1, 0, height))
+    if (x1 - x0 < 2 or y1 - y0 < 2):
+        roiFramesSinceFullScan = 0
+        return None
+
+    roiFramesSinceFullScan += 1
+    return (x0, y0, x1, y1)
+
+def detect(frame, sensorTimeStamp):
+    global roiFramesSinceFullScan, lastRoi, lastBinaryFrame
+
+    roi = get_roi(frame.shape, sensorTimeStamp)
+    lastRoi = roi
+    if (roi is not None):
+        frame = frame[roi[1]:roi[3], roi[0]:roi[2]]
+
+    # Convert to grayscale (unless it already is, e.g. a Y plane) and then to binary
+    try: 
+        if (frame.ndim == 2):
+            gray_frame = frame
+        else:
+            gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        b_frame = threshold_frame(gray_frame, roi)
+        lastBinaryFrame = b_frame
+
+        points, photometry = obtain_top_light_points(b_frame, gray_frame, 30)
+
+        if (roi is not None):
+            points = points + (roi[0], roi[1])
+
+        all_light_points = process_and_store_light_points(points, sensorTimeStamp, roi, photometry)
+
+        # Locked point lost inside the window, look at the whole frame next time
+        if (roi is not None):
+            i = lightPointTable.index(lockedName)
+            if (i < 0 or lightPointTable.active[i]["timestamp"] != sensorTimeStamp):
+                roiFramesSinceFullScan = roiReacquireInterval
         return all_light_points
     
     except cv2.error:
         print("Error: Could not convert frame to grayscale")
+        lastBinaryFrame = None
         return []
     
 
@@ -271,23 +1103,119 @@ def getLockedPoint(all_light_points, resolution, isButtonPressed=False,swLeft=Fa
     
     lockedPoint = LightPoint(name="ABCD", isVisible=False, x=0, y=0, age=0)
         
-    for i, (name, firstSeen, x, y, age, timestamp, _, _, _, _) in enumerate(all_light_points):
+    for i, (name, firstSeen, x, y, age, timestamp, speed_x, speed_y, _, _) in enumerate(all_light_points):
         if (name == lockedName):
             lockedPoint.name = name
             lockedPoint.x = x-resolution[0]/2
             lockedPoint.y = -(y-resolution[1]/2)
             lockedPoint.isVisible = (currentlyLocked and not isButtonPressed)
+            lockedPoint.speed_x = speed_x
+            lockedPoint.speed_y = -speed_y
+            lockedPoint.timestamp = timestamp
+            if (getattr(all_light_points, "covariance", None) is not None):
+                lockedPoint.covariance = all_light_points.covariance[i]
 
     return lockedPoint
 
-def setDetectionSettings(idRadiusIn, lockRadiusIn, lightLifetimeIn, lightThresholdIn, trackingEnabledIn):
-    global idRadius, lockRadius, lightLifetime, lightThreshold, trackingEnabled 
+def extrapolate_point(point, timestamp):
+    """
+    Copy of point moved along its filtered speed up to timestamp (ns), so a
+    command can be aimed where the target is now rather than where it was
+    when the frame was exposed. The latency is already compensated, so the
+    copy has age 0 (measured from timestamp).
+    """
+    delta_t = (timestamp - point.timestamp) / 1e9 if point.timestamp else 0.0
+    return LightPoint(point.name, point.isVisible,
+                      point.x + point.speed_x * delta_t,
+                      point.y + point.speed_y * delta_t,
+                      0, point.speed_x, point.speed_y, timestamp, point.covariance)
+
+def setDetectionSettings(idRadiusIn, lockRadiusIn, lightLifetimeIn, lightThresholdIn, trackingEnabledIn, thresholdMethodIn=None, thresholdSigmaIn=None):
+    global idRadius, lockRadius, lightLifetime, lightThreshold, trackingEnabled, thresholdMethod, thresholdSigma
     idRadius = idRadiusIn
     lockRadius = lockRadiusIn
     lightLifetime = lightLifetimeIn
     lightThreshold = lightThresholdIn
     trackingEnabled = trackingEnabledIn
+    if thresholdMethodIn is not None:
+        # Accept the strategy name or its index in THRESHOLD_METHODS
+        if not isinstance(thresholdMethodIn, str):
+            thresholdMethodIn = THRESHOLD_METHODS[int(thresholdMethodIn)]
+        if thresholdMethodIn in THRESHOLD_STRATEGIES:
+            if thresholdMethodIn != thresholdMethod:
+                backgroundModel.reset()
+            thresholdMethod = thresholdMethodIn
+        else:
+            print(f"Unknown threshold method: {thresholdMethodIn}")
+    if thresholdSigmaIn is not None:
+        thresholdSigma = float(thresholdSigmaIn)
+
+def setDetectionBackend(backendIn):
+    global detectionBackend
+    if backendIn not in ("contours", "components"):
+        print(f"Unknown detection backend: {backendIn}")
+        return
+    detectionBackend = backendIn
+
+def setRoiSettings(enabledIn, reacquireIntervalIn=None, speedHorizonIn=None):
+    global roiTrackingEnabled, roiReacquireInterval, roiSpeedHorizon, roiFramesSinceFullScan
+    roiTrackingEnabled = bool(enabledIn)
+    if reacquireIntervalIn is not None:
+        roiReacquireInterval = int(reacquireIntervalIn)
+    if speedHorizonIn is not None:
+        roiSpeedHorizon = float(speedHorizonIn)
+    roiFramesSinceFullScan = 0
+
+def setAssociationMethod(methodIn, maxSizeIn=None):
+    global associationMethod, hungarianMaxSize
+    if methodIn not in ("hungarian", "greedy", "first"):
+        print(f"Unknown association method: {methodIn}")
+        return
+    associationMethod = methodIn
+    if maxSizeIn is not None:
+        hungarianMaxSize = int(maxSizeIn)
+
+def setKalmanSettings(modelIn, processNoiseIn, measurementNoiseIn):
+    global kalmanModel, kalmanProcessNoise, kalmanMeasurementNoise, lightPointTable
+    if modelIn not in ("cv", "ca"):
+        print(f"Unknown Kalman model: {modelIn}")
+        return
+    kalmanProcessNoise = float(processNoiseIn)
+    kalmanMeasurementNoise = float(measurementNoiseIn)
+    if modelIn != kalmanModel:
+        # The state size changes, start over with fresh tracks
+        kalmanModel = modelIn
+        lightPointTable = TrackTable(model=kalmanModel, processNoise=kalmanProcessNoise, measurementNoise=kalmanMeasurementNoise)
+    else:
+        lightPointTable.processNoise = kalmanProcessNoise
+        lightPointTable.measurementNoise = kalmanMeasurementNoise
 
 def getTrackingEnabled():
     global trackingEnabled
-    return trackingEnabled
\ No newline at end of file
+    return trackingEnabled
+
+if __name__ == '__main__':
+    # Micro-benchmark of associate(): 30 detections x 30 tracks, spread over the
+    # frame, crowded (clusters of conflicting candidates) and fully gated, and
+    # the per cluster Hungarian solve against greedy for growing cluster sizes
+    import timeit
+
+    def best_ms(run, number=200):
+        return min(timeit.repeat(run, number=number, repeat=5))*1000/number
+
+    rng = np.random.default_rng(0)
+    for name, extent in (("spread", 1000.0), ("crowded", 60.0)):
+        tracks = rng.uniform(0, extent, (30, 2))
+        points = tracks + rng.normal(0, 2.0, (30, 2))
+        cost = ((points[:, None, :] - tracks[None, :, :])**2).sum(axis=-1)
+        gated = cost <= idRadius**2
+        print(f"associate 30x30 {name:8s} {int(gated.sum()):4d} gated pairs: {best_ms(lambda: associate(cost, gated, maxSize=hungarianMaxSize)):.3f} ms")
+    cost = rng.uniform(0, idRadius**2, (30, 30))
+    gated = np.ones_like(cost, dtype=bool)
+    print(f"associate 30x30 fully gated: {best_ms(lambda: associate(cost, gated, maxSize=hungarianMaxSize)):.3f} ms")
+
+    for size in (2, 4, 6, 8, 12):
+        cost = rng.uniform(0, idRadius**2, (size, size))
+        gated = np.ones_like(cost, dtype=bool)
+        print(f"cluster {size:2d}x{size:<2d} hungarian {best_ms(lambda: assign_hungarian(cost)):.3f} ms, "
+              f"greedy {best_ms(lambda: assign_greedy(cost, gated)):.3f} ms")
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+import math
+import numpy as np
+
+# ====== WGS84 ======
+WGS84_A = 6378137.0
+WGS84_F = 1/298.257223563
+WGS84_B = WGS84_A*(1 - WGS84_F)
+WGS84_E2 = 1 - (WGS84_B*WGS84_B)/(WGS84_A*WGS84_A)
+R_EARTH = 6371000.0
+
+# Every function takes scalars or NumPy arrays (broadcast), degrees and metres
+
+def geodetic_to_ecef(lat, lon, h):
+    lat, lon = np.radians(lat), np.radians(lon)
+    slat = np.sin(lat)
+    N = WGS84_A / np.sqrt(1 - WGS84_E2*slat*slat)
+    x = (N + h) * np.cos(lat) * np.cos(lon)
+    y = (N + h) * np.cos(lat) * np.sin(lon)
+    z = (N*(1 - WGS84_E2) + h) * slat
+    return x, y, z
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lat2 = np.radians(lat1), np.radians(lat2)
+    dlat = lat2 - lat1
+    dlon = np.radians(np.subtract(lon2, lon1))
+    a_ = np.sin(dlat/2)**2 + np.cos(lat1)*np.cos(lat2)*np.sin(dlon/2)**2
+    c = 2*np.arctan2(np.sqrt(a_), np.sqrt(1 - a_))
+    return (R_EARTH * c) / 1000.0
+
+def bearing_deg(lat1, lon1, lat2, lon2):
+    lat1, lat2 = np.radians(lat1), np.radians(lat2)
+    dlon = np.radians(np.subtract(lon2, lon1))
+    y = np.sin(dlon) * np.cos(lat2)
+    x = np.cos(lat1)*np.sin(lat2) - np.sin(lat1)*np.cos(lat2)*np.cos(dlon)
+    return (np.degrees(np.arctan2(y, x)) + 360) % 360
+
+def enu_look(e, n, u):
+    """Azimuth (0-360), elevation (deg) and slant range (km) of ENU offsets in metres."""
+    slant = np.sqrt(e*e + n*n + u*u)
+    az = (np.degrees(np.arctan2(e, n)) + 360.0) % 360.0
+    el = np.degrees(np.arcsin(np.divide(u, slant, out=np.zeros_like(slant), where=slant > 0)))
+    return az, el, slant/1000.0
+
+def radial_speed(gs_mps, track_deg, bearing):
+    """Ground speed component towards the site (positive when approaching), NaN without gs/track."""
+    return -np.asarray(gs_mps, dtype=np.float64) * np.cos(np.radians((np.asarray(track_deg, dtype=np.float64) - bearing + 540) % 360 - 180))
+
+
+class Site:
+    """
+    Observer position with its ECEF coordinates and ENU rotation computed
+    once, so converting targets is one matrix product and a few array ops
+    for the whole list instead of recomputing the site trig per target.
+    """
+    def __init__(self, lat, lon, alt):
+        self.lat, self.lon, self.alt = float(lat), float(lon), float(alt)
+        self.ecef = np.array(geodetic_to_ecef(self.lat, self.lon, self.alt), dtype=np.float64)
+        slat, clat = math.sin(math.radians(self.lat)), math.cos(math.radians(self.lat))
+        slon, clon = math.sin(math.radians(self.lon)), math.cos(math.radians(self.lon))
+        # Rows: east, north, up
+        self.rotation = np.array([[-slon,       clon,      0.0],
+                                  [-clon*slat, -slon*slat, clat],
+                                  [ clon*clat,  slon*clat, slat]])
+
+    def key(self):
+        return (self.lat, self.lon, self.alt)
+
+    def enu(self, lat, lon, h):
+        """(e, n, u) in metres of targets at lat/lon/h, arrays of shape (N,)."""
+        ecef = np.stack(np.broadcast_arrays(*geodetic_to_ecef(lat, lon, h)), axis=-1)
+        e, n, u = np.moveaxis((ecef - self.ecef) @ self.rotation.T, -1, 0)
+        return e, n, u
+
+    def look(self, lat, lon, h):
+        """Azimuth (0-360), elevation (deg) and slant range (km)."""
+        return enu_look(*self.enu(lat, lon, h))
+
+    def observe(self, lat, lon, h, gs_mps=None, track_deg=None):
+        """
+        Everything the ADS-B list shows for a batch of targets in one pass:
+        az, el, slant_km, gnd_km, bearing (site -> target) and radial_mps
+        (positive when approaching, NaN where gs or track is missing).
+        """
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        az, el, slant_km = self.look(lat, lon, h)
+        result = {"az": az, "el": el, "slant_km": slant_km,
+                  "gnd_km": haversine_km(self.lat, self.lon, lat, lon),
+                  "bearing": bearing_deg(self.lat, self.lon, lat, lon)}
+        if gs_mps is not None and track_deg is not None:
+            result["radial_mps"] = radial_speed(gs_mps, track_deg, result["bearing"])
+        return result
+
+
+if __name__ == "__main__":
+    # Micro-benchmark: 1000 aircraft, scalar math per aircraft (the previous
+    # adsb_to_rot_webui path) against one Site.observe() pass
+    import time
+
+    def scalar_observe(lat, lon, h, gs, track, lat0, lon0, h0):
+        def ecef(lat, lon, h):
+            lat, lon = math.radians(lat), math.radians(lon)
+            N = WGS84_A / math.sqrt(1 - WGS84_E2*math.sin(lat)**2)
+            return ((N + h)*math.cos(lat)*math.cos(lon), (N + h)*math.cos(lat)*math.sin(lon), (N*(1 - WGS84_E2) + h)*math.sin(lat))
+        x, y, z = ecef(lat, lon, h)
+        x0, y0, z0 = ecef(lat0, lon0, h0)
+        dx, dy, dz = x - x0, y - y0, z - z0
+        slat, clat = math.sin(math.radians(lat0)), math.cos(math.radians(lat0))
+        slon, clon = math.sin(math.radians(lon0)), math.cos(math.radians(lon0))
+        e = -slon*dx + clon*dy
+        n = -clon*slat*dx - slon*slat*dy + clat*dz
+        u = clon*clat*dx + slon*clat*dy + slat*dz
+        az = (math.degrees(math.atan2(e, n)) + 360.0) % 360.0
+        slant = math.sqrt(e*e + n*n + u*u)
+        el = math.degrees(math.asin(u/slant))
+        dlat, dlon = math.radians(lat - lat0), math.radians(lon - lon0)
+        a_ = math.sin(dlat/2)**2 + math.cos(math.radians(lat0))*math.cos(math.radians(lat))*math.sin(dlon/2)**2
+        gnd = R_EARTH*2*math.atan2(math.sqrt(a_), math.sqrt(1 - a_))/1000.0
+        yb = math.sin(dlon)*math.cos(math.radians(lat))
+        xb = math.cos(math.radians(lat0))*math.sin(math.radians(lat)) - math.sin(math.radians(lat0))*math.cos(math.radians(lat))*math.cos(dlon)
+        brg = (math.degrees(math.atan2(yb, xb)) + 360) % 360
+        radial = -gs*math.cos(math.radians((track - brg + 540) % 360 - 180))
+        return az, el, slant/1000.0, gnd, radial
+
+    rng = np.random.default_rng(0)
+    lat0, lon0, h0 = 46.5323, 6.5910, 400.0
+    N = 1000
+    lat = lat0 + rng.uniform(-1.5, 1.5, N)
+    lon = lon0 + rng.uniform(-2.0, 2.0, N)
+    h = rng.uniform(300, 12000, N)
+    gs = rng.uniform(50, 250, N)
+    track = rng.uniform(0, 360, N)
+
+    runs = 50
+    start = time.perf_counter()
+    for _ in range(runs):
+        reference = [scalar_observe(lat[i], lon[i], h[i], gs[i], track[i], lat0, lon0, h0) for i in range(N)]
+    scalarMs = (time.perf_counter() - start)/runs*1000
+
+    site = Site(lat0, lon0, h0)
+    start = time.perf_counter()
+    for _ in range(runs):
+        result = site.observe(lat, lon, h, gs, track)
+    vectorMs = (time.perf_counter() - start)/runs*1000
+
+    reference = np.array(reference)
+    error = max(np.abs(np.array([result["az"], result["el"], result["slant_km"], result["gnd_km"], result["radial_mps"]]).T - reference).max(axis=0))
+    print(f"{N} aircraft: scalar {scalarMs:.2f} ms, Site.observe {vectorMs:.3f} ms ({scalarMs/vectorMs:.0f}x), max abs diff {error:.2e}")
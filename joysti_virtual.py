@@ -1,7 +1,7 @@
 import tkinter as tk
-import struct
 import socket
 import time
+from packets import encode_joystick
 
 # Constantes para el encabezado del paquete
 PRA = 0xFF
@@ -25,13 +25,7 @@ def send_udp_packet(packet):
             raise
 
 def create_packet(x, y, throttle, trigger):
-    joystick_data = struct.pack(
-        'iiiiiiff', 1, trigger, int(x * 100), int(y * 100), 0, 99, throttle, 30
-    )
-    encoded_packet = bytes([PRA, PRB, 1, len(joystick_data)]) + joystick_data
-    checksum = sum(joystick_data) & 0xFF
-    encoded_packet += bytes([checksum])
-    return encoded_packet
+    return encode_joystick(x, y, throttle, trigger)
 
 def update_values():
     try:
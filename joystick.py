@@ -1,8 +1,8 @@
 import pygame
 import time
 import serial
-import struct
 import socket
+from packets import encode_joystick
 
 # Constants for the packet header
 PRA = 0xFF
@@ -74,11 +74,7 @@ try:
         
         if (joystickInitialised): 
             # Encode joystick data
-            joystick_data = struct.pack('iiiiiiff',1,trigger,int(x_axis*100),int(y_axis*100), 0, 99, 1.0, 30)
-            encoded_packet = bytes([PRA, PRB, 1, len(joystick_data)]) + joystick_data
-            # # Calculate and set the checksum
-            checksum = sum(joystick_data) & 0xFF
-            encoded_packet += bytes([checksum])
+            encoded_packet = encode_joystick(x_axis, y_axis, 1.0, trigger)
 
             # Send the encoded packet over UDP
             send_udp_packet(encoded_packet)
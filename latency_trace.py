@@ -0,0 +1,142 @@
+import time
+import numpy as np
+from telemetry_bus import open_forward_log
+
+# Stamps of one frame through the loop, CLOCK_MONOTONIC ns, 0 = stage not reached
+#   capture       exposure (frame timestamp, see camera.sensorClock)
+#   arrival       the capture thread got the frame from the driver
+#   detect_start  / detect_end around detect()
+#   send          command sent to the Teensy (or the hub)
+#   hub_received  / hub_sent  the hub got / forwarded that command (teensy_hub ForwardLog)
+TRACE_STAGES = ("capture", "arrival", "detect_start", "detect_end", "send", "hub_received", "hub_sent")
+TRACE_DTYPE = np.dtype([("frame", np.uint64)] + [(stage, np.int64) for stage in TRACE_STAGES])
+
+# Reported intervals, name -> (from stage, to stage)
+TRACE_INTERVALS = {
+    "capture": ("capture", "arrival"),
+    "queue": ("arrival", "detect_start"),
+    "detect": ("detect_start", "detect_end"),
+    "command": ("detect_end", "send"),
+    "to_hub": ("send", "hub_received"),
+    "hub": ("hub_received", "hub_sent"),
+    "photon_to_send": ("capture", "send"),
+    "photon_to_teensy": ("capture", "hub_sent"),
+}
+
+TRACE_CAPACITY = 4096
+# A hub record is only matched to a send that happened at most this long before
+HUB_MATCH_WINDOW = 50_000_000
+FORWARD_LOG_RETRY = 2.0
+# Hub port our commands come in on (ForwardLog "port"): the iptables REDIRECT port of
+# teensy_hub when sending to the Teensy address, 9101-9105 when sending to a client port
+HUB_PORT = 9199
+# The dump is flushed every this many records, so a killed process loses at most these
+DUMP_FLUSH_EVERY = 64
+
+class LatencyTracer:
+    """
+    Per frame latency stamps from capture to the command leaving the hub.
+
+    The tracking thread is the only writer: begin() a frame, mark() each
+    stage, commit() at the end of the loop. Records go into a NumPy ring
+    without a lock, the slot being written is never part of a stats()
+    snapshot. The hub stages are read from the hub's ForwardLog (shared
+    memory) when the next frame is committed, so the ring and the dump
+    lag one frame behind.
+
+    With dumpPath every complete record is appended raw to that file, read
+    it back with np.fromfile(dumpPath, dtype=TRACE_DTYPE). close() it on exit
+    to store the last frame and flush the tail.
+
+    Only hub records of packetId that came in on hubPort are ours, the hub
+    also forwards the commands of other clients (joysticks, ADS-B bridges).
+    """
+    def __init__(self, capacity=TRACE_CAPACITY, dumpPath=None, packetId=0x01, hubPort=HUB_PORT):
+        self.capacity = capacity
+        self.records = np.zeros(capacity, dtype=TRACE_DTYPE)
+        self.written = 0
+        self.frames = 0
+        self.packetId = packetId
+        self.hubPort = hubPort
+        self.current = np.zeros(1, dtype=TRACE_DTYPE)
+        self.previous = None
+        self.dump = open(dumpPath, "ab") if dumpPath else None
+        self.forwardLog = None
+        self.nextForwardLogTry = 0.0
+
+    def begin(self, capture, arrival=0):
+        self.current[0] = 0
+        self.current["frame"] = self.frames
+        self.current["capture"] = capture or 0
+        self.current["arrival"] = arrival or 0
+        self.frames += 1
+
+    def mark(self, stage, t=None):
+        self.current[stage] = time.monotonic_ns() if t is None else t
+
+    def commit(self):
+        if self.previous is not None:
+            self._match_hub(self.previous)
+            self._store(self.previous)
+        self.previous = self.current.copy()
+
+    def _store(self, record):
+        self.records[self.written % self.capacity] = record[0]
+        self.written += 1
+        if self.dump is not None:
+            self.dump.write(record.tobytes())
+            if self.written % DUMP_FLUSH_EVERY == 0:
+                self.dump.flush()
+
+    def _match_hub(self, record):
+        send = int(record["send"][0])
+        if not send:
+            return
+        if self.forwardLog is None or self.forwardLog.closed:
+            now = time.monotonic()
+            if now < self.nextForwardLogTry:
+                return
+            self.nextForwardLogTry = now + FORWARD_LOG_RETRY
+            self.forwardLog = open_forward_log()
+            if self.forwardLog is None:
+                return
+        forwards = self.forwardLog.window(count=32)
+        forwards = forwards[(forwards["packetId"] == self.packetId) & (forwards["port"] == self.hubPort)]
+        received = np.rint(forwards["received"]*1e9).astype(np.int64)
+        sent = np.rint(forwards["sent"]*1e9).astype(np.int64)
+        # First command the hub received after our send
+        i = np.searchsorted(received, send)
+        if i < len(received) and received[i] - send <= HUB_MATCH_WINDOW:
+            record["hub_received"] = received[i]
+            record["hub_sent"] = sent[i]
+
+    def snapshot(self):
+        """Copy of the stored records, oldest first."""
+        n = self.written
+        count = min(n, self.capacity - 1)
+        index = np.arange(n - count, n) % self.capacity
+        return self.records[index].copy()
+
+    def stats(self):
+        records = self.snapshot()
+        intervals = {}
+        for name, (start, end) in TRACE_INTERVALS.items():
+            valid = (records[start] > 0) & (records[end] > 0)
+            ms = (records[end][valid] - records[start][valid])/1e6
+            if len(ms) == 0:
+                intervals[name] = {"count": 0}
+                continue
+            p50, p90, p99 = np.percentile(ms, [50, 90, 99])
+            intervals[name] = {"count": int(len(ms)), "p50": round(float(p50), 3), "p90": round(float(p90), 3),
+                               "p99": round(float(p99), 3), "max": round(float(ms.max()), 3)}
+        return {"frames": self.frames, "window": int(len(records)), "hub": self.forwardLog is not None,
+                "dump": self.dump.name if self.dump is not None else None, "intervalsMs": intervals}
+
+    def close(self):
+        if self.previous is not None:
+            self._match_hub(self.previous)
+            self._store(self.previous)
+            self.previous = None
+        if self.dump is not None:
+            self.dump.close()
+            self.dump = None
@@ -1,4 +1,4 @@
-from flask import Flask, render_template, Response, request, stream_with_context
+from flask import Flask, render_template, Response, request, stream_with_context, jsonify
 import numpy as np
 from communication import *
 from camera import *
@@ -8,11 +8,17 @@ import cv2
 import time
 from detection import *
 import math
+import copy
+import atexit
+from streaming import *
+from telemetry_bus import open_telemetry_reader
+from telemetry_history import PoseHistory
+from latency_trace import LatencyTracer
 
 app = Flask(__name__)
 
 #camInit(30) False O True para invertir la imagen 
-camInit(120, True, True)
+camInit(120, True, True, grayStream=True)
 
 img_width = 800
 img_height = 606
@@ -24,6 +30,28 @@ camRes = (img_width, img_height)
 INVERT_X = +1   # pon -1 si ves que va al revés en AZ
 INVERT_Y = +1   # pon -1 si va al revés en EL
 
+# Send the Kalman-extrapolated target position at command time instead of the
+# position measured on the frame, with age 0 so the Teensy does not compensate
+# the frame latency a second time
+EXTRAPOLATE_TO_COMMAND_TIME = False
+
+# Once locked while tracking, only detect in a window around the target, full frame scan
+# every 30 frames. Off until it has been measured on the Pi
+setRoiSettings(False, 30)
+
+# Preview is encoded once for all /video_feed clients, capped at 30 fps
+PREVIEW_MAX_FPS = 30
+PREVIEW_QUALITY = 100
+# JPEG backend: "auto" (TurboJPEG if installed, else OpenCV), "opencv", "turbo",
+# or "hardware" to send the colour view straight from the MJPEG encoder on the
+# lores stream (no overlay, the binary view still uses "auto")
+PREVIEW_BACKEND = "auto"
+
+# Latency traces (capture -> detection -> command -> hub), percentiles on /latency.
+# Set to a path (e.g. "/tmp/newTracker_trace.bin") to also dump every raw trace,
+# read it with np.fromfile(path, dtype=latency_trace.TRACE_DTYPE)
+LATENCY_TRACE_FILE = None
+
 # --- Override UDP target to local hub ---
 UDP_IP_TRACKER = '127.0.0.1'
 UDP_PORT = 9101
@@ -50,6 +78,8 @@ input_values = {
     "gain": 1.0,
     "exposureTime": 100,
     "scanWaitTime": 5,
+    "thresholdMethod": 0,  # Index in THRESHOLD_METHODS
+    "thresholdSigma": 5,
     "trackingEnabled": 0
 }
 
@@ -71,12 +101,14 @@ LightPointArray = [LightPoint(name="ABCD", isVisible=False, x=0, y=0, age = 0) f
 all_light_points = []
 
 startTime = time.time()
-firstTimeNoted = False
-timeOffset = 0
-timeOffsetAverage = 0
 trackingEnabled = False
 
 trackerAzmGlobal = 0
+# Pose history in CLOCK_MONOTONIC seconds (same clock as the frame timestamps), to get the pose when a frame was exposed
+trackerHistory = PoseHistory()
+
+tracer = LatencyTracer(dumpPath=LATENCY_TRACE_FILE)
+atexit.register(tracer.close)
 trackerElvGlobal = 0
 
 scanInProgress = False
@@ -85,7 +117,17 @@ def udp_receiver():
     global trackerAzmGlobal, trackerElvGlobal
     """
     Hilo para recibir datos UDP y actualizar azimut y elevación en el servidor.
+    Con el hub corriendo, lee el bus de telemetría en memoria compartida.
     """
+    bus = open_telemetry_reader()
+    if bus is not None:
+        print("Leyendo az/el del bus de telemetría del hub")
+        for sample in bus.follow():
+            if sample["packetId"] == 33:
+                trackerAzmGlobal, trackerElvGlobal = float(sample["az"]), float(sample["el"])
+                trackerHistory.add(float(sample["t_mono"]), trackerAzmGlobal, trackerElvGlobal)
+        return
+
     udp_ip = '127.0.0.1' # antigua ip 0.0.0.0 
     udp_port = 9001   #--8888
 
@@ -99,7 +141,8 @@ def udp_receiver():
             if len(data) >= 12:
                 packet_id = data[2]
                 if packet_id == 33:
-                    trackerAzmGlobal, trackerElvGlobal = struct.unpack_from('<ff', data, offset=4)
+                    trackerAzmGlobal, trackerElvGlobal = ANGLES.decode(data, 4)
+                    trackerHistory.add(time.monotonic(), trackerAzmGlobal, trackerElvGlobal)
                     # print(trackerAzmGlobal, trackerElvGlobal)
         except Exception as e:
             print(f"Error en UDP receiver: {e}")
@@ -107,272 +150,275 @@ def udp_receiver():
 
 def sendSettingToTracker():
     global input_values, sock
-    # Send the target point to the teensy, the structure should be copied in a byte array then encoded then sent
-    packet_id = 0x10
-    # Pack the struct in a byte array
-
-    payload_data = struct.pack('iiiiiii', np.int32(input_values["idRadius"]), np.int32(input_values["lockRadius"]), np.int32(input_values["lightLifetime"]), np.int32(input_values["lightThreshold"]), np.int32(input_values["switchFrame"]), np.int32(input_values["exposureTime"]), np.int32(input_values["trackingEnabled"]))
-    packet_length = len(payload_data)
-    encoded_packet = capsule_instance.encode(packet_id, payload_data, packet_length)
-    encoded_packet = bytearray(encoded_packet)
-    sock.sendto(encoded_packet, (UDP_IP_TRACKER, UDP_PORT))
+    # Send the settings to the tracker (packet 0x10, see packets.SETTINGS)
+    SETTINGS.sendto(sock, (UDP_IP_TRACKER, UDP_PORT), int(input_values["idRadius"]), int(input_values["lockRadius"]), int(input_values["lightLifetime"]), int(input_values["lightThreshold"]), int(input_values["switchFrame"]), int(input_values["exposureTime"]), int(input_values["trackingEnabled"]))
     print("Sent settings to tracker")
 
-def generate_frames():
-    global LightPointArray, input_values, resolution, picam2, xPos, yPos, img_width, img_height, all_light_points
-
-    frame = None
-
-    while True:
-        frame, sensorTimeStamp = server.wait_for_frame(frame)
-        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)  # Conversión de color
-
-        # frame = cv2.rotate(frame, cv2.ROTATE_90_COUNTERCLOCKWISE)
-        # Vertical flip 
-        # frame = cv2.flip(frame, 0)
-        # Horizontal flip
-        # frame = cv2.flip(frame, 1)
-
-        LightPointArray = [LightPoint(name="ABCD", isVisible=False, x=0, y=0, age=0) for _ in range(10)]
-
-        # Print only the first 3 light points with their name, position x and y only.
-        for i, (name, _, x, y, age, _, speed_x, speed_y, acceleration_x, acceleration_y) in enumerate(all_light_points[:10]):
-            # print("Point %d: (%s, %d, %d, %d, %d, %d, %d)" % (i + 1, name, x, y, speed_x, speed_y, acceleration_x, acceleration_y))
-            LightPointArray[i] = LightPoint(name, 1, x, y, age)
-
-
-        # Encode the frame
-        if (input_values["switchFrame"] == 0):
-            gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-
-            # Create a second frame with only the blue channel using cv2.cvtColor
-            # Split the frame into its individual channels
-            # blue_channel, green_channel, red_channel = cv2.split(frame)
-
-            # # Set green and red channels to zero
-            # green_channel[:] = 0
-            # red_channel[:] = 0
+# Preview state, only touched by the broadcaster thread
+previewResult = None
+previewRaw = None
+previewColourClient = False
+previewJpeg = None
+hardwarePreview = HardwareMjpegStream(picam2, 'lores', PREVIEW_QUALITY) if PREVIEW_BACKEND == "hardware" else None
 
-            # # Merge the channels back into a BGR frame
-            # blue_frame = cv2.merge((blue_channel, green_channel, red_channel))
+def render_hardware_preview():
+    global hardwarePreview, previewJpeg
 
-
-            # METHOD 1
-            _dummy, b_frame = cv2.threshold(gray_frame,np.int32(input_values["lightThreshold"]), 255, cv2.THRESH_BINARY)
-
-            # METHOD 2
-            # # Apply morphological dilation
-            # kernel = np.ones((3, 3), np.uint8)
-            # dilated = cv2.dilate(gray_frame, kernel)
-
-            # # Compute the difference between the original and dilated image
-            # diff = cv2.absdiff(dilated, gray_frame)
-
-            # # Optionally, you can further threshold the difference image
-            # _, b_frame = cv2.threshold(diff, np.int32(input_values["lightThreshold"]), 255, cv2.THRESH_BINARY)
-
-            # METHOD 3 
-            # Compute the gradient magnitude using Sobel operators
-            # gradient_x = cv2.Sobel(gray_frame, cv2.CV_64F, 1, 0, ksize=3)
-            # gradient_y = cv2.Sobel(gray_frame, cv2.CV_64F, 0, 1, ksize=3)
-            # gradient_magnitude = np.sqrt(gradient_x**2 + gradient_y**2)
-
-            # # Normalize gradient magnitude to [0, 255]
-            # gradient_magnitude_normalized = cv2.normalize(gradient_magnitude, None, 0, 255, cv2.NORM_MINMAX, cv2.CV_8U)
-
-            # # Threshold the gradient magnitude image
-            # _, thresh = cv2.threshold(gradient_magnitude_normalized, np.int32(input_values["lightThreshold"]), 255, cv2.THRESH_BINARY)
-
-            # # Perform non-maximum suppression
-            # b_frame = cv2.dilate(thresh, None)
-
-            cv2.circle(b_frame, (400,303), input_values["lockRadius"], 255, 2)
-            for point in LightPointArray:
-                cv2.circle(b_frame, (point.x, point.y), 5, 255, -1)
-                cv2.putText(b_frame, point.name, (point.x, point.y), cv2.FONT_HERSHEY_SIMPLEX, 1, 255, 2, cv2.LINE_AA)
-
-            _, buffer = cv2.imencode('.jpg', b_frame,  [int(cv2.IMWRITE_JPEG_QUALITY), 100])
-            b_frame = buffer.tobytes()
-            yield (b'--frame\r\n'
-               b'Content-Type: image/jpg\r\n\r\n' + b_frame + b'\r\n')
-        else:
-            cv2.circle(frame, (400,303), input_values["lockRadius"], (0, 0, 255), 2)
-            for point in LightPointArray:
-               cv2.circle(frame, (point.x, point.y), 5, (0, 0, 255), -1)
-               cv2.putText(frame, point.name, (point.x, point.y), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2, cv2.LINE_AA)
-            _, buffer = cv2.imencode('.jpg', frame,  [int(cv2.IMWRITE_JPEG_QUALITY), 100])
-            b_frame = buffer.tobytes() 
-            yield (b'--frame\r\n'
-               b'Content-Type: image/jpg\r\n\r\n' + b_frame + b'\r\n')
-            
-        # # Encode the frame
-            
-        # gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        # _dummy, b_frame = cv2.threshold(gray_frame,np.int32(input_values["lightThreshold"]), 255, cv2.THRESH_BINARY)
-
-        # if (input_values["switchFrame"] == 0):
-        #     cv2.circle(b_frame, (400,303), input_values["lockRadius"], 255, 2)
-        #     for point in LightPointArray:
-        #         cv2.circle(b_frame, (point.x, point.y), 5, 255, -1)
-        #         cv2.putText(b_frame, point.name, (point.x, point.y), cv2.FONT_HERSHEY_SIMPLEX, 1, 255, 2, cv2.LINE_AA)
-        #     _, buffer = cv2.imencode('.jpg', b_frame)
-        #     b_frame = buffer.tobytes()
-        #     yield (b'--frame\r\n'
-        #        b'Content-Type: image/jpeg\r\n\r\n' + b_frame + b'\r\n')
-        # else:
-        #     cv2.circle(frame, (400,303), input_values["lockRadius"], (0, 0, 255), 2)
-        #     for point in LightPointArray:
-        #         cv2.circle(frame, (point.x, point.y), 5, (0, 0, 255), -1)
-        #         cv2.putText(frame, point.name, (point.x, point.y), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2, cv2.LINE_AA)
-        #     _, buffer = cv2.imencode('.jpg', frame)
-        #     b_frame = buffer.tobytes() 
-        #     yield (b'--frame\r\n'
-        #        b'Content-Type: image/jpeg\r\n\r\n' + b_frame + b'\r\n')
+    if (not hardwarePreview.running):
+        try:
+            hardwarePreview.start()
+        except Exception as e:
+            print("Hardware MJPEG encoder not available, encoding in software:", e)
+            hardwarePreview = None
+            return None
+    jpeg = hardwarePreview.wait_for_jpeg(previewJpeg, timeout=0.5)
+    if (jpeg is not None):
+        previewJpeg = jpeg
+    return jpeg
+
+def render_preview():
+    global LightPointArray, input_values, resolution, picam2, xPos, yPos, img_width, img_height, previewResult, previewRaw, previewColourClient
+
+    switchFrame = input_values["switchFrame"]
+    if (hardwarePreview is not None):
+        if (switchFrame != 0):
+            return render_hardware_preview()
+        if (hardwarePreview.running):
+            hardwarePreview.stop()
+
+    # Detection already ran in tracking_loop, only draw here
+    result = server.wait_for_result(previewResult, timeout=0.5)
+    if (result is None or result is previewResult):
+        return None
+    previewResult = result
+
+    if (switchFrame == 0):
+        # The binary view comes from the published result, stop the colour copy
+        if (previewColourClient):
+            server.remove_colour_client()
+            previewColourClient = False
+    else:
+        if (not previewColourClient):
+            server.add_colour_client()
+            previewColourClient = True
+        previewRaw, sensorTimeStamp = server.wait_for_frame(previewRaw)
+        frame = cv2.cvtColor(previewRaw, cv2.COLOR_BGR2RGB)  # Conversión de color
+
+    # frame = cv2.rotate(frame, cv2.ROTATE_90_COUNTERCLOCKWISE)
+    # Vertical flip 
+    # frame = cv2.flip(frame, 0)
+    # Horizontal flip
+    # frame = cv2.flip(frame, 1)
+
+    LightPointArray = [LightPoint(name="ABCD", isVisible=False, x=0, y=0, age=0) for _ in range(10)]
+
+    # Print only the first 3 light points with their name, position x and y only.
+    for i, (name, _, x, y, age, _, speed_x, speed_y, acceleration_x, acceleration_y) in enumerate(result.lightPoints[:10]):
+        # print("Point %d: (%s, %d, %d, %d, %d, %d, %d)" % (i + 1, name, x, y, speed_x, speed_y, acceleration_x, acceleration_y))
+        LightPointArray[i] = LightPoint(name, 1, x, y, age)
+
+    locked = result.lockedPoint
+    lockedCenter = None
+    if (locked is not None and locked.isVisible):
+        lockedCenter = (int(locked.x + img_width/2), int(-locked.y + img_height/2))
+
+    if (switchFrame == 0):
+        # Binary frame of the detection (black outside the tracking window)
+        b_frame = result.full_binary_frame()
+
+        cv2.circle(b_frame, (400,303), input_values["lockRadius"], 255, 2)
+        if (result.roi is not None):
+            cv2.rectangle(b_frame, result.roi[:2], result.roi[2:], 255, 1)
+        for point in LightPointArray:
+            center = (round(point.x), round(point.y))
+            cv2.circle(b_frame, center, 5, 255, -1)
+            cv2.putText(b_frame, point.name, center, cv2.FONT_HERSHEY_SIMPLEX, 1, 255, 2, cv2.LINE_AA)
+        if (lockedCenter is not None):
+            cv2.circle(b_frame, lockedCenter, 12, 255, 2)
+        return b_frame
+    else:
+        cv2.circle(frame, (400,303), input_values["lockRadius"], (0, 0, 255), 2)
+        for point in LightPointArray:
+           center = (round(point.x), round(point.y))
+           cv2.circle(frame, center, 5, (0, 0, 255), -1)
+           cv2.putText(frame, point.name, center, cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2, cv2.LINE_AA)
+        if (lockedCenter is not None):
+            cv2.circle(frame, lockedCenter, 12, (0, 255, 0), 2)
+        return frame
+
+def stop_preview():
+    global previewColourClient, previewResult
+    # Nobody is watching, stop copying the colour frame
+    if (previewColourClient):
+        server.remove_colour_client()
+        previewColourClient = False
+    if (hardwarePreview is not None and hardwarePreview.running):
+        hardwarePreview.stop()
+    previewResult = None
+
+broadcaster = JpegBroadcaster(render_preview, maxFps=PREVIEW_MAX_FPS, quality=PREVIEW_QUALITY, onIdle=stop_preview,
+                              backend="auto" if PREVIEW_BACKEND == "hardware" else PREVIEW_BACKEND)
 
 def tracking_loop():
 
-    global LightPointArray, all_light_points, input_values, resolution, picam2, xPos, yPos, img_width, img_height, startTime, firstTimeNoted, timeOffset, timeOffsetAverage, trackingEnabled, joystickX, joystickY, joystickBtn, swUp, swDown, swLeft, swRight, scanInProgress, trackerAzmGlobal, trackerElvGlobal
+    global LightPointArray, all_light_points, input_values, resolution, picam2, xPos, yPos, img_width, img_height, startTime, trackingEnabled, joystickX, joystickY, joystickBtn, swUp, swDown, swLeft, swRight, scanInProgress, trackerAzmGlobal, trackerElvGlobal
 
     frame = None
     
     while True:
         
-        if (not firstTimeNoted):
-            frame,sensorTimeStamp = server.wait_for_frame(frame)
-            firstTimeNoted = True
-
-            numberOfFrames = 0
-
-            while (numberOfFrames < 100):
-                frame, sensorTimeStamp = getFrame()
-                print(np.int64((time.time()-startTime)*1e9), sensorTimeStamp)
-                timeOffset += (np.int64((time.time()-startTime)*1e9) - sensorTimeStamp)
-                numberOfFrames += 1
-
-            timeOffset /= numberOfFrames
-            timeOffsetAverage = np.int64(timeOffset)
+        frame,sensorTimeStamp = server.wait_for_gray(frame)
+        tracer.begin(sensorTimeStamp, server.arrival)
 
-        else:
-            frame,sensorTimeStamp = server.wait_for_frame(frame)
-
-            # Rotate frame by 90° to the left
-            all_light_points = detect(frame, sensorTimeStamp)
+        # Detection runs directly on the Y plane, no colour conversion
+        tracer.mark("detect_start")
+        all_light_points = detect(frame, sensorTimeStamp)
+        tracer.mark("detect_end")
+        
+        if (scanInProgress): 
+            server.publish_result(make_detection_result(frame, all_light_points, None, sensorTimeStamp))
             
-            if (scanInProgress): 
-                
-                # Constants
-                image_width = 800  # Image width in pixels
-                image_height = 606  # Image height in pixels
-                fov_horizontal = 14.8154  # Field of view in degrees (horizontal)
-                fov_vertical = 10.8134  # Field of view in degrees (vertical)
-
-
-                # Calculate degrees per pixel
-                deg_per_pixel_h = fov_horizontal / image_width
-                deg_per_pixel_v = fov_vertical / image_height
-
-                # Create the new list with azimuth and elevation coordinates
-                light_points_with_coordinates = [
-                    (
-                        name, 
-                        trackerAzmGlobal + ((x-image_width/2.0) * deg_per_pixel_h),  # Absolute azimuth
-                        trackerElvGlobal + (-(y-image_height/2.0) * deg_per_pixel_v)   # Absolute elevation
-                    )
-                    for name, firstSeen, x, y, age, timestamp, speed_x, speed_y, acceleration_x, acceleration_y in all_light_points
-                ]
-                
-                print(light_points_with_coordinates)
+            # Constants
+            image_width = 800  # Image width in pixels
+            image_height = 606  # Image height in pixels
+            fov_horizontal = 14.8154  # Field of view in degrees (horizontal)
+            fov_vertical = 10.8134  # Field of view in degrees (vertical)
+
+
+            # Calculate degrees per pixel
+            deg_per_pixel_h = fov_horizontal / image_width
+            deg_per_pixel_v = fov_vertical / image_height
+
+            # Mount pose when the frame was exposed, the last one if the history does not cover it
+            frameTime = sensorTimeStamp/1e9
+            framePose = trackerHistory.pose_at(frameTime)
+            frameAzm, frameElv = framePose if framePose is not None else (trackerAzmGlobal, trackerElvGlobal)
+
+            # Create the new list with azimuth and elevation coordinates
+            light_points_with_coordinates = [
+                (
+                    name, 
+                    frameAzm + ((x-image_width/2.0) * deg_per_pixel_h),  # Absolute azimuth
+                    frameElv + (-(y-image_height/2.0) * deg_per_pixel_v)   # Absolute elevation
+                )
+                for name, firstSeen, x, y, age, timestamp, speed_x, speed_y, acceleration_x, acceleration_y in all_light_points
+            ]
+            
+            print(light_points_with_coordinates)
+            
+            ## To save points -->
+            # for point in light_points_with_coordinates:
+            #     name, abs_az, abs_el = point
+            #     save(name, az, el, "saved.txt")
+            
+            initialAzm = trackerAzmGlobal
+            initialElv = trackerElvGlobal
+            
+            light_points_with_coordinates.append(["ZZZZ", initialAzm, initialElv])
+            
+            for point in light_points_with_coordinates:
+                name, abs_az, abs_el = point
                 
-                ## To save points -->
-                # for point in light_points_with_coordinates:
-                #     name, abs_az, abs_el = point
-                #     save(name, az, el, "saved.txt")
+                print("Going to point:", name)
                 
-                initialAzm = trackerAzmGlobal
-                initialElv = trackerElvGlobal
+                azmSetpoint = abs_az
+                elvSetpoint = abs_el
                 
-                light_points_with_coordinates.append(["ZZZZ", initialAzm, initialElv])
+                azmError = azmSetpoint-trackerAzmGlobal
+                elvError = elvSetpoint-trackerElvGlobal
+                timeEnd = time.time()
+                loopTime = time.time()
                 
-                for point in light_points_with_coordinates:
-                    name, abs_az, abs_el = point
-                    
-                    print("Going to point:", name)
-                    
-                    azmSetpoint = abs_az
-                    elvSetpoint = abs_el
-                    
+                while (abs(azmError)>0.05 or abs(elvError)>0.05): 
                     azmError = azmSetpoint-trackerAzmGlobal
                     elvError = elvSetpoint-trackerElvGlobal
-                    timeEnd = time.time()
-                    loopTime = time.time()
-                    
-                    while (abs(azmError)>0.05 or abs(elvError)>0.05): 
-                        azmError = azmSetpoint-trackerAzmGlobal
-                        elvError = elvSetpoint-trackerElvGlobal
-                        
-                        # === SCAN: corrección fina (un único envío, SIEMPRE con inversión) ===
-                        gain = 50
-                        az_cmd = int(INVERT_X * azmError * gain) if 'azmError' in locals() else int(INVERT_X * gain * (azmSetpoint - trackerAzmGlobal))
-                        el_cmd = int(INVERT_Y * elvError * gain) if 'elvError' in locals() else int(INVERT_Y * gain * (elvSetpoint - trackerElvGlobal))
-                        pointToSendControl = LightPoint(name="ABCD", isVisible=True, x=az_cmd, y=el_cmd, age=0)
-                        sendTargetToTeensy(pointToSendControl, 33, 30, 3)
                     
-                    print("Point reached!")
-                    print(f"[SCAN] err=({azmError:+.3f},{elvError:+.3f}) cmd=({az_cmd},{el_cmd}) inv=({INVERT_X},{INVERT_Y})")
-
-                    time.sleep(input_values["scanWaitTime"])
-                
-                scanInProgress = False
+                    # === SCAN: corrección fina (un único envío, SIEMPRE con inversión) ===
+                    gain = 50
+                    az_cmd = int(INVERT_X * azmError * gain) if 'azmError' in locals() else int(INVERT_X * gain * (azmSetpoint - trackerAzmGlobal))
+                    el_cmd = int(INVERT_Y * elvError * gain) if 'elvError' in locals() else int(INVERT_Y * gain * (elvSetpoint - trackerElvGlobal))
+                    pointToSendControl = LightPoint(name="ABCD", isVisible=True, x=az_cmd, y=el_cmd, age=0)
+                    sendTargetToTeensy(pointToSendControl, 33, 30, 3)
                 
-            else:
-                # parseIncomingDataFromUDP()
-                pointToSend = getLockedPoint(all_light_points, camRes, joystickBtn, swUp, swDown, swLeft, swRight)
-                
-                if (not getTrackingEnabled()):
-                    pointToSend.isVisible = False
-                
-                pointToSend.age = np.int32((((time.time()-startTime)*1e9)-(sensorTimeStamp+timeOffsetAverage))/1e6)
+                print("Point reached!")
+                print(f"[SCAN] err=({azmError:+.3f},{elvError:+.3f}) cmd=({az_cmd},{el_cmd}) inv=({INVERT_X},{INVERT_Y})")
+
+                time.sleep(input_values["scanWaitTime"])
+            
+            scanInProgress = False
             
-                #pointToSend.x = -pointToSend.x
-                #pointToSend.y = -pointToSend.y
-                pointToSend.x = int(INVERT_X * pointToSend.x)
-                pointToSend.y = int(INVERT_Y * pointToSend.y)
-                if getTrackingEnabled():
-                   sendTargetToTeensy(pointToSend, 33, 5, 50)
-
-                                                
-                print(pointToSend.name, pointToSend.x, pointToSend.y, pointToSend.age, pointToSend.isVisible)
-                printFps()
+        else:
+            # parseIncomingDataFromUDP()
+            pointToSend = getLockedPoint(all_light_points, camRes, joystickBtn, swUp, swDown, swLeft, swRight)
+            server.publish_result(make_detection_result(frame, all_light_points, copy.copy(pointToSend), sensorTimeStamp))
+            
+            if (not getTrackingEnabled()):
+                pointToSend.isVisible = False
             
-            if (newPacketReceived()):
-                packetType = newPacketReceivedType()
-                if (packetType == "controller"):
-                    joystickX, joystickY, joystickBtn, swUp, swDown, swLeft, swRight = returnLastPacketData(packetType)
-                    # print(joystickX, joystickY, joystickBtn, swUp, swDown, swLeft, swRight)
-                    getLockedPoint(all_light_points, camRes, joystickBtn, swUp, swDown, swLeft, swRight)
-                elif (packetType == "pointList"):
-                    LightPointArray = returnLastPacketData(packetType)
-                elif (packetType == "cameraSettings"):
-                    cameraSetting = returnLastPacketData(packetType)
-                    setCameraSettings(cameraSetting["gain"], cameraSetting["exposureTime"])
-                    print("Applied camera settings")
-                    setDetectionSettings(cameraSetting["idRadius"], cameraSetting["lockRadius"], cameraSetting["lightLifetime"], cameraSetting["lightThreshold"])
-                    print(cameraSetting["trackingEnabled"])
-                    if (not cameraSetting["trackingEnabled"]):
-                        trackingEnabled = False
-                    else:
-                        trackingEnabled = True
-                elif (packetType == "dataFromTracker"):
-                    print("Received data from teensy")
-                    # Print the position of tracker and pointToSendX, pointToSendY
-                    trackerAzm, trackerElv = returnLastPacketData(packetType)
-                    print(trackerAzm, trackerElv)
+            pointToSend.age = np.int32((time.monotonic_ns() - sensorTimeStamp)/1e6)
+
+            if (EXTRAPOLATE_TO_COMMAND_TIME and pointToSend.isVisible):
+                commandTimeStamp = time.monotonic_ns()
+                pointToSend = extrapolate_point(pointToSend, commandTimeStamp)
+        
+            #pointToSend.x = -pointToSend.x
+            #pointToSend.y = -pointToSend.y
+            pointToSend.x = round(INVERT_X * pointToSend.x)
+            pointToSend.y = round(INVERT_Y * pointToSend.y)
+            if getTrackingEnabled():
+               sendTargetToTeensy(pointToSend, 33, 5, 50)
+               tracer.mark("send")
+
+                                            
+            print(pointToSend.name, pointToSend.x, pointToSend.y, pointToSend.age, pointToSend.isVisible)
+            printFps()
+
+        tracer.commit()
+        
+        if (newPacketReceived()):
+            packetType = newPacketReceivedType()
+            if (packetType == "controller"):
+                joystickX, joystickY, joystickBtn, swUp, swDown, swLeft, swRight = returnLastPacketData(packetType)
+                # print(joystickX, joystickY, joystickBtn, swUp, swDown, swLeft, swRight)
+                getLockedPoint(all_light_points, camRes, joystickBtn, swUp, swDown, swLeft, swRight)
+            elif (packetType == "pointList"):
+                LightPointArray = returnLastPacketData(packetType)
+            elif (packetType == "cameraSettings"):
+                cameraSetting = returnLastPacketData(packetType)
+                setCameraSettings(cameraSetting["gain"], cameraSetting["exposureTime"])
+                print("Applied camera settings")
+                setDetectionSettings(cameraSetting["idRadius"], cameraSetting["lockRadius"], cameraSetting["lightLifetime"], cameraSetting["lightThreshold"])
+                print(cameraSetting["trackingEnabled"])
+                if (not cameraSetting["trackingEnabled"]):
+                    trackingEnabled = False
+                else:
+                    trackingEnabled = True
+            elif (packetType == "dataFromTracker"):
+                print("Received data from teensy")
+                # Print the position of tracker and pointToSendX, pointToSendY
+                trackerAzm, trackerElv = returnLastPacketData(packetType)
+                print(trackerAzm, trackerElv)
 
 
 @app.route('/video_feed')
 def video_feed():
-    return Response(generate_frames(),
-                    mimetype='multipart/x-mixed-replace; boundary=frame')
+    # Optional ?scale=0.5&quality=70 for slow links
+    scale, quality = preview_options(request.args)
+    return Response(broadcaster.stream(scale, quality), mimetype=MJPEG_MIMETYPE)
+
+@app.route('/preview_stats')
+def preview_stats():
+    return jsonify(broadcaster.stats())
+
+@app.route('/latency')
+def latency():
+    # Per stage latency percentiles of the last traced frames
+    return jsonify(tracer.stats())
+
+@app.route('/clock_stats')
+def clock_stats():
+    # SensorTimestamp -> CLOCK_MONOTONIC fit (offset, drift, residual)
+    return jsonify(sensorClock.stats())
 
 @app.route('/')
 def index():
@@ -391,7 +437,7 @@ def update_variable():
         print(f"Slider {control_id} updated to {value}")
         # sendSettingToTracker()
         setCameraSettings(input_values["gain"], input_values["exposureTime"])
-        setDetectionSettings(input_values["idRadius"], input_values["lockRadius"], input_values["lightLifetime"], input_values["lightThreshold"], input_values["trackingEnabled"])
+        setDetectionSettings(input_values["idRadius"], input_values["lockRadius"], input_values["lightLifetime"], input_values["lightThreshold"], input_values["trackingEnabled"], input_values["thresholdMethod"], input_values["thresholdSigma"])
     elif control_id == 99:
         print("Start Scanning")
         scanInProgress = True
@@ -405,7 +451,7 @@ def update_variable():
 
 if __name__ == '__main__':
     try:
-        server = FrameServer(picam2,'main')
+        server = FrameServer(picam2,'main', grayStream='lores')
         server.start()
         
         thread1 = Thread(target=tracking_loop)
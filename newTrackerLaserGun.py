@@ -65,9 +65,6 @@ LightPointArray = [LightPoint(name="ABCD", isVisible=False, x=0, y=0, age = 0) f
 all_light_points = []
 
 startTime = time.time()
-firstTimeNoted = False
-timeOffset = 0
-timeOffsetAverage = 0
 trackingEnabled = False
 
 trackerAzmGlobal = 0
@@ -93,7 +90,7 @@ def udp_receiver():
             if len(data) >= 12:
                 packet_id = data[2]
                 if packet_id == 33:
-                    trackerAzmGlobal, trackerElvGlobal = struct.unpack_from('<ff', data, offset=4)
+                    trackerAzmGlobal, trackerElvGlobal = ANGLES.decode(data, 4)
                     # print(trackerAzmGlobal, trackerElvGlobal)
         except Exception as e:
             print(f"Error en UDP receiver: {e}")
@@ -101,15 +98,8 @@ def udp_receiver():
 
 def sendSettingToTracker():
     global input_values, sock
-    # Send the target point to the teensy, the structure should be copied in a byte array then encoded then sent
-    packet_id = 0x10
-    # Pack the struct in a byte array
-
-    payload_data = struct.pack('iiiiiii', np.int32(input_values["idRadius"]), np.int32(input_values["lockRadius"]), np.int32(input_values["lightLifetime"]), np.int32(input_values["lightThreshold"]), np.int32(input_values["switchFrame"]), np.int32(input_values["exposureTime"]), np.int32(input_values["trackingEnabled"]))
-    packet_length = len(payload_data)
-    encoded_packet = capsule_instance.encode(packet_id, payload_data, packet_length)
-    encoded_packet = bytearray(encoded_packet)
-    sock.sendto(encoded_packet, (UDP_IP_TRACKER, UDP_PORT))
+    # Send the settings to the tracker (packet 0x10, see packets.SETTINGS)
+    SETTINGS.sendto(sock, (UDP_IP_TRACKER, UDP_PORT), int(input_values["idRadius"]), int(input_values["lockRadius"]), int(input_values["lightLifetime"]), int(input_values["lightThreshold"]), int(input_values["switchFrame"]), int(input_values["exposureTime"]), int(input_values["trackingEnabled"]))
     print("Sent settings to tracker")
 
 def generate_frames():
@@ -247,143 +237,127 @@ def project_point_to_line_and_normalize(x0, y0, xmin=-627, xmax=726):
 
 def tracking_loop():
 
-    global LightPointArray, all_light_points, input_values, resolution, picam2, xPos, yPos, img_width, img_height, startTime, firstTimeNoted, timeOffset, timeOffsetAverage, trackingEnabled, joystickX, joystickY, joystickBtn, swUp, swDown, swLeft, swRight, scanInProgress, trackerAzmGlobal, trackerElvGlobal
+    global LightPointArray, all_light_points, input_values, resolution, picam2, xPos, yPos, img_width, img_height, startTime, trackingEnabled, joystickX, joystickY, joystickBtn, swUp, swDown, swLeft, swRight, scanInProgress, trackerAzmGlobal, trackerElvGlobal
 
     frame = None
     
     while True:
         
-        if (not firstTimeNoted):
-            frame,sensorTimeStamp = server.wait_for_frame(frame)
-            firstTimeNoted = True
+        frame,sensorTimeStamp = server.wait_for_frame(frame)
 
-            numberOfFrames = 0
-
-            while (numberOfFrames < 100):
-                frame, sensorTimeStamp = getFrame()
-                print(np.int64((time.time()-startTime)*1e9), sensorTimeStamp)
-                timeOffset += (np.int64((time.time()-startTime)*1e9) - sensorTimeStamp)
-                numberOfFrames += 1
-
-            timeOffset /= numberOfFrames
-            timeOffsetAverage = np.int64(timeOffset)
-
-        else:
-            frame,sensorTimeStamp = server.wait_for_frame(frame)
-
-            # Rotate frame by 90° to the left
-            all_light_points = detect(frame, sensorTimeStamp)
+        # Rotate frame by 90° to the left
+        all_light_points = detect(frame, sensorTimeStamp)
+        
+        if (scanInProgress): 
             
-            if (scanInProgress): 
-                
-                # Constants
-                image_width = 1920  # Image width in pixels
-                image_height = 1080  # Image height in pixels
-                fov_horizontal = 14.8154  # Field of view in degrees (horizontal)
-                fov_vertical = 10.8134  # Field of view in degrees (vertical)
-
-
-                # Calculate degrees per pixel
-                deg_per_pixel_h = fov_horizontal / image_width
-                deg_per_pixel_v = fov_vertical / image_height
-
-                # Create the new list with azimuth and elevation coordinates
-                light_points_with_coordinates = [
-                    (
-                        name, 
-                        trackerAzmGlobal + ((x-image_width/2.0) * deg_per_pixel_h),  # Absolute azimuth
-                        trackerElvGlobal + (-(y-image_height/2.0) * deg_per_pixel_v)   # Absolute elevation
-                    )
-                    for name, firstSeen, x, y, age, timestamp, speed_x, speed_y, acceleration_x, acceleration_y in all_light_points
-                ]
-                
-                print(light_points_with_coordinates)
+            # Constants
+            image_width = 1920  # Image width in pixels
+            image_height = 1080  # Image height in pixels
+            fov_horizontal = 14.8154  # Field of view in degrees (horizontal)
+            fov_vertical = 10.8134  # Field of view in degrees (vertical)
+
+
+            # Calculate degrees per pixel
+            deg_per_pixel_h = fov_horizontal / image_width
+            deg_per_pixel_v = fov_vertical / image_height
+
+            # Create the new list with azimuth and elevation coordinates
+            light_points_with_coordinates = [
+                (
+                    name, 
+                    trackerAzmGlobal + ((x-image_width/2.0) * deg_per_pixel_h),  # Absolute azimuth
+                    trackerElvGlobal + (-(y-image_height/2.0) * deg_per_pixel_v)   # Absolute elevation
+                )
+                for name, firstSeen, x, y, age, timestamp, speed_x, speed_y, acceleration_x, acceleration_y in all_light_points
+            ]
+            
+            print(light_points_with_coordinates)
+            
+            ## To save points -->
+            # for point in light_points_with_coordinates:
+            #     name, abs_az, abs_el = point
+            #     save(name, az, el, "saved.txt")
+            
+            initialAzm = trackerAzmGlobal
+            initialElv = trackerElvGlobal
+            
+            light_points_with_coordinates.append(["ZZZZ", initialAzm, initialElv])
+            
+            for point in light_points_with_coordinates:
+                name, abs_az, abs_el = point
                 
-                ## To save points -->
-                # for point in light_points_with_coordinates:
-                #     name, abs_az, abs_el = point
-                #     save(name, az, el, "saved.txt")
+                print("Going to point:", name)
                 
-                initialAzm = trackerAzmGlobal
-                initialElv = trackerElvGlobal
+                azmSetpoint = abs_az
+                elvSetpoint = abs_el
                 
-                light_points_with_coordinates.append(["ZZZZ", initialAzm, initialElv])
+                azmError = azmSetpoint-trackerAzmGlobal
+                elvError = elvSetpoint-trackerElvGlobal
+                timeEnd = time.time()
+                loopTime = time.time()
                 
-                for point in light_points_with_coordinates:
-                    name, abs_az, abs_el = point
-                    
-                    print("Going to point:", name)
-                    
-                    azmSetpoint = abs_az
-                    elvSetpoint = abs_el
-                    
+                while (abs(azmError)>0.05 or abs(elvError)>0.05): 
                     azmError = azmSetpoint-trackerAzmGlobal
                     elvError = elvSetpoint-trackerElvGlobal
-                    timeEnd = time.time()
-                    loopTime = time.time()
                     
-                    while (abs(azmError)>0.05 or abs(elvError)>0.05): 
-                        azmError = azmSetpoint-trackerAzmGlobal
-                        elvError = elvSetpoint-trackerElvGlobal
-                        
-                        gain = 50
-                        
-                        pointToSendControl = LightPoint(name="ABCD", isVisible=True, x=azmError*gain, y=elvError*gain, age=0)
-                        sendTargetToTeensy(pointToSendControl, 33, 30, 3)
-                        
+                    gain = 50
                     
-                    print("Point reached!")
+                    pointToSendControl = LightPoint(name="ABCD", isVisible=True, x=azmError*gain, y=elvError*gain, age=0)
+                    sendTargetToTeensy(pointToSendControl, 33, 30, 3)
                     
-                    time.sleep(input_values["scanWaitTime"])
-                
-                scanInProgress = False
                 
-            else:
-                # parseIncomingDataFromUDP()
-                pointToSend = getLockedPoint(all_light_points, camRes, joystickBtn, swUp, swDown, swLeft, swRight)
+                print("Point reached!")
                 
-                if (not getTrackingEnabled()):
-                    pointToSend.isVisible = False
-                
-                pointToSend.age = np.int32((((time.time()-startTime)*1e9)-(sensorTimeStamp+timeOffsetAverage))/1e6)
+                time.sleep(input_values["scanWaitTime"])
             
-                pointToSend.x = -pointToSend.x
-                pointToSend.y = -pointToSend.y
-                
-                
-                # sendTargetToTeensy(pointToSend, 33, 5, 50)
-                
-                xLine, xI, yI = project_point_to_line_and_normalize(pointToSend.x, pointToSend.y, xmin=-627, xmax=726)
-                
-                sendAngleToMirror(xLine)
+            scanInProgress = False
+            
+        else:
+            # parseIncomingDataFromUDP()
+            pointToSend = getLockedPoint(all_light_points, camRes, joystickBtn, swUp, swDown, swLeft, swRight)
+            
+            if (not getTrackingEnabled()):
+                pointToSend.isVisible = False
+            
+            pointToSend.age = np.int32((time.monotonic_ns() - sensorTimeStamp)/1e6)
+        
+            pointToSend.x = -pointToSend.x
+            pointToSend.y = -pointToSend.y
+            
+            
+            # sendTargetToTeensy(pointToSend, 33, 5, 50)
+            
+            xLine, xI, yI = project_point_to_line_and_normalize(pointToSend.x, pointToSend.y, xmin=-627, xmax=726)
+            
+            sendAngleToMirror(xLine)
 
-                
-                print(xLine, pointToSend.x, xI, pointToSend.y, yI)
-                # printFps()
             
-            if (newPacketReceived()):
-                packetType = newPacketReceivedType()
-                if (packetType == "controller"):
-                    joystickX, joystickY, joystickBtn, swUp, swDown, swLeft, swRight = returnLastPacketData(packetType)
-                    # print(joystickX, joystickY, joystickBtn, swUp, swDown, swLeft, swRight)
-                    getLockedPoint(all_light_points, camRes, joystickBtn, swUp, swDown, swLeft, swRight)
-                elif (packetType == "pointList"):
-                    LightPointArray = returnLastPacketData(packetType)
-                elif (packetType == "cameraSettings"):
-                    cameraSetting = returnLastPacketData(packetType)
-                    setCameraSettings(cameraSetting["gain"], cameraSetting["exposureTime"])
-                    print("Applied camera settings")
-                    setDetectionSettings(cameraSetting["idRadius"], cameraSetting["lockRadius"], cameraSetting["lightLifetime"], cameraSetting["lightThreshold"])
-                    print(cameraSetting["trackingEnabled"])
-                    if (not cameraSetting["trackingEnabled"]):
-                        trackingEnabled = False
-                    else:
-                        trackingEnabled = True
-                elif (packetType == "dataFromTracker"):
-                    print("Received data from teensy")
-                    # Print the position of tracker and pointToSendX, pointToSendY
-                    trackerAzm, trackerElv = returnLastPacketData(packetType)
-                    print(trackerAzm, trackerElv)
+            print(xLine, pointToSend.x, xI, pointToSend.y, yI)
+            # printFps()
+        
+        if (newPacketReceived()):
+            packetType = newPacketReceivedType()
+            if (packetType == "controller"):
+                joystickX, joystickY, joystickBtn, swUp, swDown, swLeft, swRight = returnLastPacketData(packetType)
+                # print(joystickX, joystickY, joystickBtn, swUp, swDown, swLeft, swRight)
+                getLockedPoint(all_light_points, camRes, joystickBtn, swUp, swDown, swLeft, swRight)
+            elif (packetType == "pointList"):
+                LightPointArray = returnLastPacketData(packetType)
+            elif (packetType == "cameraSettings"):
+                cameraSetting = returnLastPacketData(packetType)
+                setCameraSettings(cameraSetting["gain"], cameraSetting["exposureTime"])
+                print("Applied camera settings")
+                setDetectionSettings(cameraSetting["idRadius"], cameraSetting["lockRadius"], cameraSetting["lightLifetime"], cameraSetting["lightThreshold"])
+                print(cameraSetting["trackingEnabled"])
+                if (not cameraSetting["trackingEnabled"]):
+                    trackingEnabled = False
+                else:
+                    trackingEnabled = True
+            elif (packetType == "dataFromTracker"):
+                print("Received data from teensy")
+                # Print the position of tracker and pointToSendX, pointToSendY
+                trackerAzm, trackerElv = returnLastPacketData(packetType)
+                print(trackerAzm, trackerElv)
 
 
 @app.route('/video_feed')
@@ -0,0 +1,150 @@
+import struct
+import threading
+from collections import namedtuple
+import numpy as np
+from capsule import PRA_DEFAULT, PRB_DEFAULT, ADDITIONAL_BYTES
+
+class PacketSchema:
+    """
+    Layout of one capsule packet type. The struct is compiled once, little-endian
+    and without padding, and the whole capsule frame (preamble, id, length,
+    payload, checksum) lives in a preallocated buffer that every send reuses,
+    so the send path does no formatting and no allocation.
+
+    frame() returns a view of that buffer, only valid until the next frame() of
+    the same schema, sendto()/write() hold the schema lock while packing and
+    sending so they can be called from any thread.
+    """
+    def __init__(self, packetId, name, fmt, fields):
+        self.packetId = packetId
+        self.name = name
+        self.struct = struct.Struct('<' + fmt)
+        self.size = self.struct.size
+        self.type = namedtuple(name, fields)
+        self.buffer = bytearray(self.size + ADDITIONAL_BYTES)
+        self.buffer[0] = PRA_DEFAULT
+        self.buffer[1] = PRB_DEFAULT
+        self.buffer[2] = packetId
+        self.buffer[3] = self.size
+        self.view = memoryview(self.buffer)
+        self.payload = self.view[4:4 + self.size]
+        self.lock = threading.Lock()
+
+    def frame(self, *values):
+        self.struct.pack_into(self.buffer, 4, *values)
+        self.buffer[-1] = sum(self.payload) % 256
+        return self.view
+
+    def encode(self, *values):
+        """Complete capsule frame as a new bytes object."""
+        with self.lock:
+            return bytes(self.frame(*values))
+
+    def pack(self, *values):
+        """Payload only, for callers that build the capsule themselves."""
+        return self.struct.pack(*values)
+
+    def sendto(self, sock, address, *values):
+        with self.lock:
+            return sock.sendto(self.frame(*values), address)
+
+    def write(self, port, *values):
+        with self.lock:
+            return port.write(self.frame(*values))
+
+    def decode(self, buffer, offset=0):
+        return self.type._make(self.struct.unpack_from(buffer, offset))
+
+    def iter_decode(self, buffer):
+        return (self.type._make(values) for values in self.struct.iter_unpack(buffer))
+
+
+# === Registro de paquetes ===
+# Target to the Teensy / colimator. The joystick packets use the same id and
+# layout with JOYSTICK_NAME as name.
+TARGET = PacketSchema(0x01, "Target", '4siiiiiff', ["name", "isVisible", "x", "y", "age", "cameraID", "Kp", "maxSpeed"])
+# One point of the point list packet (see PointListPacket), x and y in 1/SUBPIXEL_SCALE px
+POINT = PacketSchema(0x02, "Point", '4siiii', ["name", "isVisible", "x", "y", "age"])
+ABS_POSITION = PacketSchema(0x03, "AbsPosition", 'ff', ["azm", "elv"])
+SETTINGS = PacketSchema(0x10, "Settings", 'iiiiiii', ["idRadius", "lockRadius", "lightLifetime", "lightThreshold", "gain", "exposureTime", "trackingEnabled"])
+FOCUS = PacketSchema(0x15, "Focus", 'I', ["focus"])
+ANGLES = PacketSchema(33, "Angles", 'ff', ["azm", "elv"])
+OMEGAS = PacketSchema(34, "Omegas", 'ffff', ["wcmd_az", "wcmd_el", "wmeas_az", "wmeas_el"])
+CONTROLLER = PacketSchema(99, "Controller", 'ffbbbbb', ["joystickX", "joystickY", "joystickBtn", "swUp", "swDown", "swLeft", "swRight"])
+
+PACKETS = {schema.packetId: schema for schema in (TARGET, POINT, ABS_POSITION, SETTINGS, FOCUS, ANGLES, OMEGAS, CONTROLLER)}
+
+# Point list packets (0x02) carry x and y as fixed point, 1/SUBPIXEL_SCALE px
+SUBPIXEL_SCALE = 16
+
+# Same layout as POINT, one record per point
+POINT_DTYPE = np.dtype([("name", "S4"), ("isVisible", "<i4"), ("x", "<i4"), ("y", "<i4"), ("age", "<i4")])
+assert POINT_DTYPE.itemsize == POINT.size
+# One count byte then the points, the whole payload must fit the length byte (12 points)
+POINT_LIST_MAX = (255 - 1) // POINT_DTYPE.itemsize
+
+class PointListPacket:
+    """
+    Packet 0x02: a count byte followed by up to POINT_LIST_MAX POINT records,
+    x and y in 1/SUBPIXEL_SCALE px. Not compatible with the old 0x02 payload
+    (bare '4siiii' records in whole pixels), both ends have to be updated.
+    The records of the preallocated frame are a NumPy structured array, so a
+    whole track table is written with a few column assignments instead of one
+    struct.pack per point.
+    """
+    def __init__(self, maxPoints=POINT_LIST_MAX):
+        self.maxPoints = maxPoints
+        self.buffer = bytearray(ADDITIONAL_BYTES + 1 + maxPoints*POINT_DTYPE.itemsize)
+        self.buffer[0] = PRA_DEFAULT
+        self.buffer[1] = PRB_DEFAULT
+        self.buffer[2] = POINT.packetId
+        self.view = memoryview(self.buffer)
+        self.bytes = np.frombuffer(self.buffer, dtype=np.uint8)
+        self.points = np.frombuffer(self.buffer, dtype=POINT_DTYPE, count=maxPoints, offset=5)
+        self.lock = threading.Lock()
+
+    def frame(self, name, x, y, age, isVisible=1):
+        """name, x, y and age are columns (arrays or lists), x and y in pixels."""
+        count = min(len(x), self.maxPoints)
+        points = self.points[:count]
+        points["name"] = np.char.encode(np.asarray(name[:count], dtype="U4"), "utf-8")
+        points["isVisible"] = isVisible
+        points["x"] = np.rint(np.asarray(x[:count], dtype=np.float64)*SUBPIXEL_SCALE)
+        points["y"] = np.rint(np.asarray(y[:count], dtype=np.float64)*SUBPIXEL_SCALE)
+        points["age"] = age[:count]
+        end = 5 + count*POINT_DTYPE.itemsize
+        self.buffer[3] = end - 4
+        self.buffer[4] = count
+        self.buffer[end] = int(self.bytes[4:end].sum()) % 256
+        return self.view[:end + 1]
+
+    def sendto(self, sock, address, name, x, y, age):
+        with self.lock:
+            return sock.sendto(self.frame(name, x, y, age), address)
+
+def decode_point_list(payload):
+    """
+    Records of a point list payload, as a read-only structured array over the
+    payload (no copy). x and y are still in 1/SUBPIXEL_SCALE px.
+    """
+    if len(payload) == 0:
+        return np.zeros(0, dtype=POINT_DTYPE)
+    count = min(payload[0], (len(payload) - 1) // POINT_DTYPE.itemsize)
+    return np.frombuffer(payload, dtype=POINT_DTYPE, count=count, offset=1)
+
+JOYSTICK_NAME = struct.pack('<i', 1)
+JOYSTICK_CAMERA_ID = 99
+
+def joystick_values(x, y, throttle, trigger, maxSpeed=30.0):
+    """TARGET values of a joystick packet, x and y in deg/s (sent in 1/100)."""
+    return (JOYSTICK_NAME, int(trigger), int(x*100), int(y*100), 0, JOYSTICK_CAMERA_ID, float(throttle), float(maxSpeed))
+
+def encode_joystick(x, y, throttle, trigger, maxSpeed=30.0):
+    return TARGET.encode(*joystick_values(x, y, throttle, trigger, maxSpeed))
+
+def decode_packet(packetId, payload):
+    """Decode the payload of any registered packet id, None if unknown or too short."""
+    schema = PACKETS.get(packetId)
+    if schema is None or len(payload) < schema.size:
+        return None
+    return schema.decode(payload)
@@ -4,6 +4,7 @@ import time
 import numpy as np
 from threading import Condition, Thread
 import cv2
+from detection import ResultPublisher
 
 # Specify the full path to the shared library
 lib_path = f'/home/pi/PlayerToPy/lib/arm64/libPlayerOneCamera.so.3.6.1'
@@ -359,7 +360,7 @@ def getPlayerOneFrame():
     return img
 
 
-class FrameServerPlayerOne:
+class FrameServerPlayerOne(ResultPublisher):
     def __init__(self):
         """A simple class that can serve up frames from one of the Picamera2's configured streams to multiple other threads.
 
@@ -371,6 +372,7 @@ class FrameServerPlayerOne:
         self._condition = Condition()
         self._running = True
         self._count = 0
+        self._init_results()
         self._thread = Thread(target=self._thread_func, daemon=True)
 
     @property
@@ -401,7 +403,7 @@ class FrameServerPlayerOne:
             self._count += 1
             with self._condition:
                 self._array = array
-                # timestamp is time since start of code in nanoseconds
+                # Stamped on arrival in CLOCK_MONOTONIC ns, the SDK gives no sensor timestamp
                 self._timestamp = time.monotonic_ns()
                 self._condition.notify_all()
 
@@ -420,6 +422,7 @@ class FrameServerPlayerOne:
                 if self._array is not previous:
                     return self._array, self._timestamp
 
+
 # if __name__ == "__main__":
 
 #   playerOneCamInit()
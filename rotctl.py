@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cliente rotctld (Hamlib) compartido por los bridges (adsb_to_rot*, stellarium20_to_rotctld,
+live_rate_meter).
+
+- Una sola conexión TCP persistente, se reconecta sola (con espera creciente si rotctld no está).
+- Usa el modo de respuesta extendida de rotctld ('+P', '+p'): cada respuesta termina en una
+  línea 'RPRT n', así varias órdenes se pueden mandar de una vez (pipelining) y leer en orden.
+- submit(az, el) encola un goto sin bloquear; si llega otro antes de enviarse, sólo sale el
+  último (latest wins).
+- stats() da el round-trip medido (ms) de las últimas peticiones.
+"""
+import socket, threading, time
+from collections import deque
+
+ROTCTLD_HOST, ROTCTLD_PORT = "127.0.0.1", 4533
+RECONNECT_MIN = 0.5    # s, espera tras un fallo de conexión, se dobla hasta RECONNECT_MAX
+RECONNECT_MAX = 5.0
+RTT_SAMPLES = 200
+
+class RotctlError(RuntimeError):
+    pass
+
+class RotctlClient:
+    def __init__(self, host=ROTCTLD_HOST, port=ROTCTLD_PORT, timeout=2.0):
+        self.host, self.port = host, port
+        self.timeout = timeout
+        self.sock = None
+        self.buffer = b''
+        self.lock = threading.Lock()
+        self.retryAt = 0.0
+        self.retryDelay = RECONNECT_MIN
+        # Coalescer de gotos
+        self.pending = None
+        self.pendingCondition = threading.Condition()
+        self.worker = None
+        # Métricas
+        self.rtt = deque(maxlen=RTT_SAMPLES)
+        self.requests = 0
+        self.commands = 0
+        self.connects = 0
+        self.errors = 0
+        self.coalesced = 0
+        self.lastError = None
+
+    # --- Conexión ---
+    def _ensure(self):
+        if self.sock: return
+        now = time.monotonic()
+        if now < self.retryAt:
+            raise RotctlError(f"rotctld {self.host}:{self.port} no disponible ({self.lastError})")
+        try:
+            s = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        except OSError as e:
+            self.lastError = str(e)
+            self.retryAt = now + self.retryDelay
+            self.retryDelay = min(RECONNECT_MAX, self.retryDelay*2)
+            raise
+        s.settimeout(self.timeout)
+        s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock = s
+        self.buffer = b''
+        self.connects += 1
+        self.retryDelay = RECONNECT_MIN
+
+    def close(self):
+        with self.lock:
+            self._close()
+
+    def _close(self):
+        if self.sock:
+            try: self.sock.close()
+            except OSError: pass
+        self.sock = None
+        self.buffer = b''
+
+    def _read_line(self):
+        while b'\n' not in self.buffer:
+            data = self.sock.recv(4096)
+            if not data:
+                raise ConnectionError("rotctld cerró la conexión")
+            self.buffer += data
+        line, self.buffer = self.buffer.split(b'\n', 1)
+        return line.decode('ascii', 'ignore').strip()
+
+    def _read_response(self):
+        """Líneas de una respuesta extendida hasta 'RPRT n', devuelve (n, líneas)."""
+        lines = []
+        while True:
+            line = self._read_line()
+            if line.startswith("RPRT"):
+                try:
+                    return int(line.split()[1]), lines
+                except (IndexError, ValueError):
+                    return -1, lines
+            if line:
+                lines.append(line)
+
+    # --- Peticiones ---
+    def request(self, *commands):
+        """
+        Manda varias órdenes de una vez (p.ej. '+P 10.00 20.00', '+p') y devuelve sus
+        respuestas [(código, líneas), ...] en el mismo orden. Si la conexión estaba
+        rota se reconecta y se reintenta una vez.
+        """
+        payload = "".join(cmd + "\n" for cmd in commands).encode('ascii')
+        with self.lock:
+            for attempt in range(2):
+                try:
+                    self._ensure()
+                    start = time.monotonic()
+                    self.sock.sendall(payload)
+                    responses = [self._read_response() for _ in commands]
+                    self.rtt.append(time.monotonic() - start)
+                    self.requests += 1
+                    self.commands += len(commands)
+                    return responses
+                except (OSError, ConnectionError) as e:
+                    self.errors += 1
+                    self.lastError = str(e)
+                    self._close()
+                    if attempt:
+                        raise
+
+    @staticmethod
+    def _parse_pos(code, lines):
+        if code != 0:
+            raise RotctlError(f"get_pos RPRT {code}")
+        values = []
+        for line in lines:
+            # 'Azimuth: 180.000000' / 'Elevation: 45.000000'
+            try:
+                values.append(float(line.split(':')[-1]))
+            except ValueError:
+                continue
+        if len(values) < 2:
+            raise RotctlError(f"get_pos sin az/el: {lines!r}")
+        return values[0] % 360.0, values[1]
+
+    def set_position(self, az, el):
+        """Goto síncrono, devuelve el código RPRT (0 = ok)."""
+        (code, _), = self.request(f"+P {az:.2f} {el:.2f}")
+        return code
+
+    def get_position(self):
+        (code, lines), = self.request("+p")
+        return self._parse_pos(code, lines)
+
+    def set_and_get(self, az, el):
+        """Goto y lectura de posición en un solo viaje, devuelve (código, (az, el))."""
+        (code, _), pos = self.request(f"+P {az:.2f} {el:.2f}", "+p")
+        return code, self._parse_pos(*pos)
+
+    # --- Coalescer (latest wins) ---
+    def submit(self, az, el):
+        """Encola un goto sin esperar respuesta, reemplaza al que aún no salió."""
+        with self.pendingCondition:
+            if self.pending is not None:
+                self.coalesced += 1
+            self.pending = (az, el)
+            if self.worker is None:
+                self.worker = threading.Thread(target=self._send_loop, daemon=True)
+                self.worker.start()
+            self.pendingCondition.notify()
+
+    def _send_loop(self):
+        while True:
+            with self.pendingCondition:
+                while self.pending is None:
+                    self.pendingCondition.wait()
+                az, el = self.pending
+                self.pending = None
+            try:
+                code = self.set_position(az, el)
+                if code != 0:
+                    print(f"[ROT] goto AZ={az:.2f} EL={el:.2f} -> RPRT {code}", flush=True)
+            except Exception as e:
+                print(f"[ROT ERR] goto: {e}", flush=True)
+                time.sleep(0.1)
+
+    def stats(self):
+        rtt = sorted(self.rtt)
+        def pct(p):
+            return round(rtt[min(len(rtt) - 1, int(p*len(rtt)))]*1000, 3) if rtt else None
+        return {"host": f"{self.host}:{self.port}", "connected": self.sock is not None,
+                "requests": self.requests, "commands": self.commands, "connects": self.connects,
+                "errors": self.errors, "coalesced": self.coalesced, "lastError": self.lastError,
+                "rttMs": {"p50": pct(0.5), "p90": pct(0.9), "max": round(rtt[-1]*1000, 3) if rtt else None}}
@@ -4,6 +4,7 @@
 import argparse, os, socket, struct, threading, time
 from typing import Optional, Tuple
 from skyfield.api import load, load_file, Star, wgs84
+from rotctl import RotctlClient
 
 # Escalas de Stellarium 2.0
 U32 = 0x100000000
@@ -29,66 +30,6 @@ def az_delta(a,b):
     d = (b - a + 540.0) % 360.0 - 180.0
     return d
 
-# ===== Cliente rotctld =====
-class RotctlClient:
-    def __init__(self, host, port, timeout=2.0):
-        self.host, self.port = host, port
-        self.timeout = timeout
-        self.sock = None
-        self.lock = threading.Lock()
-
-    def _ensure(self):
-        if self.sock: return
-        s = socket.create_connection((self.host, self.port), timeout=self.timeout)
-        s.settimeout(self.timeout)
-        self.sock = s
-
-    def _read_line(self) -> str:
-        data = b''
-        while not data.endswith(b'\n'):
-            b = self.sock.recv(1)
-            if not b: break
-            data += b
-        return data.decode('ascii','ignore').strip()
-
-    def _send_line(self, line: str) -> str:
-        self._ensure()
-        self.sock.sendall(line.encode('ascii'))
-        return self._read_line()
-
-    def goto(self, az, el) -> str:
-        with self.lock:
-            cmd = f'P {az:.2f} {el:.2f}\n'
-            try:
-                return self._send_line(cmd)
-            except Exception:
-                try:
-                    self.close()
-                    return self._send_line(cmd)
-                except Exception as e:
-                    print(f"[ROT ERR] {e}", flush=True)
-                    self.close()
-                    return "RPRT -1"
-
-    def get_pos(self):
-        with self.lock:
-            try:
-                self._ensure()
-                self.sock.sendall(b'p\n')
-                az_s = self._read_line()
-                el_s = self._read_line()
-                return float(az_s), float(el_s)
-            except Exception as e:
-                print(f"[ROT ERR] get_pos: {e}", flush=True)
-                self.close()
-                return (0.0, 0.0)
-
-    def close(self):
-        if self.sock:
-            try: self.sock.close()
-            except: pass
-        self.sock = None
-
 # ===== Bridge =====
 class Bridge:
     def __init__(self, args):
@@ -134,10 +75,11 @@ class Bridge:
                 if self.args.verbose:
                     print(f"[HOLD] ΔAZ={da:.2f} ΔEL={de:.2f} < deadband {self.args.deadband}", flush=True)
                 return
-        resp = self.rot.goto(az, el)
+        # Cola latest-wins: si rotctld va lento sólo sale el último goto
+        self.rot.submit(az, el)
         self.last_cmd = (az, el)
         if self.args.verbose:
-            print(f"[CMD] {tag} AZ={az:.3f} EL={el:.3f} | {resp}", flush=True)
+            print(f"[CMD] {tag} AZ={az:.3f} EL={el:.3f}", flush=True)
 
     def _track_loop(self):
         while self.running:
@@ -248,8 +190,11 @@ class Bridge:
         self.srv = srv
 
         print(f"[SERV] Stellarium20 en {self.args.listen}:{self.args.port} -> rotctld {self.args.rot_host}:{self.args.rot_port}", flush=True)
-        az, el = self.rot.get_pos()
-        print(f"[ROT] AZ={az:.2f} EL={el:.2f}", flush=True)
+        try:
+            az, el = self.rot.get_position()
+            print(f"[ROT] AZ={az:.2f} EL={el:.2f}", flush=True)
+        except Exception as e:
+            print(f"[ROT ERR] get_pos: {e}", flush=True)
 
         try:
             while self.running:
@@ -0,0 +1,214 @@
+import threading
+import queue
+import time
+import cv2
+
+try:
+    from turbojpeg import TurboJPEG, TJPF_BGR, TJPF_GRAY, TJSAMP_420, TJSAMP_GRAY
+except ImportError:
+    TurboJPEG = None
+
+# Multipart header shared by every /video_feed stream
+MJPEG_MIMETYPE = 'multipart/x-mixed-replace; boundary=frame'
+
+PREVIEW_BACKENDS = ["auto", "opencv", "turbo"]
+
+# Limits for the per-client ?scale= and ?quality= query parameters
+MIN_PREVIEW_SCALE = 0.1
+MIN_PREVIEW_QUALITY = 10
+
+class OpenCVJpegEncoder:
+    name = "opencv"
+
+    def encode(self, image, quality):
+        ok, buffer = cv2.imencode('.jpg', image, [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+        if not ok:
+            return None
+        return buffer.tobytes()
+
+class TurboJpegEncoder:
+    """libjpeg-turbo through PyTurboJPEG, noticeably faster than cv2.imencode on the Pi."""
+    name = "turbo"
+
+    def __init__(self):
+        self.turbo = TurboJPEG()
+
+    def encode(self, image, quality):
+        if image.ndim == 2:
+            return self.turbo.encode(image[:, :, None], quality=quality, pixel_format=TJPF_GRAY, jpeg_subsample=TJSAMP_GRAY)
+        return self.turbo.encode(image, quality=quality, pixel_format=TJPF_BGR, jpeg_subsample=TJSAMP_420)
+
+def make_encoder(backend="auto"):
+    if backend not in PREVIEW_BACKENDS:
+        raise ValueError(f"Unknown preview backend {backend}, expected one of {PREVIEW_BACKENDS}")
+    if backend in ("auto", "turbo") and TurboJPEG is not None:
+        try:
+            return TurboJpegEncoder()
+        except Exception as e:
+            # PyTurboJPEG is installed but libturbojpeg could not be loaded
+            print("TurboJPEG not available, using OpenCV:", e)
+    elif backend == "turbo":
+        print("PyTurboJPEG is not installed, using OpenCV")
+    return OpenCVJpegEncoder()
+
+def preview_options(args):
+    """
+    Read the per-client ?scale= (0.1-1, fraction of the preview resolution) and
+    ?quality= (10-100) query parameters of a /video_feed request.
+    """
+    scale = 1.0
+    quality = None
+    try:
+        if args.get("scale") is not None:
+            scale = min(1.0, max(MIN_PREVIEW_SCALE, float(args.get("scale"))))
+        if args.get("quality") is not None:
+            quality = min(100, max(MIN_PREVIEW_QUALITY, int(args.get("quality"))))
+    except ValueError:
+        pass
+    # Clients asking for almost the same size share one encode
+    return round(scale, 2), quality
+
+class JpegBroadcaster:
+    """Encode each preview frame once and fan the bytes out to every client.
+
+    render() is called from a single thread, only while at least one client is
+    subscribed, and returns the annotated image to send (or None to skip). It
+    may also return JPEG bytes that are already encoded (hardware encoder),
+    those are sent as they are to every client.
+    Each client gets a small bounded queue, a slow client only loses its own
+    stale frames and never slows down the encoder or the other clients.
+    Clients asking for the same scale and quality share one encode.
+    """
+
+    def __init__(self, render, maxFps=15, quality=90, queueSize=2, onIdle=None, backend="auto"):
+        self.render = render
+        self.maxFps = maxFps
+        self.quality = quality
+        self.queueSize = queueSize
+        self.onIdle = onIdle
+        self.encoder = make_encoder(backend)
+        self.subscribers = {}
+        self.condition = threading.Condition()
+        self.thread = None
+        self.framesEncoded = 0
+        self.encodeMs = 0.0
+        self.lastEncodeMs = {}
+
+    def subscribe(self, scale=1.0, quality=None):
+        client = queue.Queue(maxsize=self.queueSize)
+        with self.condition:
+            self.subscribers[client] = (scale, quality or self.quality)
+            if (self.thread is None):
+                self.thread = threading.Thread(target=self._loop, daemon=True)
+                self.thread.start()
+            self.condition.notify_all()
+        return client
+
+    def unsubscribe(self, client):
+        with self.condition:
+            self.subscribers.pop(client, None)
+
+    def clients(self):
+        with self.condition:
+            return len(self.subscribers)
+
+    def stats(self):
+        with self.condition:
+            clients = len(self.subscribers)
+        return {"backend": self.encoder.name, "clients": clients, "framesEncoded": self.framesEncoded,
+                "encodeMs": round(self.encodeMs, 3),
+                "variants": {f"{scale}x@{quality}": round(ms, 3) for (scale, quality), ms in list(self.lastEncodeMs.items())}}
+
+    def encode(self, image, scale, quality):
+        if scale < 1.0:
+            image = cv2.resize(image, (max(1, round(image.shape[1]*scale)), max(1, round(image.shape[0]*scale))), interpolation=cv2.INTER_AREA)
+        return self.encoder.encode(image, quality)
+
+    def encode_variants(self, image, variants):
+        """Encode the image once per distinct (scale, quality), timing every encode."""
+        jpegs = {}
+        total = 0.0
+        for variant in variants:
+            start = time.perf_counter()
+            jpeg = self.encode(image, *variant)
+            elapsed = (time.perf_counter() - start)*1000
+            if jpeg is None:
+                continue
+            jpegs[variant] = jpeg
+            self.lastEncodeMs[variant] = elapsed
+            total += elapsed
+        # Moving average of the encode time per rendered frame
+        self.encodeMs = total if self.framesEncoded == 0 else 0.9*self.encodeMs + 0.1*total
+        return jpegs
+
+    def publish(self, jpegs):
+        with self.condition:
+            clients = list(self.subscribers.items())
+        for client, variant in clients:
+            jpeg = jpegs.get(variant) if isinstance(jpegs, dict) else jpegs
+            if jpeg is None:
+                continue
+            # Drop the oldest frame instead of blocking on a slow client
+            while True:
+                try:
+                    client.put_nowait(jpeg)
+                    break
+                except queue.Full:
+                    try:
+                        client.get_nowait()
+                    except queue.Empty:
+                        pass
+
+    def _loop(self):
+        nextFrame = 0.0
+        while True:
+            with self.condition:
+                if not self.subscribers:
+                    if (self.onIdle is not None):
+                        self.onIdle()
+                    while not self.subscribers:
+                        self.condition.wait()
+
+            # Preview fps cap, independent of the capture rate
+            if (self.maxFps):
+                now = time.monotonic()
+                if (now < nextFrame):
+                    time.sleep(nextFrame - now)
+                nextFrame = max(nextFrame, time.monotonic() - 1.0/self.maxFps) + 1.0/self.maxFps
+
+            try:
+                image = self.render()
+                if (image is None):
+                    continue
+                if isinstance(image, bytes):
+                    jpegs = image
+                else:
+                    with self.condition:
+                        variants = set(self.subscribers.values())
+                    # Old variants of clients that left
+                    for variant in list(self.lastEncodeMs):
+                        if variant not in variants:
+                            del self.lastEncodeMs[variant]
+                    jpegs = self.encode_variants(image, variants)
+                    if not jpegs:
+                        continue
+            except Exception as e:
+                print("Preview render error:", e)
+                time.sleep(0.1)
+                continue
+            self.framesEncoded += 1
+            self.publish(jpegs)
+
+    def stream(self, scale=1.0, quality=None, timeout=1.0):
+        """Generator of multipart chunks for a Flask Response."""
+        client = self.subscribe(scale, quality)
+        try:
+            while True:
+                try:
+                    jpeg = client.get(timeout=timeout)
+                except queue.Empty:
+                    continue
+                yield (b'--frame\r\n'
+                       b'Content-Type: image/jpeg\r\n\r\n' + jpeg + b'\r\n')
+        finally:
+            self.unsubscribe(client)
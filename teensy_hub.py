@@ -13,12 +13,39 @@
 #
 # Master arbitration:
 #   - AUTO: first active client becomes master for MASTER_TTL seconds (refreshes on activity).
-#   - MANUAL: write 'c1'/'c2'/'c3' or a port (9101/9102/9103) to /tmp/teensy_hub_master
+#   - MANUAL: send 'c1'/'c2'/'c3'/'redir' or a port (9101/9102/9103) to the control port, e.g.
+#        echo -n c2 | nc -u -w1 127.0.0.1 9198      ('auto' goes back to AUTO, 'status' replies the state)
+#     or write it to /tmp/teensy_hub_master (legacy, checked every 0.5 s, delete the file for AUTO)
+#
+# Rate limiting:
+#   - Token bucket of MAX_CMD_RATE packets/s. Commands never wait in the receive path: when the
+#     bucket is empty the command is kept and sent as soon as a token is available, and a newer
+#     command of the same client and packet id replaces it (latest wins).
+#   - Telemetry fan-out is independent of command forwarding, it is never delayed by the limiter.
+#
+# Metrics (always on):
+#   curl http://127.0.0.1:9190/metrics        Prometheus text
+#   curl http://127.0.0.1:9190/metrics.json   same data as JSON
+#   Per client counters (received, forwarded, dropped by arbitration, replaced while waiting),
+#   queue delay histogram (receive -> sent to Teensy), rate limiter stalls, fan-out send errors
+#   and telemetry inter-arrival histograms/jitter for packet ids 33 and 34.
+#
+# Telemetry bus:
+#   Packets 33 (az/el) and 34 (omegas) are decoded once here and written to a shared memory ring
+#   (telemetry_bus.py, /dev/shm/teensy_telemetry). Local apps read it with open_telemetry_reader()
+#   instead of listening on a fan-out port. The UDP fan-out is kept for apps that still listen on
+#   9001-9005, set HUB_UDP_FANOUT=0 once none is left.
+#   Every command sent to the Teensy is also logged with its receive/send times (ForwardLog,
+#   /dev/shm/teensy_hub_forwards) for the latency traces of the clients (latency_trace.py).
 #
 # Environment overrides:
-#   TEENSY_IP, TEENSY_PORT, HUB_MASTER_TTL
+#   TEENSY_IP, TEENSY_PORT, HUB_MASTER_TTL, HUB_CONTROL_PORT, HUB_METRICS_PORT, HUB_UDP_FANOUT
 #
-import socket, select, time, os, threading
+import asyncio, socket, time, os, sys, signal, json, math
+from bisect import bisect_left
+from capsule import CapsuleCodec
+from packets import ANGLES, OMEGAS
+from telemetry_bus import TelemetryBus, ForwardLog
 
 TEENSY_IP = os.getenv("TEENSY_IP", "192.168.1.100")
 TEENSY_PORT = int(os.getenv("TEENSY_PORT", "8888"))
@@ -31,6 +58,7 @@ FANOUT_RX = [
     ("127.0.0.1", 9004),  # nuevo
     ("127.0.0.1", 9005),  # nuevo
 ]
+UDP_FANOUT = os.getenv("HUB_UDP_FANOUT", "1") != "0"
 CLIENT_TX_PORTS = [9101, 9102, 9103, 9104, 9105]
 
 # Extra port to accept commands via iptables REDIRECT
@@ -38,11 +66,22 @@ REDIRECT_PORT = 9199
 
 # Arbitration settings
 MASTER_TTL = float(os.getenv("HUB_MASTER_TTL", "2.0"))  # seconds
-MODE_FILE = "/tmp/teensy_hub_master"  # manual override
+MODE_FILE = "/tmp/teensy_hub_master"  # manual override (legacy)
+MODE_FILE_INTERVAL = 0.5
+CONTROL_PORT = int(os.getenv("HUB_CONTROL_PORT", "9198"))  # manual override, local only
+
+# Metrics HTTP endpoint, local only
+METRICS_PORT = int(os.getenv("HUB_METRICS_PORT", "9190"))
+# Histogram bucket upper bounds in seconds
+QUEUE_DELAY_BUCKETS = [0.0001, 0.00025, 0.0005, 0.001, 0.002, 0.004, 0.008, 0.016, 0.05, 0.1]
+INTERARRIVAL_BUCKETS = [0.001, 0.002, 0.004, 0.008, 0.012, 0.016, 0.025, 0.05, 0.1, 0.25, 1.0]
+TELEMETRY_IDS = (33, 34)
 
 # Rate limiting
 MAX_CMD_RATE = 250.0  # packets per second
-MIN_CMD_INTERVAL = 1.0 / MAX_CMD_RATE
+CMD_BURST = 2         # packets that may go back to back after an idle period
+
+PRA, PRB = 0xFF, 0xFA
 
 def _udp_bind(ip, port, reuse=True):
     s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
@@ -56,137 +95,463 @@ def _udp_bind(ip, port, reuse=True):
         except OSError:
             pass
     s.bind((ip, port))
+    s.setblocking(False)
     return s
 
-def main():
-    print("[hub] Teensy UDP hub starting...")
-    print(f"[hub] Teensy at {TEENSY_IP}:{TEENSY_PORT}")
-    print(f"[hub] Telemetry fanout -> {', '.join([f'{h}:{p}' for (h,p) in FANOUT_RX])}")
-    print(f"[hub] Accepting client commands on ports {CLIENT_TX_PORTS} and REDIRECT port {REDIRECT_PORT}")
+def _udp_unbound():
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    s.setblocking(False)
+    return s
 
-    # Socket to receive telemetry from Teensy (be exclusive owner of 8888)
-    s_telem_in = _udp_bind("0.0.0.0", TEENSY_PORT, reuse=False)
-    s_telem_in.setblocking(False)
+def packet_key(data):
+    """Capsule packet id of a command, None if it does not look like a capsule."""
+    if len(data) >= 3 and data[0] == PRA and data[1] == PRB:
+        return data[2]
+    return None
 
-    # Socket to send to teensy and to fanout to local
-    s_to_teensy = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    s_fanout = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.last = time.monotonic()
 
-    # Command input sockets
-    cmd_socks = []
-    label_by_sock = {}
-    for i, port in enumerate(CLIENT_TX_PORTS, start=1):
-        s = _udp_bind("127.0.0.1", port, reuse=False)
-        s.setblocking(False)
-        cmd_socks.append(s)
-        label_by_sock[s.fileno()] = f"c{i}"
-    s_redirect = _udp_bind("0.0.0.0", REDIRECT_PORT, reuse=False)
-    s_redirect.setblocking(False)
-    cmd_socks.append(s_redirect)
-    label_by_sock[s_redirect.fileno()] = "redir"
-
-    # Arbitration state
-    master_id = None     # "c1"/"c2"/"c3"/"redir"
-    master_expire = 0.0
-    last_cmd_ts = 0.0
-    manual_mode = False
-    last_mode_check = 0.0
-
-    def current_mode():
-        return "MANUAL" if manual_mode else "AUTO"
-
-    print(f"[hub] Arbitration: {current_mode()} (TTL={MASTER_TTL:.2f}s)")
-
-    while True:
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.last)*self.rate)
+        self.last = now
+
+    def take(self, now):
+        self._refill(now)
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        return False
+
+    def wait_time(self, now):
+        self._refill(now)
+        return max(0.0, (1.0 - self.tokens)/self.rate)
+
+class Histogram:
+    """Cumulative histogram with fixed buckets, Prometheus style."""
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0]*(len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, n in zip(self.buckets + [float("inf")], self.counts):
+            total += n
+            yield bound, total
+
+    def as_dict(self):
+        return {"buckets": {("+Inf" if math.isinf(b) else b): c for b, c in self.cumulative()},
+                "sum": self.sum, "count": self.count}
+
+class Interarrival:
+    """Inter-arrival times of one telemetry packet id, with running mean and jitter (std dev)."""
+    def __init__(self):
+        self.last = None
+        self.histogram = Histogram(INTERARRIVAL_BUCKETS)
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def observe(self, now):
+        if self.last is not None:
+            dt = now - self.last
+            self.histogram.observe(dt)
+            # Welford
+            delta = dt - self.mean
+            self.mean += delta/self.histogram.count
+            self.m2 += delta*(dt - self.mean)
+        self.last = now
+
+    @property
+    def jitter(self):
+        n = self.histogram.count
+        return math.sqrt(self.m2/(n - 1)) if n > 1 else 0.0
+
+class Metrics:
+    CLIENT_COUNTERS = ("received", "forwarded", "arbitration_dropped", "coalesced", "master_changed_dropped", "rate_limited")
+
+    def __init__(self):
+        self.started = time.time()
+        self.clients = {}
+        self.queueDelay = Histogram(QUEUE_DELAY_BUCKETS)
+        self.stalls = 0            # times sending had to wait for a token
+        self.stallSeconds = 0.0    # time commands waited for a token
+        self.forwardErrors = 0
+        self.telemetryPackets = 0
+        self.fanoutSent = {}
+        self.fanoutErrors = {}
+        self.telemetry = {pid: Interarrival() for pid in TELEMETRY_IDS}
+
+    def client(self, label):
+        counters = self.clients.get(label)
+        if counters is None:
+            counters = self.clients[label] = dict.fromkeys(self.CLIENT_COUNTERS, 0)
+        return counters
+
+    def as_dict(self, hub):
+        return {
+            "uptime_s": time.time() - self.started,
+            "mode": hub.current_mode(),
+            "master": hub.master_id,
+            "pending": len(hub.pending),
+            "clients": self.clients,
+            "queue_delay_s": self.queueDelay.as_dict(),
+            "rate_limiter": {"stalls": self.stalls, "stall_seconds": self.stallSeconds},
+            "forward_errors": self.forwardErrors,
+            "telemetry_packets": self.telemetryPackets,
+            "fanout": {f"{h}:{p}": {"sent": self.fanoutSent.get((h, p), 0), "errors": self.fanoutErrors.get((h, p), 0)} for (h, p) in FANOUT_RX},
+            "telemetry": {str(pid): {"interarrival_s": t.histogram.as_dict(), "mean_s": t.mean, "jitter_s": t.jitter}
+                          for pid, t in self.telemetry.items()},
+        }
+
+    def prometheus(self, hub):
+        lines = []
+        def metric(name, kind, helpText, samples):
+            lines.append(f"# HELP teensy_hub_{name} {helpText}")
+            lines.append(f"# TYPE teensy_hub_{name} {kind}")
+            for labels, value in samples:
+                lines.append(f"teensy_hub_{name}{labels} {value}")
+        def histogram(name, helpText, hist, labels=""):
+            samples = [("{" + labels + ("," if labels else "") + f'le="{"+Inf" if math.isinf(b) else b}"' + "}", c) for b, c in hist.cumulative()]
+            lines.append(f"# HELP teensy_hub_{name} {helpText}")
+            lines.append(f"# TYPE teensy_hub_{name} histogram")
+            for labelText, value in samples:
+                lines.append(f"teensy_hub_{name}_bucket{labelText} {value}")
+            suffix = "{" + labels + "}" if labels else ""
+            lines.append(f"teensy_hub_{name}_sum{suffix} {hist.sum}")
+            lines.append(f"teensy_hub_{name}_count{suffix} {hist.count}")
+
+        for counter in self.CLIENT_COUNTERS:
+            metric(f"commands_{counter}_total", "counter", f"Commands {counter.replace('_', ' ')} per client",
+                   [(f'{{client="{label}"}}', c[counter]) for label, c in self.clients.items()])
+        metric("manual_mode", "gauge", "1 in MANUAL arbitration", [("", int(hub.manual_mode))])
+        metric("pending_commands", "gauge", "Commands waiting for a rate limiter token", [("", len(hub.pending))])
+        histogram("queue_delay_seconds", "Time from command receive to send to Teensy", self.queueDelay)
+        metric("rate_limiter_stalls_total", "counter", "Times sending had to wait for a token", [("", self.stalls)])
+        metric("rate_limiter_stall_seconds_total", "counter", "Time commands waited for a token", [("", self.stallSeconds)])
+        metric("forward_errors_total", "counter", "Failed sends to the Teensy", [("", self.forwardErrors)])
+        metric("telemetry_packets_total", "counter", "Telemetry datagrams received from the Teensy", [("", self.telemetryPackets)])
+        metric("fanout_sent_total", "counter", "Telemetry datagrams fanned out", [(f'{{dest="{h}:{p}"}}', self.fanoutSent.get((h, p), 0)) for (h, p) in FANOUT_RX])
+        metric("fanout_errors_total", "counter", "Failed telemetry fan-out sends", [(f'{{dest="{h}:{p}"}}', self.fanoutErrors.get((h, p), 0)) for (h, p) in FANOUT_RX])
+        for pid, t in self.telemetry.items():
+            histogram("telemetry_interarrival_seconds", "Time between telemetry packets", t.histogram, f'id="{pid}"')
+        metric("telemetry_jitter_seconds", "gauge", "Std dev of telemetry inter-arrival time",
+               [(f'{{id="{pid}"}}', t.jitter) for pid, t in self.telemetry.items()])
+        return "\n".join(lines) + "\n"
+
+class Hub:
+    def __init__(self, loop):
+        self.loop = loop
+        self.bucket = TokenBucket(MAX_CMD_RATE, CMD_BURST)
+        # Commands waiting for a token, (label, packet id) -> data, oldest first
+        self.pending = {}
+        self.flushHandle = None
+        # Arbitration state
+        self.master_id = None     # "c1"/"c2"/"c3"/"redir"
+        self.master_expire = 0.0
+        self.manual_mode = False
+        self.manual_source = None  # "control" or "file"
+        self.label_by_port = {}
+        self.port_by_label = {}
+        self.to_teensy = None
+        self.fanout = {}          # (ip, port) -> transport, one per destination
+        self.bus = None
+        self.forwardLog = None
+        self.telemetryCodec = CapsuleCodec()
+        self.metrics = Metrics()
+
+    def current_mode(self):
+        return "MANUAL" if self.manual_mode else "AUTO"
+
+    # --- Telemetry ---
+    def on_telemetry(self, data):
+        metrics = self.metrics
+        metrics.telemetryPackets += 1
+        interarrival = metrics.telemetry.get(packet_key(data))
+        received = time.monotonic()
+        if interarrival is not None:
+            interarrival.observe(received)
+        if self.bus is not None:
+            self.publish(data, received)
+        if not UDP_FANOUT:
+            return
+        for addr in FANOUT_RX:
+            # Send failures come back through SendProtocol.error_received, not as exceptions
+            self.fanout[addr].sendto(data, addr)
+            metrics.fanoutSent[addr] = metrics.fanoutSent.get(addr, 0) + 1
+
+    def fanout_error(self, addr, exc):
+        self.metrics.fanoutErrors[addr] = self.metrics.fanoutErrors.get(addr, 0) + 1
+        print(f"[telem][warn] fanout to {addr[0]}:{addr[1]} failed: {exc}")
+
+    def publish(self, data, received):
+        """Write the angles and omegas of a telemetry datagram to the shared memory bus."""
         now = time.time()
+        for packetId, payload in self.telemetryCodec.decode(data):
+            if packetId == ANGLES.packetId and len(payload) >= ANGLES.size:
+                azm, elv = ANGLES.struct.unpack_from(payload)
+                self.bus.write(packetId, received, now, az=azm, el=elv)
+            elif packetId == OMEGAS.packetId and len(payload) >= OMEGAS.size:
+                wcmd_az, wcmd_el, wmeas_az, wmeas_el = OMEGAS.struct.unpack_from(payload)
+                self.bus.write(packetId, received, now, wcmd_az=wcmd_az, wcmd_el=wcmd_el, wmeas_az=wmeas_az, wmeas_el=wmeas_el)
+
+    # --- Commands ---
+    def accept(self, label):
+        """Arbitration, True when label may command the Teensy."""
+        if self.manual_mode:
+            return label == self.master_id
+        now = time.monotonic()
+        if self.master_id is None or now > self.master_expire:
+            self.master_id = label
+            self.master_expire = now + MASTER_TTL
+            print(f"[arb] master -> {self.master_id} (auto)")
+            return True
+        if label != self.master_id:
+            return False
+        self.master_expire = now + MASTER_TTL
+        return True
+
+    def on_command(self, label, data):
+        counters = self.metrics.client(label)
+        counters["received"] += 1
+        if not self.accept(label):
+            counters["arbitration_dropped"] += 1
+            return
+        now = time.monotonic()
+        key = (label, packet_key(data))
+        if not self.pending and self.bucket.take(now):
+            self.forward(label, counters, data, now)
+            return
+        # Latest wins, a newer command replaces the one still waiting
+        counters["rate_limited"] += 1
+        if self.pending.pop(key, None) is not None:
+            counters["coalesced"] += 1
+        self.pending[key] = (now, data)
+        self.schedule_flush()
+
+    def forward(self, label, counters, data, received):
+        # Send failures come back through SendProtocol.error_received (forward_error)
+        self.to_teensy.sendto(data, (TEENSY_IP, TEENSY_PORT))
+        sent = time.monotonic()
+        counters["forwarded"] += 1
+        self.metrics.queueDelay.observe(sent - received)
+        if self.forwardLog is not None:
+            self.forwardLog.write(received, sent, packet_key(data) or 0, self.port_by_label.get(label, 0))
 
-        # Manual mode file check
-        if now - last_mode_check > 0.5:
-            last_mode_check = now
+    def forward_error(self, exc):
+        self.metrics.forwardErrors += 1
+        print(f"[cmd][err] forward to Teensy failed: {exc}")
+
+    def schedule_flush(self):
+        if self.flushHandle is None and self.pending:
+            delay = self.bucket.wait_time(time.monotonic())
+            self.metrics.stalls += 1
+            self.flushHandle = self.loop.call_later(delay, self.flush)
+
+    def flush(self):
+        self.flushHandle = None
+        now = time.monotonic()
+        while self.pending and self.bucket.take(now):
+            key = next(iter(self.pending))
+            label, _ = key
+            received, data = self.pending.pop(key)
+            self.metrics.stallSeconds += now - received
+            counters = self.metrics.client(label)
+            # The master may have changed while the command was waiting
+            if self.manual_mode and label != self.master_id:
+                counters["master_changed_dropped"] += 1
+                continue
+            self.forward(label, counters, data, received)
+        self.schedule_flush()
+
+    # --- Manual arbitration ---
+    def set_manual(self, val, source):
+        label = None
+        if val in ("c1", "c2", "c3", "c4", "c5", "redir"):
+            label = val
+        else:
+            # maybe it's a port
+            try:
+                label = self.label_by_port.get(int(val))
+            except ValueError:
+                pass
+        if label is None:
+            print(f"[arb] unknown master {val!r}, ignored")
+            return False
+        if not self.manual_mode:
+            print("[arb] MANUAL mode enabled")
+        self.manual_mode = True
+        self.manual_source = source
+        self.master_id = label
+        self.master_expire = float("inf")
+        print(f"[arb] MANUAL master -> {self.master_id}")
+        return True
+
+    def set_auto(self):
+        if self.manual_mode:
+            print("[arb] Manual mode cleared; back to AUTO")
+        self.manual_mode = False
+        self.manual_source = None
+        self.master_id = None
+        self.master_expire = 0.0
+
+    def status(self):
+        return f"{self.current_mode()} master={self.master_id} pending={len(self.pending)}"
+
+    def on_control(self, text):
+        text = text.strip()
+        if text == "status" or not text:
+            return self.status()
+        if text == "auto":
+            self.set_auto()
+        else:
+            self.set_manual(text, "control")
+        return self.status()
+
+    async def watch_mode_file(self):
+        """Legacy manual override through MODE_FILE, polled off the packet path."""
+        last = None
+        while True:
             try:
+                val = None
                 if os.path.exists(MODE_FILE):
                     with open(MODE_FILE, "r") as f:
-                        val = f.read().strip()
+                        val = f.read().strip() or None
+                if val != last:
                     if val:
-                        if not manual_mode:
-                            print("[arb] MANUAL mode enabled")
-                        manual_mode = True
-                        if val in ("c1", "c2", "c3", "redir"):
-                            master_id = val
-                        else:
-                            # maybe it's a port
-                            try:
-                                port = int(val)
-                                for s in cmd_socks:
-                                    if s.getsockname()[1] == port:
-                                        master_id = label_by_sock[s.fileno()]
-                                        break
-                            except ValueError:
-                                pass
-                        master_expire = float("inf")
-                        print(f"[arb] MANUAL master -> {master_id}")
-                else:
-                    if manual_mode:
-                        print("[arb] Manual mode cleared; back to AUTO")
-                    manual_mode = False
-                    master_id = None
-                    master_expire = 0.0
+                        self.set_manual(val, "file")
+                    elif self.manual_source == "file":
+                        self.set_auto()
+                    last = val
             except Exception as e:
                 print(f"[hub][warn] mode file error: {e}")
+            await asyncio.sleep(MODE_FILE_INTERVAL)
+
+class SendProtocol(asyncio.DatagramProtocol):
+    """
+    Outgoing endpoint. An asyncio datagram transport does not raise from
+    sendto(), it passes the OSError to error_received, so that is where
+    send failures are counted.
+    """
+    def __init__(self, on_error):
+        self.on_error = on_error
+
+    def error_received(self, exc):
+        self.on_error(exc)
+
+class TelemetryProtocol(asyncio.DatagramProtocol):
+    def __init__(self, hub):
+        self.hub = hub
+
+    def datagram_received(self, data, addr):
+        self.hub.on_telemetry(data)
+
+class CommandProtocol(asyncio.DatagramProtocol):
+    def __init__(self, hub, label):
+        self.hub = hub
+        self.label = label
+
+    def datagram_received(self, data, addr):
+        self.hub.on_command(self.label, data)
+
+async def serve_metrics(hub, reader, writer):
+    """Minimal HTTP/1.0 handler: GET /metrics (Prometheus text) or /metrics.json."""
+    try:
+        request = await asyncio.wait_for(reader.readline(), 2.0)
+        while (await asyncio.wait_for(reader.readline(), 2.0)) not in (b"\r\n", b"\n", b""):
+            pass
+        parts = request.decode("latin-1").split()
+        path = parts[1] if len(parts) > 1 else "/"
+        if path.startswith("/metrics.json"):
+            status, ctype, body = "200 OK", "application/json", json.dumps(hub.metrics.as_dict(hub))
+        elif path.startswith("/metrics"):
+            status, ctype, body = "200 OK", "text/plain; version=0.0.4", hub.metrics.prometheus(hub)
+        else:
+            status, ctype, body = "404 Not Found", "text/plain", "try /metrics or /metrics.json\n"
+        body = body.encode()
+        writer.write(f"HTTP/1.0 {status}\r\nContent-Type: {ctype}\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+class ControlProtocol(asyncio.DatagramProtocol):
+    def __init__(self, hub):
+        self.hub = hub
+
+    def connection_made(self, transport):
+        self.transport = transport
 
-        # Poll sockets
-        rlist = [s_telem_in] + cmd_socks
-        readable, _, _ = select.select(rlist, [], [], 0.1)
-
-        for s in readable:
-            if s is s_telem_in:
-                # Telemetry from Teensy -> fan out
-                try:
-                    data, addr = s.recvfrom(65535)
-                except BlockingIOError:
-                    continue
-                for (h, p) in FANOUT_RX:
-                    try:
-                        s_fanout.sendto(data, (h, p))
-                    except Exception as e:
-                        print(f"[telem][warn] fanout to {h}:{p} failed: {e}")
-            else:
-                # Command from a client
-                try:
-                    data, addr = s.recvfrom(65535)
-                except BlockingIOError:
-                    continue
-
-                sender_label = label_by_sock.get(s.fileno(), "unknown")
-
-                # Arbitration
-                if manual_mode:
-                    if sender_label != master_id:
-                        continue
-                else:
-                    if master_id is None or time.time() > master_expire:
-                        master_id = sender_label
-                        master_expire = time.time() + MASTER_TTL
-                        print(f"[arb] master -> {master_id} (auto)")
-                    elif sender_label != master_id:
-                        continue
-                    else:
-                        master_expire = time.time() + MASTER_TTL
-
-                # Rate limit
-                now_ts = time.time()
-                if now_ts - last_cmd_ts < MIN_CMD_INTERVAL:
-                    time.sleep(max(0.0, MIN_CMD_INTERVAL - (now_ts - last_cmd_ts)))
-                last_cmd_ts = time.time()
-
-                # Forward to Teensy
-                try:
-                    s_to_teensy.sendto(data, (TEENSY_IP, TEENSY_PORT))
-                except Exception as e:
-                    print(f"[cmd][err] forward to Teensy failed: {e}")
+    def datagram_received(self, data, addr):
+        reply = self.hub.on_control(data.decode("utf-8", "replace"))
+        self.transport.sendto((reply + "\n").encode(), addr)
+
+async def run():
+    print("[hub] Teensy UDP hub starting...")
+    print(f"[hub] Teensy at {TEENSY_IP}:{TEENSY_PORT}")
+    if UDP_FANOUT:
+        print(f"[hub] Telemetry fanout -> {', '.join([f'{h}:{p}' for (h,p) in FANOUT_RX])}")
+    print(f"[hub] Accepting client commands on ports {CLIENT_TX_PORTS} and REDIRECT port {REDIRECT_PORT}")
+    print(f"[hub] Control port 127.0.0.1:{CONTROL_PORT}")
+    print(f"[hub] Metrics on http://127.0.0.1:{METRICS_PORT}/metrics")
+
+    loop = asyncio.get_running_loop()
+    hub = Hub(loop)
+    hub.bus = TelemetryBus.create()
+    hub.forwardLog = ForwardLog.create()
+    print(f"[hub] Telemetry bus /dev/shm/{hub.bus.shm.name} ({hub.bus.capacity} samples)")
+    try:
+        await serve(hub)
+    finally:
+        hub.bus.close()
+        hub.forwardLog.close()
+
+async def serve(hub):
+    loop = hub.loop
+
+    # Socket to send to teensy and to fanout to local
+    hub.to_teensy, _ = await loop.create_datagram_endpoint(lambda: SendProtocol(hub.forward_error), sock=_udp_unbound())
+    for addr in FANOUT_RX:
+        hub.fanout[addr], _ = await loop.create_datagram_endpoint(
+            lambda addr=addr: SendProtocol(lambda exc: hub.fanout_error(addr, exc)), sock=_udp_unbound())
+
+    # Socket to receive telemetry from Teensy (be exclusive owner of 8888)
+    await loop.create_datagram_endpoint(lambda: TelemetryProtocol(hub), sock=_udp_bind("0.0.0.0", TEENSY_PORT, reuse=False))
+
+    # Command input sockets
+    for i, port in enumerate(CLIENT_TX_PORTS, start=1):
+        label = f"c{i}"
+        hub.label_by_port[port] = label
+        hub.port_by_label[label] = port
+        await loop.create_datagram_endpoint(lambda label=label: CommandProtocol(hub, label), sock=_udp_bind("127.0.0.1", port, reuse=False))
+    hub.label_by_port[REDIRECT_PORT] = "redir"
+    hub.port_by_label["redir"] = REDIRECT_PORT
+    await loop.create_datagram_endpoint(lambda: CommandProtocol(hub, "redir"), sock=_udp_bind("0.0.0.0", REDIRECT_PORT, reuse=False))
+
+    await loop.create_datagram_endpoint(lambda: ControlProtocol(hub), sock=_udp_bind("127.0.0.1", CONTROL_PORT, reuse=False))
+    await asyncio.start_server(lambda reader, writer: serve_metrics(hub, reader, writer), "127.0.0.1", METRICS_PORT)
+
+    print(f"[hub] Arbitration: {hub.current_mode()} (TTL={MASTER_TTL:.2f}s)")
+    await hub.watch_mode_file()
+
+def main():
+    # systemd / kill stop the hub with SIGTERM, exit through the finally of run() so the bus is removed
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    asyncio.run(run())
 
 if __name__ == "__main__":
     try:
         main()
     except KeyboardInterrupt:
-        print("\\n[hub] bye!")
+        print("\n[hub] bye!")
@@ -0,0 +1,287 @@
+import time
+import numpy as np
+from multiprocessing import shared_memory, resource_tracker
+
+# Shared memory telemetry written by teensy_hub.py, one sample per telemetry
+# packet (33 angles, 34 omegas) with the last known value of the other fields.
+# Any local process can read the latest pose or a window of history without a
+# socket: attach once with open_telemetry_reader() and read the ring directly.
+# The hub also logs the commands it forwards to the Teensy (ForwardLog).
+TELEMETRY_BUS_NAME = "teensy_telemetry"
+TELEMETRY_BUS_CAPACITY = 4096   # ~16 s at 250 samples/s
+TELEMETRY_BUS_MAGIC = 0x54454C4D  # "TELM"
+TELEMETRY_BUS_VERSION = 1
+
+# flags
+SAMPLE_ANGLES = 1   # az/el updated by this sample (packet 33)
+SAMPLE_OMEGAS = 2   # wcmd/wmeas updated by this sample (packet 34)
+
+SAMPLE_DTYPE = np.dtype([
+    ("seq", np.uint64),       # seqlock, odd while the slot is being written
+    ("t_mono", np.float64),   # CLOCK_MONOTONIC seconds at reception in the hub, same clock in every process
+    ("t_wall", np.float64),   # time.time() at reception
+    ("az", np.float64),
+    ("el", np.float64),
+    ("wcmd_az", np.float64),
+    ("wcmd_el", np.float64),
+    ("wmeas_az", np.float64),
+    ("wmeas_el", np.float64),
+    ("flags", np.uint32),
+    ("packetId", np.uint32),
+])
+
+# Commands forwarded by the hub (received and sent in CLOCK_MONOTONIC seconds)
+FORWARD_LOG_NAME = "teensy_hub_forwards"
+FORWARD_LOG_CAPACITY = 4096
+FORWARD_LOG_MAGIC = 0x46575244  # "FWRD"
+
+FORWARD_DTYPE = np.dtype([
+    ("seq", np.uint64),
+    ("received", np.float64),
+    ("sent", np.float64),
+    ("packetId", np.uint32),
+    ("port", np.uint32),      # hub port the command came in on
+])
+
+# magic, version, capacity, count (records written so far)
+HEADER_DTYPE = np.dtype(np.uint64)
+HEADER_FIELDS = 4
+HEADER_SIZE = 64
+
+
+def _attach(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Before Python 3.13 an attached segment is registered with the resource
+        # tracker, which would unlink it when this process exits
+        shm = shared_memory.SharedMemory(name=name)
+        _untrack(shm)
+        return shm
+
+def _untrack(shm):
+    # The hub owns the segment and unlinks it itself, the resource tracker must
+    # not (it would also complain when a reader in the same process detaches)
+    try:
+        resource_tracker.unregister(shm._name, "shared_memory")
+    except Exception:
+        pass
+
+def _mark_closed(shm):
+    if shm.size >= HEADER_SIZE:
+        np.ndarray((HEADER_FIELDS,), dtype=HEADER_DTYPE, buffer=shm.buf)[1] = 0
+
+def _unlink(shm):
+    # unlink() unregisters from the resource tracker, register first to keep it balanced
+    if getattr(shm, "_track", True):
+        try:
+            resource_tracker.register(shm._name, "shared_memory")
+        except Exception:
+            pass
+    shm.unlink()
+
+
+class SharedRing:
+    """
+    Ring of dtype records in shared memory with one writer (the hub) and any
+    number of readers. Each slot carries its own sequence number: the writer
+    makes it odd, writes the fields, then sets it to 2*index + 2, so a reader
+    that sees the same even value before and after copying a slot knows the copy
+    is consistent and is the record it asked for. Subclasses set dtype (first
+    field "seq"), magic, defaultName, defaultCapacity and timeField.
+    """
+    dtype = None
+    magic = None
+    version = TELEMETRY_BUS_VERSION
+    defaultName = None
+    defaultCapacity = TELEMETRY_BUS_CAPACITY
+    timeField = "t_mono"
+
+    def __init__(self, shm, owner):
+        self.shm = shm
+        self.owner = owner
+        self.header = np.ndarray((HEADER_FIELDS,), dtype=HEADER_DTYPE, buffer=shm.buf)
+        if owner:
+            self.header[:] = (self.magic, self.version, 0, 0)
+        elif self.header[0] != self.magic or self.header[1] != self.version:
+            raise ValueError(f"Not a {type(self).__name__} segment (or another version)")
+        self.capacity = int(self.header[2]) if not owner else (shm.size - HEADER_SIZE) // self.dtype.itemsize
+        self.records = np.ndarray((self.capacity,), dtype=self.dtype, buffer=shm.buf, offset=HEADER_SIZE)
+        if owner:
+            self.records[:] = np.zeros(1, dtype=self.dtype)
+            self.header[2] = self.capacity
+
+    @classmethod
+    def create(cls, name=None, capacity=None):
+        name = name or cls.defaultName
+        size = HEADER_SIZE + (capacity or cls.defaultCapacity)*cls.dtype.itemsize
+        try:
+            # Left over by a previous hub that did not exit cleanly, readers
+            # still mapping it see it closed and attach to the new one
+            stale = _attach(name)
+            _mark_closed(stale)
+            stale.close()
+            _unlink(stale)
+        except FileNotFoundError:
+            pass
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        _untrack(shm)
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name=None):
+        return cls(_attach(name or cls.defaultName), owner=False)
+
+    def close(self):
+        if self.owner:
+            self.header[1] = 0
+        self.header = None
+        self.records = None
+        self.shm.close()
+        if self.owner:
+            _unlink(self.shm)
+
+    @property
+    def closed(self):
+        """True once the hub closed this segment (it exited, or was restarted with a new one)."""
+        return self.header is None or self.header[1] != self.version
+
+    def reopen(self, name=None):
+        """Attach again to the current segment of the hub, False while there is none."""
+        try:
+            ring = type(self)(_attach(name or self.shm.name), owner=False)
+        except (FileNotFoundError, ValueError):
+            return False
+        self.header, self.records = None, None
+        self.shm.close()
+        self.shm, self.header, self.records, self.capacity = ring.shm, ring.header, ring.records, ring.capacity
+        return True
+
+    @property
+    def count(self):
+        return int(self.header[3])
+
+    # --- Writer ---
+    def _append(self, **values):
+        n = int(self.header[3])
+        slot = self.records[n % self.capacity]
+        slot["seq"] = 2*n + 1
+        for field, value in values.items():
+            slot[field] = value
+        slot["seq"] = 2*n + 2
+        self.header[3] = n + 1
+
+    # --- Readers ---
+    def read(self, n, retries=3):
+        """Record number n, or None once it was overwritten."""
+        slot = self.records[n % self.capacity]
+        for _ in range(retries):
+            before = slot["seq"]
+            record = slot.copy()
+            if before == 2*n + 2 and slot["seq"] == before:
+                return record
+            if before > 2*n + 2:
+                return None
+        return None
+
+    def latest(self):
+        """Most recent record, None if nothing was written yet."""
+        for _ in range(3):
+            n = self.count
+            if n == 0:
+                return None
+            record = self.read(n - 1)
+            if record is not None:
+                return record
+        return None
+
+    def window(self, seconds=None, count=None):
+        """Copy of the last records (by age in seconds or by count), oldest first."""
+        n = self.count
+        first = max(0, n - self.capacity + 1, n - count if count is not None else 0)
+        index = np.arange(first, n)
+        records = self.records[index % self.capacity].copy()
+        # Drop slots rewritten while copying
+        valid = records["seq"] == 2*index.astype(np.uint64) + 2
+        valid &= self.records["seq"][index % self.capacity] == records["seq"]
+        records = records[valid]
+        if seconds is not None and len(records):
+            records = records[records[self.timeField] >= time.monotonic() - seconds]
+        return records
+
+    def follow(self, poll=0.002, start=None):
+        """
+        Yield every new record as it is written, sleeping poll seconds when idle.
+        Keeps following across hub restarts.
+        """
+        n = self.count if start is None else start
+        while True:
+            if self.closed:
+                n = 0
+                while not self.reopen():
+                    time.sleep(0.5)
+            current = self.count
+            if current - n > self.capacity:
+                # Fell behind by more than the ring, skip to what is still there
+                n = current - self.capacity + 1
+            while n < current:
+                record = self.read(n)
+                n += 1
+                if record is not None:
+                    yield record
+            time.sleep(poll)
+
+
+class TelemetryBus(SharedRing):
+    """Telemetry samples (SAMPLE_DTYPE) written by the hub, see the top of the file."""
+    dtype = SAMPLE_DTYPE
+    magic = TELEMETRY_BUS_MAGIC
+    defaultName = TELEMETRY_BUS_NAME
+    defaultCapacity = TELEMETRY_BUS_CAPACITY
+
+    def __init__(self, shm, owner):
+        super().__init__(shm, owner)
+        # Last values, so every sample carries the full state (writer only)
+        self.state = {"az": np.nan, "el": np.nan, "wcmd_az": np.nan, "wcmd_el": np.nan, "wmeas_az": np.nan, "wmeas_el": np.nan}
+
+    def write(self, packetId, t_mono=None, t_wall=None, **values):
+        self.state.update(values)
+        flags = 0
+        if "az" in values or "el" in values:
+            flags |= SAMPLE_ANGLES
+        if "wcmd_az" in values or "wmeas_az" in values:
+            flags |= SAMPLE_OMEGAS
+        self._append(t_mono=time.monotonic() if t_mono is None else t_mono,
+                     t_wall=time.time() if t_wall is None else t_wall,
+                     flags=flags, packetId=packetId, **self.state)
+
+
+class ForwardLog(SharedRing):
+    """
+    One record per command the hub sent to the Teensy, with the monotonic
+    times it was received and sent, so a client can find when its own command
+    actually left (see latency_trace.py).
+    """
+    dtype = FORWARD_DTYPE
+    magic = FORWARD_LOG_MAGIC
+    defaultName = FORWARD_LOG_NAME
+    defaultCapacity = FORWARD_LOG_CAPACITY
+    timeField = "sent"
+
+    def write(self, received, sent, packetId, port):
+        self._append(received=received, sent=sent, packetId=packetId, port=port)
+
+
+def open_telemetry_reader(name=TELEMETRY_BUS_NAME):
+    """Attach to the hub's telemetry bus, None if the hub is not running."""
+    try:
+        return TelemetryBus.attach(name)
+    except (FileNotFoundError, ValueError):
+        return None
+
+def open_forward_log(name=FORWARD_LOG_NAME):
+    """Attach to the hub's log of forwarded commands, None if the hub is not running."""
+    try:
+        return ForwardLog.attach(name)
+    except (FileNotFoundError, ValueError):
+        return None
@@ -0,0 +1,107 @@
+import threading
+import numpy as np
+
+# Keep ~10 s of mount pose at the Teensy telemetry rate (250 Hz)
+HISTORY_SECONDS = 10.0
+HISTORY_RATE = 250
+
+def wrap180(angle):
+    """Angle difference folded to [-180, 180)."""
+    return (angle + 180.0) % 360.0 - 180.0
+
+class PoseHistory:
+    """
+    Last samples of the mount pose (t, az, el) in a fixed size NumPy ring, to
+    ask where the mount was at a given time (e.g. when a frame was exposed).
+
+    Every sample is written twice, at i and i + capacity, so the valid samples
+    are always one contiguous and sorted slice and pose_at() is a searchsorted
+    (O(log n)) plus a linear interpolation. t can be any clock (seconds), but
+    add() and pose_at() must use the same one, and samples must come in time
+    order (older ones are dropped).
+
+    Azimuth is interpolated across the 359 -> 0 wrap, the result keeps the
+    convention of the nearest sample (so 359.9 -> 0.1 gives 359.95 or 0.05,
+    whichever side t is on).
+    """
+    def __init__(self, seconds=HISTORY_SECONDS, rate=HISTORY_RATE):
+        self.capacity = max(2, int(seconds*rate))
+        self.t = np.zeros(2*self.capacity)
+        self.az = np.zeros(2*self.capacity)
+        self.el = np.zeros(2*self.capacity)
+        self.written = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return min(self.written, self.capacity)
+
+    def add(self, t, az, el):
+        with self.lock:
+            if self.written and t < self.t[(self.written - 1) % self.capacity]:
+                return False
+            i = self.written % self.capacity
+            j = i + self.capacity
+            self.t[i] = self.t[j] = t
+            self.az[i] = self.az[j] = az
+            self.el[i] = self.el[j] = el
+            self.written += 1
+            return True
+
+    def _window(self):
+        count = min(self.written, self.capacity)
+        start = (self.written - count) % self.capacity
+        return slice(start, start + count)
+
+    def latest(self):
+        """(t, az, el) of the newest sample, None while empty."""
+        with self.lock:
+            if not self.written:
+                return None
+            i = (self.written - 1) % self.capacity
+            return float(self.t[i]), float(self.az[i]), float(self.el[i])
+
+    def span(self):
+        """(oldest, newest) sample time, None while empty."""
+        with self.lock:
+            if not self.written:
+                return None
+            window = self._window()
+            return float(self.t[window.start]), float(self.t[window.stop - 1])
+
+    def pose_at(self, t, maxHold=0.1):
+        """
+        (az, el) interpolated at time t, None if t is older than the history
+        or more than maxHold seconds newer than the last sample (between the
+        last sample and maxHold the last pose is returned).
+        t may also be an array, then az and el are arrays with NaN where
+        there is no pose.
+        """
+        query = np.asarray(t, dtype=np.float64)
+        with self.lock:
+            if not self.written:
+                return None if np.ndim(t) == 0 else (np.full(query.shape, np.nan), np.full(query.shape, np.nan))
+            window = self._window()
+            ts = self.t[window]
+            if len(ts) > 1:
+                right = np.clip(np.searchsorted(ts, query, side="right"), 1, len(ts) - 1)
+            else:
+                right = np.zeros(query.shape, dtype=np.intp)
+            left = np.maximum(right - 1, 0)
+            first, last = ts[0], ts[-1]
+            tLeft, tRight = ts[left], ts[right]
+            azLeft, azRight = self.az[window][left], self.az[window][right]
+            elLeft, elRight = self.el[window][left], self.el[window][right]
+
+        dt = tRight - tLeft
+        frac = np.clip(np.divide(query - tLeft, dt, out=np.zeros(query.shape), where=dt > 0), 0.0, 1.0)
+        # Relative to the nearest sample, so an exact sample time returns it unchanged
+        delta = wrap180(azRight - azLeft)
+        azOut = np.where(frac <= 0.5, azLeft + frac*delta, azRight - (1.0 - frac)*delta)
+        elOut = elLeft + frac*(elRight - elLeft)
+
+        valid = (query >= first) & (query <= last + maxHold)
+        if np.ndim(t) == 0:
+            if not valid:
+                return None
+            return float(azOut), float(elOut)
+        return np.where(valid, azOut, np.nan), np.where(valid, elOut, np.nan)
@@ -1,11 +1,13 @@
 #!/usr/bin/env python3
-import argparse, struct, socket, threading, time, math, sys
+import argparse, socket, threading, time, math, sys
 from communication import (
     capsule_instance, sock, TEENSY_IP, TEENSY_PORT, UDP_PORT,
     sendTargetToTeensy, LightPoint,
     newPacketReceived, newPacketReceivedType, returnLastPacketData
 )
 from communication import sendAbsPosToTeensy
+from packets import SETTINGS
+from telemetry_bus import open_telemetry_reader
 import communication as comm
 comm.UDP_IP_TRACKER = '127.0.0.1'
 comm.UDP_PORT = 9103
@@ -13,14 +15,21 @@ comm.UDP_PORT = 9103
 _current = {"az": None, "el": None}
 
 def _listen_capsules(bind_ip="0.0.0.0", port=UDP_PORT):
+    bus = open_telemetry_reader()
+    if bus is not None:
+        # Hub corriendo: az/el del bus en memoria compartida, mismo estado que communication
+        for sample in bus.follow():
+            if sample["packetId"] == 33:
+                comm.trackerAzm, comm.trackerElv = float(sample["az"]), float(sample["el"])
+                comm.newDataFromTrackerReceived = True
+        return
     s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     s.bind((bind_ip, port))
     s.settimeout(0.5)
     while True:
         try:
             data, _ = s.recvfrom(4096)
-            for b in data:
-                capsule_instance.decode(b)  # communication actualiza estados internos
+            capsule_instance.decode(data)  # communication actualiza estados internos
         except socket.timeout:
             pass
         except Exception:
@@ -45,9 +54,7 @@ def send_enable(on, idRadius=25, lockRadius=100, lightLifetime=200, lightThresho
     vals = (int(idRadius), int(lockRadius), int(lightLifetime),
             int(lightThreshold), int(gain), int(exposureTime),
             1 if on else 0)
-    payload = struct.pack("<iiiiiii", *vals)
-    pkt = bytearray(capsule_instance.encode(0x10, payload, len(payload)))
-    sock.sendto(pkt, (TEENSY_IP, TEENSY_PORT))
+    SETTINGS.sendto(sock, (TEENSY_IP, TEENSY_PORT), *vals)
     print(f"[OK] ENABLE {'ON' if on else 'OFF'} settings={vals}")
 
 def send_rel(dx, dy, kp=5.0, maxSpeed=50.0, cameraID=33, name="EXT", age=0):